@@ -56,7 +56,12 @@ The code is meant to work as follows:
 """
 
 # ----- imports -----
+import concurrent.futures
+import os
+import queue
 import sys
+import threading
+import time
 # add the path where 'gcode-parser.py' is
 # TODO make this hack a bit more like it should (i.e., check Blender guidelines)
 sys.path.append("/home/douwe/.blender/2.62/scripts/addons/blender_gcode_reader")
@@ -69,8 +74,80 @@ try:
 except KeyError:
     # the module is not loaded yet, we can ignore the KeyError and import directly
     from . import Gcode_parser
+from . import Gcode_analysis
 
 import bpy
+import mathutils
+
+
+# ----- functions -----
+def create_bezier_curve_from_geometry(geometry, blCurve=None):
+    """Generate (or extend) a Blender bezier curve from a 'LayerGeometry' instance.
+    
+    geometry    :   a 'Gcode_parser.LayerGeometry' instance, with the spline points of a layer
+    blCurve     :   if provided, the splines are added to this existing curve.
+                    Otherwise, a new curve is created.
+    
+    return      :   the Blender curve
+    """
+    if blCurve is None:
+        # Each Bezier curve will be named after its Z-value. 
+        # Example: 'bezierCurve_Z0.23'  tells that it's the curve with Z-value = 0.23
+        blCurveName = "curve_Z{0}".format(geometry.name)
+    
+        blCurve = bpy.data.curves.new(blCurveName, 'CURVE')                         # Add new curve data
+        blCurve.dimensions = '2D'                                                   # no need to control the Z value, otherwise use '3D'
+    
+    # In Blender, a curve can have multiple splines. We will fill the curve
+    # with multiple splines, all added to one BezierCurve.
+    # We use the 'BEZIER' type, and will set the handle type to 'VECTOR'. This 
+    # gives sharp corners, but also allows to later incorporate 'arc' functions
+    # if required. Also, we can manually correct our model after import.
+    materialIndices = geometry.materialIndices
+    if materialIndices is not None and len(blCurve.materials) == 0:
+        for material in get_flow_materials():
+            blCurve.materials.append(material)
+
+    for splineNr, splineCoordinates in enumerate(geometry.iter_splines()):
+        blSpline = blCurve.splines.new('BEZIER')                                # add a new spline to the curve.
+        if materialIndices is not None:
+            blSpline.material_index = materialIndices[splineNr]
+
+        # For each spline, first create the amount of points that are needed.
+        # Note: when a spline is created, it has one bezier_point already
+        bezPts = blSpline.bezier_points
+        bezPts.add(len(splineCoordinates) // 3 - 1)
+        bezPts.foreach_set("co", splineCoordinates)                             # X, Y, Z of all points at once
+
+        # Change the handle type to 'VECTOR' for every point.
+        for pt in bezPts:
+            pt.handle_left_type = 'VECTOR'
+            pt.handle_right_type = 'VECTOR'
+
+    return blCurve
+
+
+def get_flow_materials():
+    """Returns the materials to color curves by volumetric flow; creates them if needed.
+    
+    Material n is used for flow bin n (see 'Gcode_analysis.get_flow_bin'):
+    from blue (no flow) to red (the maximum flow), and magenta for the 
+    moves above the maximum flow.
+    """
+    materials = []
+    binCount = Gcode_analysis.flowBinCount
+    for binNr in range(binCount + 1):
+        name = "gcode_flow_{0}".format(binNr)
+        material = bpy.data.materials.get(name)
+        if material is None:
+            material = bpy.data.materials.new(name)
+            if binNr == binCount:
+                material.diffuse_color = (1.0, 0.0, 1.0)
+            else:
+                fraction = binNr / (binCount - 1)
+                material.diffuse_color = (fraction, 1.0 - abs(2.0 * fraction - 1.0), 1.0 - fraction)
+        materials.append(material)
+    return materials
 
 
 # ----- class definitions -----
@@ -124,43 +201,7 @@ class gcodeCurve:
         
         (Recall that all commands in a gcodeCurve have identical 'Z' values)
         """
-        
-        # create a list of points for the first spline.
-        lastSplinePoint = self.standardGcode[0]                                 
-        self.splines.append([lastSplinePoint])
-        
-        for indexNr in range(1, len(self.standardGcode)):
-            currSplinePoint = self.standardGcode[indexNr]
-#            print("CURR SPLINE POINT: ", str(currSplinePoint))
-#            print("LAST SPLINE POINT: ", str(lastSplinePoint))
-            
-            delta = (currSplinePoint.X - lastSplinePoint.X, 
-                     currSplinePoint.Y - lastSplinePoint.Y,
-                     currSplinePoint.Z - lastSplinePoint.Z,
-                     currSplinePoint.E - lastSplinePoint.E,
-                     currSplinePoint.F - lastSplinePoint.F)
-            
-            if delta[0] != 0.0 or delta[1] != 0.0:                              # X and/or Y coordinates differ --> movement
-                if delta[3] > 0.0:                                              # E-value changed: plastic is extruded
-                    self.splines[-1].append(currSplinePoint)                    # take the last spline we're working on, and append to it
-                    lastSplinePoint = currSplinePoint
-                elif delta[3] <= 0.0:                                           # E-value is not changed, or plastic is retracted
-                    self.splines.append([currSplinePoint])                      # add a new spline, with this point as first point
-                    lastSplinePoint = currSplinePoint
-            else:
-                # no movement in X and Y directions. We don't care what happens for now
-                # might become useful later, when dE- or dF-value information is used
-                pass
-
-        # For drawing stuff, we are only interested in splines with 2 or more standardGcode.
-        # Hence, remove all the splines with length of 1, i.e. that contain only one command        
-        tempSplines = list()
-        for indexNr in range(len(self.splines)):
-
-            if len(self.splines[indexNr]) >= 2:
-                tempSplines.append(self.splines[indexNr])
-
-        self.splines = tempSplines[:]
+        self.splines = Gcode_parser.split_splines(self.standardGcode)
 
 
     def count_splines(self):
@@ -173,7 +214,23 @@ class gcodeCurve:
         return len(self.splines[indexNr])        
 
 
-    def create_bezier_curve(self):
+    def get_layer_geometry(self, simplifyTolerance=0.0, maxFlow=None):
+        """Returns the splines data as a 'Gcode_parser.LayerGeometry' instance.
+        
+        If 'simplifyTolerance' is larger than 0.0, the splines are simplified
+        with this tolerance (mm) before they are returned. If 'maxFlow' is 
+        given, the splines are colored by their volumetric flow.
+        """
+        if maxFlow is None:
+            geometry = Gcode_parser.LayerGeometry.from_splines(self.name, self.splines)
+        else:
+            geometry = Gcode_parser.LayerGeometry.from_commands(self.name, self.standardGcode, maxFlow)
+        if simplifyTolerance > 0.0:
+            geometry.simplify(simplifyTolerance)
+        return geometry
+
+
+    def create_bezier_curve(self, simplifyTolerance=0.0):
         """generate a Blender bezier curve from the splines data of a gcodeCurve instance.
         
         Note: in the 'blender-gcode-addon' code by xtremd, a manual correction of the
@@ -187,35 +244,7 @@ class gcodeCurve:
             time increases significantly. 
         """
         
-        # Each Bezier curve will be named after its Z-value. 
-        # Example: 'bezierCurve_Z0.23'  tells that it's the curve with Z-value = 0.23
-        blCurveName = "curve_Z{0}".format(self.name)
-    
-        blCurve = bpy.data.curves.new(blCurveName, 'CURVE')                         # Add new curve data
-        blCurve.dimensions = '2D'                                                   # no need to control the Z value, otherwise use '3D'
-        
-        # In Blender, a curve can have multiple splines. We will fill the curve
-        # with multiple splines, all added to one BezierCurve.
-        # We use the 'BEZIER' type, and will set the handle type to 'VECTOR'. This 
-        # gives sharp corners, but also allows to later incorporate 'arc' functions
-        # if required. Also, we can manually correct our model after import.
-    
-        for indexNr in range(len(self.splines)):
-            blSpline = blCurve.splines.new('BEZIER')                                # add a new spline to the curve.
-    
-            # For each spline, first create the amount of points that are needed.
-            gcodePts = self.count_spline_length(indexNr)
-            blSpline.bezier_points.add(gcodePts-1)                                  # Note: when a spline is created, it has one bezier_point already
-            
-            # Loop over the created bezier_points of the spline and fill with data
-            # Also, chenge the handle type to 'VECTOR' for every point.
-            bezPts = blSpline.bezier_points
-            for pt in range(gcodePts):
-                bezPts[pt].co = (self.splines[indexNr][pt].X, self.splines[indexNr][pt].Y, self.splines[indexNr][pt].Z) # X, Y, Z
-                bezPts[pt].handle_left_type = 'VECTOR'
-                bezPts[pt].handle_right_type = 'VECTOR'
-    
-        return blCurve
+        return create_bezier_curve_from_geometry(self.get_layer_geometry(simplifyTolerance))
 
 
     def get_gcode_data(self):
@@ -252,12 +281,18 @@ class gcodeCurvesData:
         
         The 'extruder' input is an 'Extruder' instance, which is generally
         stored inside a 'Machine' instance. E.g., myMachine.extruders[0] will
-        give the first extruder data of myMachine.
+        give the first extruder data of myMachine. The commands are taken
+        with the transform of the extruder applied (see 'get_transformed_gcode'),
+        so offsets and rotations show up in the drawing.
         """
         self.extruderName = extruder.name
-        self.standardGcode = extruder.standardGcode
+        self.standardGcode = list(extruder.get_transformed_gcode())
         self.gcodeCurves = dict()
         self.bevel_object = None
+        self.simplifyTolerance = 0.0                                            # mm; 0.0 means: do not simplify
+        self.maxFlow = None                                                     # mm3/s; None means: do not color by flow
+        self.pointCount = 0                                                     # points drawn, after simplification
+        self.removedPointCount = 0                                              # points removed by simplification
 
 
     def add_gcode_to_gcodeCurves(self):
@@ -270,18 +305,32 @@ class gcodeCurvesData:
         Its value is a 'gcodeCurve' object in which the standardGcode are 
         stored (in gcodeCurve.standardGcode).
         """
+        for progress in self.iter_add_gcode_to_gcodeCurves():
+            pass
+
+
+    def iter_add_gcode_to_gcodeCurves(self, chunkSize=2000):
+        """Sort gcode instances in gcodeCurve objects, in chunks of 'chunkSize' commands.
         
-        for cmd in self.standardGcode:
-            print(">>CMD", cmd.name, cmd)
+        Generator version of 'add_gcode_to_gcodeCurves': yields the fraction
+        (0.0 - 1.0) of the commands that are sorted so far.
+        """
+        totalCommands = len(self.standardGcode)
+
+        for indexNr, cmd in enumerate(self.standardGcode):
+# DEBUG            print(">>CMD", cmd.name, cmd)
             # process only the standardGcode that contain useful position information
             if cmd.command not in ("comment", "skeinforge", "unknown"):
                 zValue = cmd.Z
     
-                if zValue in gcodeCurve._registry:                              # Check if there is a gcodeCurve object with the 'Z' value:
+                if zValue in self.gcodeCurves:                                  # Check if there is a gcodeCurve object with the 'Z' value:
                     self.gcodeCurves[zValue].add_gcode(cmd)                    
                 else:                                                           # No gcodeCurve object with this Z value
                     self.gcodeCurves[zValue] = gcodeCurve(name=zValue)          # create gcodeCurve instance and add to stack
                     self.gcodeCurves[zValue].add_gcode(cmd)                     # ... and add the point
+
+            if (indexNr + 1) % chunkSize == 0:
+                yield (indexNr + 1) / totalCommands
         
         # The first few standardGcode are generally initialization standardGcode, such as 
         # G21 (units to mm) or G90 (set absolute positioning). There is not yet a
@@ -295,6 +344,38 @@ class gcodeCurvesData:
             pass                                                                    # no None key, so we just continue
 
         print("OK: All Gcodes are sorted in gcodeCurve objects")
+        yield 1.0
+
+
+    def create_splines_data(self):
+        """Create the splines data for every layer, and remove the layers without splines.
+        
+        return  :   a sorted list of the remaining layer names (Z-values)
+        """
+        for progress in self.iter_create_splines_data():
+            pass
+        return sorted(self.gcodeCurves)
+
+
+    def iter_create_splines_data(self):
+        """Create the splines data layer by layer; yields the fraction of layers done.
+        
+        There might well be layers with commands but without splines. These
+        are removed, as they will clutter the code (NB such spline-less layers
+        are normally the result of a repositioning command like G92)
+        """
+        Z_layerNames = sorted(self.gcodeCurves)
+        noSplineInLayer = list()
+
+        for indexNr, layer in enumerate(Z_layerNames):
+            self.gcodeCurves[layer].create_splines_data()
+            if self.gcodeCurves[layer].count_splines() == 0:                   # no splines are present
+                noSplineInLayer.append(self.gcodeCurves.pop(layer))             # pop the layer with 0 splines
+                gcodeCurve._registry.remove(layer)
+            yield (indexNr + 1) / len(Z_layerNames)
+
+        print("These layers were removed as they contain no splines:", noSplineInLayer)
+        yield 1.0
 
     
     def create_bevel_object(self, dimensions=(0.3, 0.3, 0.3)):
@@ -339,26 +420,54 @@ class gcodeCurvesData:
     
         # Get the layer names in sorted order. 
         # Since the layer name is Z-value, they will be ordered from bottom to top.
-        Z_layerNames = sorted(gcodeCurve._registry)
+        Z_layerNames = sorted(myLayers)
         print("The layers have the names:", Z_layerNames)
         
-        # Walk through all the layers, one by one
-        for lr in Z_layerNames:
-            cu = self.gcodeCurves[lr].create_bezier_curve()
-            print("CU created:", cu)
-    
-            # Check if we need to add a bevel object to the curve.
-            if use_bevel == True:
-                cu.bevel_object = self.bevel_object                             # The second passed argument is used as bevel_object
-            else:
-                pass
-            
-            ob = bpy.data.objects.new("Ob" + cu.name, cu)
-            ob.location = (0,0,0)                                                   #coordinate of origin
-            ob.show_name = False
+        # Walk through all the layers, one by one. The objects are linked to
+        # the scene in one batch, when all layers are done.
+        with gcodeBulkBuild("gcode_" + str(self.extruderName)) as bulkBuild:
+            for lr in Z_layerNames:
+                self.draw_layer(lr, use_bevel, bulkBuild)
+
+
+
+    def get_layer_geometry(self, zValue):
+        """Returns the (simplified) 'LayerGeometry' of a layer, and keep count of the points"""
+        geometry = self.gcodeCurves[zValue].get_layer_geometry(self.simplifyTolerance, self.maxFlow)
+        self.pointCount += geometry.count_points()
+        self.removedPointCount += geometry.removedPointCount
+        return geometry
+
+
+    def draw_layer(self, zValue, use_bevel = False, bulkBuild = None):
+        """Draw the splines of one layer as a Blender BezierCurve object.
         
-            # By linking the object to the active scene, the data becomes visible
+        zValue      :   the name (Z-value) of the layer to draw
+        use_bevel   :   if True, self.bevel_object is used as bevel object
+        bulkBuild   :   if provided, a 'gcodeBulkBuild' instance; the object is 
+                        then handed to it, instead of linked to the scene directly
+        
+        return      :   the Blender object
+        """
+        geometry = self.get_layer_geometry(zValue)
+        cu = create_bezier_curve_from_geometry(geometry)
+# DEBUG        print("CU created:", cu)
+
+        # Check if we need to add a bevel object to the curve.
+        if use_bevel == True:
+            cu.bevel_object = self.bevel_object
+        
+        ob = bpy.data.objects.new("Ob" + cu.name, cu)
+        ob.location = (0,0,0)                                                   #coordinate of origin
+        ob.show_name = False
+        register_levels_of_detail(ob, geometry)
+    
+        # By linking the object to the active scene, the data becomes visible
+        if bulkBuild is not None:
+            bulkBuild.add_object(ob)
+        else:
             bpy.context.scene.objects.link(ob)
+        return ob
 
 
 
@@ -397,6 +506,686 @@ class gcodeCurvesData:
 
 
 
+class gcodeBulkBuild:
+    """Context manager to add many Blender objects to the scene in one batch.
+    
+    Linking an object to the scene makes Blender update the scene. For an 
+    import of thousands of layers this adds up. Within a 'with gcodeBulkBuild(...)'
+    block, objects are only collected (see 'add_object'). When the block ends,
+    all objects are linked to the scene and to one new Blender group in a 
+    single batch, and the scene is updated once.
+    
+    The user preferences (such as global undo) are not changed: the block 
+    spans many timer events of the modal import, while the user keeps 
+    working in Blender.
+    
+    If the block ends with an error (or a cancelled import), the objects are
+    not linked, and no group is created.
+
+    Variables:
+        gcodeBulkBuild.groupName    :   the name of the group for the objects; if None, 
+                                        the objects are only linked to the scene
+        gcodeBulkBuild.group        :   the Blender group, once the objects are linked
+        gcodeBulkBuild.objects      :   the objects to link to the scene
+    """
+
+    def __init__(self, groupName="gcode"):
+        """Initialize a new 'gcodeBulkBuild' instance"""
+        self.groupName = groupName
+        self.group = None
+        self.objects = list()
+        self.startTime = None
+
+
+    def __enter__(self):
+        """Start collecting objects"""
+        self.startTime = time.time()
+        return self
+
+
+    def add_object(self, ob):
+        """Collect an object; it is linked to the scene at the end of the 'with' block"""
+        self.objects.append(ob)
+
+
+    def __exit__(self, excType, excValue, traceback):
+        """Link all collected objects in one batch"""
+        if excType is None:
+            buildTime = time.time() - self.startTime
+            linkStart = time.time()
+
+            scn = bpy.context.scene
+            if self.groupName is not None:
+                self.group = bpy.data.groups.new(self.groupName)
+            for ob in self.objects:
+                scn.objects.link(ob)
+                if self.group is not None:
+                    self.group.objects.link(ob)
+            scn.update()
+
+            if self.group is not None:
+                print("OK: built {0} objects in {1:.2f} s, linked to group '{2}' in {3:.2f} s".format(
+                        len(self.objects), buildTime, self.group.name, time.time() - linkStart))
+        return False
+
+
+
+class gcodeImportJob:
+    """Import a .gcode file into Blender in small steps.
+    
+    The import is split in phases: parse the Gcode, sort the commands in 
+    layers, create the splines data, and build the Blender curves. Each phase
+    is processed in chunks, so that a caller (the modal import operator) can
+    do a bit of work, update the progress bar, and hand control back to 
+    Blender. 
+    
+    All Blender datablocks that are created are kept track of, so that a 
+    cancelled import can be removed again without leaving any partial data.
+
+    Variables:
+        filepath        :   the .gcode file to import
+        use_bevel       :   whether or not to use a bevel object for the curves
+        chunkSize       :   the amount of Gcode lines (or commands) per step
+        curvesData      :   the 'gcodeCurvesData' instance, once the file is parsed
+        createdObjects  :   the Blender objects that are created by this import
+        createdCurves   :   the Blender curves that are created by this import
+        createdGroups   :   the Blender groups that are created by this import
+        layerWindow     :   if provided, a 'gcodeLayerWindow' instance. The layers are 
+                            then handed to this window, which draws only those 
+                            layers that are within its Z range.
+        simplifyTolerance   :   if larger than 0.0, the splines are simplified with 
+                                this tolerance (mm) before the curves are created
+        pointCount          :   the amount of spline points, after simplification
+        removedPointCount   :   the amount of spline points removed by simplification
+        statistics          :   the statistics of the file (see 'Extruder.get_statistics'),
+                                once the file is parsed
+        maxFlow             :   if given, the curves are colored by their volumetric flow,
+                                up to this flow (mm3/s), and the moves above it are reported
+    """
+
+    def __init__(self, filepath, use_bevel=False, chunkSize=2000, layerWindow=None, simplifyTolerance=0.0,
+                 maxFlow=None):
+        """Initialize a new 'gcodeImportJob' instance"""
+        self.filepath = filepath
+        self.use_bevel = use_bevel
+        self.chunkSize = chunkSize
+        self.layerWindow = layerWindow
+        self.simplifyTolerance = simplifyTolerance
+        self.maxFlow = maxFlow
+        self.pointCount = 0
+        self.removedPointCount = 0
+        self.statistics = None
+        self.curvesData = None
+        self.createdObjects = list()
+        self.createdCurves = list()
+        self.createdGroups = list()
+
+
+    def steps(self):
+        """Do the import; yields a (phase, fraction) tuple after every chunk of work.
+        
+        The fraction (0.0 - 1.0) is the progress of the whole import.
+        """
+        del gcodeCurve._registry[:]                                             # every import starts with an empty registry
+
+        # (1) parse the Gcode: 0 - 45%
+        myMachine = Gcode_parser.Machine()
+        for progress in myMachine.iter_add_extruder(self.filepath, self.chunkSize):
+            yield ("parse", 0.45 * progress)
+
+        # the statistics and the flow report, from the move columns that are made in chunks: 45 - 50%
+        extruder = myMachine.extruders[-1]
+        columns = Gcode_analysis.new_move_columns()
+        commandCount = float(max(len(extruder.standardGcode), 1))
+        for doneCount in Gcode_analysis.iter_move_columns(extruder.get_transformed_gcode(), columns, 10 * self.chunkSize):
+            yield ("statistics", 0.45 + 0.04 * doneCount / commandCount)
+        self.statistics = extruder.get_statistics(columns = columns)
+        yield ("statistics", 0.49)
+        self.report_flow_hotspots(columns)
+        yield ("statistics", 0.5)
+
+        # (2) sort the Gcode commands by Z-value: 50 - 60%
+        self.curvesData = gcodeCurvesData(myMachine.extruders[-1])
+        self.curvesData.simplifyTolerance = self.simplifyTolerance
+        self.curvesData.maxFlow = self.maxFlow
+        for progress in self.curvesData.iter_add_gcode_to_gcodeCurves(self.chunkSize):
+            yield ("layer", 0.5 + 0.1 * progress)
+
+        # (3) create the splines data for every layer: 60 - 70%
+        for progress in self.curvesData.iter_create_splines_data():
+            yield ("splines", 0.6 + 0.1 * progress)
+
+        # (4) build the Blender curves, one layer per step: 70 - 100%
+        if self.use_bevel == True:
+            self.prepare_bevel_object()
+
+        if self.layerWindow is not None:
+            self.layerWindow.bevel_object = self.curvesData.bevel_object
+
+        Z_layerNames = sorted(self.curvesData.gcodeCurves)
+        if self.layerWindow is not None:
+            for indexNr, zValue in enumerate(Z_layerNames):
+                self.layerWindow.add_layer(self.curvesData.get_layer_geometry(zValue))
+                yield ("build", 0.7 + 0.3 * (indexNr + 1) / len(Z_layerNames))
+        else:
+            # All curves are created first, and linked to the scene in one batch
+            groupName = os.path.splitext(os.path.basename(self.filepath))[0]
+            with gcodeBulkBuild(groupName) as bulkBuild:
+                for indexNr, zValue in enumerate(Z_layerNames):
+                    ob = self.curvesData.draw_layer(zValue, self.use_bevel, bulkBuild)
+                    self.createdObjects.append(ob)
+                    self.createdCurves.append(ob.data)
+                    yield ("build", 0.7 + 0.3 * (indexNr + 1) / len(Z_layerNames))
+            self.createdGroups.append(bulkBuild.group)
+
+        self.pointCount = self.curvesData.pointCount
+        self.removedPointCount = self.curvesData.removedPointCount
+        print("OK: import of '{0}' finished: {1} layers".format(self.filepath, len(Z_layerNames)))
+        self.print_simplify_statistics()
+
+
+    def report_flow_hotspots(self, columns):
+        """Print the moves that need more flow than 'self.maxFlow', if it is given.
+        
+        columns     :   the move columns of the transformed commands (see 
+                        'Gcode_analysis.iter_move_columns')
+        """
+        if self.maxFlow is None:
+            return
+        report = Gcode_analysis.find_flow_hotspots(None, self.maxFlow, columns = columns)
+        for line in Gcode_analysis.format_flow_hotspots(report):
+            print(line)
+
+
+    def print_simplify_statistics(self):
+        """Print how many spline points were removed by simplification"""
+        if self.simplifyTolerance <= 0.0:
+            return
+        originalCount = self.pointCount + self.removedPointCount
+        print("OK: simplified with tolerance {0} mm: {1} -> {2} points ({3:.1f}% removed)".format(
+                self.simplifyTolerance, originalCount, self.pointCount, 
+                100.0 * self.removedPointCount / max(originalCount, 1)))
+
+
+    def prepare_bevel_object(self):
+        """Create the bevel object, and keep track of it if it did not exist yet"""
+        bevelExists = 'bevel_profile' in bpy.data.objects
+        self.curvesData.create_bevel_object()
+        if not bevelExists:
+            self.createdObjects.append(self.curvesData.bevel_object)
+            self.createdCurves.append(self.curvesData.bevel_object.data)
+
+
+    def create_layer_object(self, geometry, namePrefix="", group=None, bulkBuild=None):
+        """Create a Blender curve object from a 'LayerGeometry' instance, and link it to the scene.
+        
+        namePrefix  :   added in front of the curve name, to keep the names of different files apart
+        group       :   if provided, the object is also added to this Blender group
+        bulkBuild   :   if provided, a 'gcodeBulkBuild' instance: the object is handed to 
+                        it, and linked to the scene when its 'with' block ends
+        
+        return      :   the new Blender object
+        """
+        cu = create_bezier_curve_from_geometry(geometry)
+        cu.name = namePrefix + cu.name
+        self.createdCurves.append(cu)
+        if self.use_bevel == True:
+            cu.bevel_object = self.curvesData.bevel_object
+
+        ob = bpy.data.objects.new("Ob" + cu.name, cu)
+        ob.show_name = False
+        if bulkBuild is not None:
+            bulkBuild.add_object(ob)
+        else:
+            bpy.context.scene.objects.link(ob)
+        if group is not None:
+            group.objects.link(ob)
+        register_levels_of_detail(ob, geometry)
+        self.createdObjects.append(ob)
+        return ob
+
+
+    def cancel(self):
+        """Remove all the Blender datablocks that were created by this import"""
+        scn = bpy.context.scene
+        for ob in self.createdObjects:
+            if ob.name in scn.objects:
+                scn.objects.unlink(ob)
+            bpy.data.objects.remove(ob)
+        for cu in self.createdCurves:
+            bpy.data.curves.remove(cu)
+
+        print("OK: import of '{0}' cancelled; removed {1} objects".format(self.filepath, len(self.createdObjects)))
+        for group in self.createdGroups:
+            bpy.data.groups.remove(group)
+        self.createdObjects = list()
+        self.createdCurves = list()
+        self.createdGroups = list()
+        del gcodeCurve._registry[:]
+        if self.layerWindow is not None:
+            self.layerWindow.clear()
+
+
+
+class gcodeThreadedImportJob(gcodeImportJob):
+    """Import a .gcode file, with the parsing done in a background thread.
+    
+    The Gcode parser does not use Blender, so the parsing, the sorting into 
+    layers and the creation of the splines data can run in a worker thread.
+    The worker puts finished 'LayerGeometry' buffers in a queue; the main 
+    thread (the modal import operator, via 'steps') takes these buffers from 
+    the queue and creates the Blender curves. The first layers are therefore
+    drawn while the rest of the file is still being parsed.
+    
+    The curves of the queued layers are linked to the scene in batches (see
+    'gcodeBulkBuild') of at most 'linkBatchSize' layers, instead of one at a 
+    time: the scene is then updated once per batch.
+    
+    Blender datablocks are only ever created in the main thread.
+    """
+
+    linkBatchSize = 200                                                         # layers per batch of linked objects
+
+    def __init__(self, filepath, use_bevel=False, chunkSize=2000, layerWindow=None, simplifyTolerance=0.0,
+                 maxFlow=None):
+        """Initialize a new 'gcodeThreadedImportJob' instance"""
+        gcodeImportJob.__init__(self, filepath, use_bevel, chunkSize, layerWindow, simplifyTolerance, maxFlow)
+        self.layerQueue = queue.Queue()
+        self.stopEvent = threading.Event()
+        self.worker = None
+        self.layerObjects = dict()                                              # Z-value: Blender object
+
+
+    def parse_in_background(self):
+        """Parse the file and queue the layer geometry; runs in the worker thread."""
+        try:
+            myMachine = Gcode_parser.Machine()
+            for progress, layers in myMachine.iter_add_extruder_layers(self.filepath, self.chunkSize, 
+                                                                       self.simplifyTolerance, 
+                                                                       maxFlow = self.maxFlow):
+                self.layerQueue.put(("layers", progress, layers))
+                if self.stopEvent.is_set():
+                    return
+            extruder = myMachine.extruders[-1]
+            columns = Gcode_analysis.get_move_columns(extruder.get_transformed_gcode())
+            self.statistics = extruder.get_statistics(columns = columns)
+            self.report_flow_hotspots(columns)
+            self.layerQueue.put(("done", 1.0, []))
+        except Exception as error:
+            self.layerQueue.put(("error", 0.0, error))
+
+
+    def steps(self):
+        """Do the import; yields a (phase, fraction) tuple after every step.
+        
+        The fraction (0.0 - 1.0) is the progress of the parsing in the worker thread.
+        """
+        if self.use_bevel == True:
+            self.curvesData = gcodeCurvesData(Gcode_parser.Extruder())
+            self.prepare_bevel_object()
+
+        if self.layerWindow is not None and self.curvesData is not None:
+            self.layerWindow.bevel_object = self.curvesData.bevel_object
+
+        self.worker = threading.Thread(target=self.parse_in_background)
+        self.worker.daemon = True
+        self.worker.start()
+
+        progress = 0.0
+        parsed = False
+        pending = list()                                                        # the queued layers, not drawn yet
+        while True:
+            # take everything that the worker has queued so far
+            while not parsed:
+                try:
+                    message, progress, layers = self.layerQueue.get_nowait()
+                except queue.Empty:
+                    break
+                if message == "error":
+                    raise layers
+                pending.extend(layers)
+                parsed = message == "done"
+
+            if not pending:
+                if parsed:
+                    break
+                yield ("wait", progress)                                        # nothing to draw yet: hand control back
+                continue
+
+            batch = pending[:self.linkBatchSize]
+            del pending[:self.linkBatchSize]
+            with gcodeBulkBuild(None) as bulkBuild:
+                for geometry in batch:
+                    self.pointCount += geometry.count_points()                  # (before and after simplification)
+                    self.removedPointCount += geometry.removedPointCount
+                    self.draw_layer_geometry(geometry, bulkBuild)
+                    yield ("build", progress)
+
+        print("OK: import of '{0}' finished: {1} layers".format(self.filepath, len(self.layerObjects)))
+        self.print_simplify_statistics()
+
+
+    def draw_layer_geometry(self, geometry, bulkBuild=None):
+        """Create the Blender curve object for a layer, or add to it if it exists already"""
+        if self.layerWindow is not None:
+            self.layerWindow.add_layer(geometry)
+            return
+
+        if geometry.name in self.layerObjects:
+            ob = self.layerObjects[geometry.name]
+            create_bezier_curve_from_geometry(geometry, ob.data)
+            lodRegistry[ob.name][0].extend(geometry)
+            return
+
+        self.layerObjects[geometry.name] = self.create_layer_object(geometry, bulkBuild = bulkBuild)
+
+
+    def cancel(self):
+        """Stop the worker thread, and remove the Blender datablocks created so far"""
+        self.stopEvent.set()
+        if self.worker is not None:
+            self.worker.join()
+        gcodeImportJob.cancel(self)
+
+
+
+def get_worker_parser():
+    """Returns the 'Gcode_parser' module, imported by its own name, for the worker processes.
+    
+    A spawned worker imports the module of the function it runs. Here, that 
+    is a module of the add-on package, and importing the package imports 
+    'bpy', which the workers (plain Python) do not have. The directory of 
+    the add-on is therefore put on 'sys.path' (a spawned worker gets the 
+    same path), and 'Gcode_parser' is imported again as a top-level module.
+    """
+    import importlib
+    addonDir = os.path.dirname(os.path.abspath(__file__))
+    if addonDir not in sys.path:
+        sys.path.append(addonDir)
+    return importlib.import_module("Gcode_parser")
+
+
+def create_parse_executor(maxWorkers=None):
+    """Returns the process pool that parses the files of 'gcodeMultiFileImportJob'.
+    
+    Blender runs several threads, so its process is not forked: the workers 
+    are spawned, on every platform. Inside Blender, 'sys.executable' is the 
+    Blender binary, so the workers are started with the Python interpreter 
+    that comes with Blender ('bpy.app.binary_path_python'). They run the 
+    functions of 'get_worker_parser'.
+    """
+    import multiprocessing
+    pythonPath = getattr(bpy.app, "binary_path_python", None) or sys.executable    # (Blender 2.91+ has no 'binary_path_python', 
+                                                                                    #  but there, 'sys.executable' is Python)
+    try:
+        context = multiprocessing.get_context("spawn")                          # new in Python 3.4
+    except AttributeError:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers or 4)  # (no spawn on Linux: parse in threads)
+    context.set_executable(pythonPath)
+    try:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers, mp_context=context)
+    except TypeError:                                                           # ('mp_context' is new in Python 3.7)
+        multiprocessing.set_start_method("spawn", force=True)
+        return concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers)
+
+
+
+class gcodeMultiFileImportJob(gcodeImportJob):
+    """Import several .gcode files at once, each file parsed in its own process.
+    
+    All files are handed to a process pool (see 'create_parse_executor') at
+    the start. Whenever a file has been parsed, its layers are drawn in the 
+    main thread, and its objects are placed in a Blender group with the name
+    of the file. The total time is then close to the time needed for the 
+    largest file, instead of the sum of all files.
+    """
+
+    def __init__(self, filepaths, use_bevel=False, chunkSize=2000, maxWorkers=None, simplifyTolerance=0.0,
+                 maxFlow=None):
+        """Initialize a new 'gcodeMultiFileImportJob' instance"""
+        gcodeImportJob.__init__(self, filepaths[0], use_bevel, chunkSize, simplifyTolerance=simplifyTolerance,
+                                maxFlow=maxFlow)
+        self.filepaths = filepaths
+        self.maxWorkers = maxWorkers
+        self.executor = None
+        self.pending = dict()                                                   # future: filepath
+
+
+    def steps(self):
+        """Do the import; yields a (phase, fraction) tuple after every layer that is drawn.
+        
+        The fraction (0.0 - 1.0) is the fraction of files that are finished.
+        """
+        if self.use_bevel == True:
+            self.curvesData = gcodeCurvesData(Gcode_parser.Extruder())
+            self.prepare_bevel_object()
+
+        self.executor = create_parse_executor(self.maxWorkers)
+        workerParser = get_worker_parser()
+        pending = self.pending
+        for filepath in self.filepaths:
+            future = self.executor.submit(workerParser.parse_gcode_layers, filepath, self.chunkSize, 
+                                          self.simplifyTolerance, None, self.maxFlow)
+            pending[future] = filepath
+
+        filesDone = 0
+        while pending:
+            done = [future for future in pending if future.done()]
+            if not done:
+                yield ("wait", filesDone / len(self.filepaths))                 # nothing to draw yet: hand control back
+                continue
+
+            for future in done:
+                filepath = pending.pop(future)
+                layers = future.result()                                        # re-raises any error of the worker
+
+                fileName = os.path.splitext(os.path.basename(filepath))[0]
+                group = bpy.data.groups.new(fileName)
+                self.createdGroups.append(group)
+                for geometry in layers:
+                    self.pointCount += geometry.count_points()                  # (before and after simplification)
+                    self.removedPointCount += geometry.removedPointCount
+                    self.create_layer_object(geometry, namePrefix = group.name + "_", group = group)
+                    yield ("build", filesDone / len(self.filepaths))
+
+                filesDone += 1
+                print("OK: '{0}' imported in group '{1}': {2} layers".format(filepath, group.name, len(layers)))
+
+        self.executor.shutdown()
+        self.print_simplify_statistics()
+
+
+    def cancel(self):
+        """Stop the process pool, and remove the Blender datablocks created so far"""
+        if self.executor is not None:
+            for future in self.pending:
+                future.cancel()
+            self.executor.shutdown(wait=False)
+        gcodeImportJob.cancel(self)
+
+
+
+class gcodeLayerWindow:
+    """Keep the parsed layers in memory, and draw only the layers within a Z range.
+    
+    A print can easily have thousands of layers, while only a few of these are
+    of interest at a time. The layer geometry ('LayerGeometry' instances) of 
+    all layers is kept, but Blender curve objects are only created for the 
+    layers with a Z-value between 'zMin' and 'zMax'. When the range changes, 
+    layers that enter the range are drawn, and the objects and curves of the
+    layers that leave the range are removed from Blender.
+
+    Variables:
+        gcodeLayerWindow.layers         :   dict with (Z-value: LayerGeometry) pairs
+        gcodeLayerWindow.layerObjects   :   dict with (Z-value: Blender object) pairs
+                                            of the layers that are drawn
+        gcodeLayerWindow.zMin, .zMax    :   the Z range of the layers to draw
+        gcodeLayerWindow.use_bevel      :   whether or not to use a bevel object
+        gcodeLayerWindow.bevel_object   :   the bevel object to use
+    """
+
+    def __init__(self, zMin=0.0, zMax=1.0, use_bevel=False):
+        """Initialize a new, empty 'gcodeLayerWindow' instance"""
+        self.layers = dict()
+        self.layerObjects = dict()
+        self.zMin = zMin
+        self.zMax = zMax
+        self.use_bevel = use_bevel
+        self.bevel_object = None
+
+
+    def __repr__(self):
+        """return a representation of the 'gcodeLayerWindow' instance"""
+        return "<gcodeLayerWindow Z{0} - Z{1}: {2} of {3} layers drawn>".format(self.zMin, 
+                                        self.zMax, len(self.layerObjects), len(self.layers))
+
+
+    def add_layer(self, geometry):
+        """Add the geometry of a layer; it is drawn if it lies within the Z range"""
+        zValue = geometry.name
+        if zValue in self.layers:                                               # the print returned to this layer
+            self.layers[zValue].extend(geometry)
+            if zValue in self.layerObjects:                                     # (at the level it is drawn at)
+                ob = self.layerObjects[zValue]
+                level = lodRegistry[ob.name][1] if ob.name in lodRegistry else 0
+                create_bezier_curve_from_geometry(geometry.get_level(level), ob.data)
+            return
+
+        self.layers[zValue] = geometry
+        if self.zMin <= zValue <= self.zMax:
+            self.draw_layer(zValue)
+
+
+    def update(self, zMin, zMax):
+        """Change the Z range: draw the layers that enter it, free the layers that leave it"""
+        self.zMin = zMin
+        self.zMax = zMax
+        for zValue in self.layers:
+            inWindow = zMin <= zValue <= zMax
+            if inWindow and zValue not in self.layerObjects:
+                self.draw_layer(zValue)
+            elif not inWindow and zValue in self.layerObjects:
+                self.free_layer(zValue)
+
+
+    def draw_layer(self, zValue):
+        """Create the Blender curve object of a layer at the level of detail set 
+        in the scene, and link it to the scene"""
+        geometry = self.layers[zValue]
+        level = get_level_of_detail(bpy.context.scene, geometry, mathutils.Matrix())   # (a new object is not transformed)
+        cu = create_bezier_curve_from_geometry(geometry.get_level(level))
+        if self.use_bevel == True:
+            cu.bevel_object = self.bevel_object
+
+        ob = bpy.data.objects.new("Ob" + cu.name, cu)
+        ob.show_name = False
+        bpy.context.scene.objects.link(ob)
+        register_levels_of_detail(ob, geometry, level)
+        self.layerObjects[zValue] = ob
+
+
+    def free_layer(self, zValue):
+        """Remove the Blender object and curve of a layer; its geometry is kept"""
+        ob = self.layerObjects.pop(zValue)
+        cu = ob.data
+        if ob.name in bpy.context.scene.objects:
+            bpy.context.scene.objects.unlink(ob)
+        bpy.data.objects.remove(ob)
+        bpy.data.curves.remove(cu)
+
+
+    def clear(self):
+        """Remove all drawn layers, and forget all layer geometry"""
+        for zValue in list(self.layerObjects):
+            self.free_layer(zValue)
+        self.layers = dict()
+
+
+    def get_z_range(self):
+        """Returns the (lowest, highest) Z-value of the layers, or None without layers"""
+        if not self.layers:
+            return None
+        return min(self.layers), max(self.layers)
+
+
+# The layer window of the last import that used one. The panel controls 
+# of the Z range operate on this window.
+activeLayerWindow = None
+
+# The statistics (see 'Gcode_parser.Extruder.get_statistics') of the last 
+# single file import; these are shown in the panel.
+activeStatistics = None
+
+
+# ----- levels of detail -----
+# Every layer object that is drawn is registered here, together with its
+# 'LayerGeometry'. The curves can then be rebuilt at a coarser level of 
+# detail (and back) without parsing the Gcode again.
+#   lodRegistry[object name] = [LayerGeometry, level that is drawn]
+lodRegistry = dict()
+
+# the level of detail (see 'LayerGeometry.get_level') for each 'lod_mode' setting
+lodModeLevels = {'FULL': 0, 'QUARTER': 1, 'SIXTEENTH': 2}
+
+
+def register_levels_of_detail(ob, geometry, level=0):
+    """Register a layer object, that is drawn at 'level' (default: full detail), with its geometry"""
+    lodRegistry[ob.name] = [geometry, level]
+
+
+def set_level_of_detail(ob, level):
+    """Rebuild the curve of a registered layer object at the given level of detail"""
+    geometry, currentLevel = lodRegistry[ob.name]
+    if level == currentLevel:
+        return
+    ob.data.splines.clear()
+    create_bezier_curve_from_geometry(geometry.get_level(level), ob.data)
+    lodRegistry[ob.name][1] = level
+
+
+def get_level_of_detail(scene, geometry, matrix):
+    """Returns the level of detail a layer is drawn at, with the settings of the scene.
+    
+    With the 'DISTANCE' mode, the level depends on the distance between the 
+    scene camera and the center of the layer: full detail up to 'lod_distance', 
+    1/4 of the points up to 4 x 'lod_distance', and 1/16 beyond that.
+    
+    geometry    :   the 'LayerGeometry' of the layer
+    matrix      :   the world matrix of the layer object
+    """
+    if scene.lod_mode in lodModeLevels:
+        return lodModeLevels[scene.lod_mode]
+    bounds = geometry.get_bounds()
+    if scene.camera is None or bounds is None:
+        return 0
+    center = [(low + high) / 2.0 for low, high in zip(bounds[0], bounds[1])]
+    distance = (scene.camera.location - matrix * mathutils.Vector(center)).length
+    if distance <= scene.lod_distance:
+        return 0
+    elif distance <= 4.0 * scene.lod_distance:
+        return 1
+    return 2
+
+
+def apply_levels_of_detail(scene):
+    """Draw all registered layer objects at the level of detail set in the scene
+    (see 'get_level_of_detail')"""
+    for obName in list(lodRegistry):
+        ob = bpy.data.objects.get(obName)
+        if ob is None or ob.type != 'CURVE':                                    # the object was removed
+            del lodRegistry[obName]
+            continue
+        set_level_of_detail(ob, get_level_of_detail(scene, lodRegistry[obName][0], ob.matrix_world))
+
+
+@bpy.app.handlers.persistent
+def update_levels_of_detail_on_frame_change(scene):
+    """Frame change handler: with the 'DISTANCE' mode, follow an animated camera"""
+    if scene.lod_mode == 'DISTANCE':
+        apply_levels_of_detail(scene)
+
+
+
 # ----- the body of the program -----
 def main():
     """Main code of the Blender part. 
@@ -0,0 +1,1090 @@
+#! /usr/bin/env python3 
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+"""
+Analyses of parsed Gcode, without Blender.
+
+The functions in this file work on the standardized Gcode instances of one or 
+more 'Extruder' instances (see 'Gcode_parser.py'):
+
+    1.  find_overlaps: find where the toolpaths of different extruders 
+                       overlap on the same layer, for example after two files
+                       are merged with 'add_offset' and 'merge_extruders'.
+    2.  estimate_print_time: estimate the print time, per layer and per tool,
+                       with the acceleration and lookahead of the firmware.
+    3.  compute_statistics: filament, distances, retractions, time and 
+                       bounding box, per layer and per tool.
+    4.  find_flow_hotspots: the moves that need more volumetric flow (mm3/s) 
+                       than the hotend can melt.
+"""
+
+# ----- imports -----
+import math
+import time
+from array import array
+
+try:
+    from . import Gcode_parser
+except (ImportError, SystemError, ValueError):
+    # not loaded as part of the Blender add-on, but as a script
+    import Gcode_parser
+
+try:
+    import numpy                                                                # optional: 'plan_moves' is faster with it
+except ImportError:
+    numpy = None
+
+
+# ----- toolpath segments -----
+def iter_move_points(cmd):
+    """Yield the (x, y, z) points that a move passes after its start point.
+    
+    These are the intermediate points of an arc move (G2, G3), followed by
+    the end point of the move.
+    """
+    arcPoints = cmd.arcPoints
+    if arcPoints is not None:
+        for pointNr in range(0, len(arcPoints), 3):
+            yield arcPoints[pointNr], arcPoints[pointNr + 1], arcPoints[pointNr + 2]
+    yield cmd.X, cmd.Y, cmd.Z
+
+
+def iter_extruded_segments(standardGcode):
+    """Yield the extruded line segments of a list of resolved Gcode instances.
+    
+    A segment is a move in the X/Y plane during which plastic is extruded; 
+    arc moves (G2, G3) give one segment per tessellated piece.
+    
+    yield   :   (Z-value, x0, y0, x1, y1, Gcode instance) tuples
+    """
+    lastCmd = None
+    for cmd in standardGcode:
+        if cmd.command in ("comment", "skeinforge", "unknown") or cmd.Z is None:
+            continue
+        if (lastCmd is not None and cmd.E > lastCmd.E 
+                and (cmd.X != lastCmd.X or cmd.Y != lastCmd.Y or cmd.arcPoints is not None)):
+            x0, y0 = lastCmd.X, lastCmd.Y
+            for x1, y1, z1 in iter_move_points(cmd):
+                yield cmd.Z, x0, y0, x1, y1, cmd
+                x0, y0 = x1, y1
+        lastCmd = cmd
+
+
+def segment_distance(ax0, ay0, ax1, ay1, bx0, by0, bx1, by1):
+    """Returns (distance, intersects) of two line segments in the X/Y plane"""
+    def orientation(px, py, qx, qy, rx, ry):
+        value = (qx - px) * (ry - py) - (qy - py) * (rx - px)
+        return (value > 1e-12) - (value < -1e-12)
+
+    def point_distance(px, py, x0, y0, x1, y1):
+        dx, dy = x1 - x0, y1 - y0
+        lengthSquared = dx * dx + dy * dy
+        t = 0.0 if lengthSquared == 0.0 else max(0.0, min(1.0, ((px - x0) * dx + (py - y0) * dy) / lengthSquared))
+        return math.hypot(px - x0 - t * dx, py - y0 - t * dy)
+
+    o1 = orientation(ax0, ay0, ax1, ay1, bx0, by0)
+    o2 = orientation(ax0, ay0, ax1, ay1, bx1, by1)
+    o3 = orientation(bx0, by0, bx1, by1, ax0, ay0)
+    o4 = orientation(bx0, by0, bx1, by1, ax1, ay1)
+    if o1 != o2 and o3 != o4 and 0 not in (o1, o2, o3, o4):
+        return 0.0, True
+    return min(point_distance(ax0, ay0, bx0, by0, bx1, by1), point_distance(ax1, ay1, bx0, by0, bx1, by1),
+               point_distance(bx0, by0, ax0, ay0, ax1, ay1), point_distance(bx1, by1, ax0, ay0, ax1, ay1)), False
+
+
+def overlap_area(ax0, ay0, ax1, ay1, bx0, by0, bx1, by1, distance, intersects, lineWidth):
+    """Estimate the area (mm2) where two extruded lines of width 'lineWidth' overlap.
+    
+    Crossing lines overlap in a rhombus of lineWidth^2 / sin(angle). For 
+    other lines, the overlap is the part of segment b that runs alongside 
+    segment a, times the part of the line width that overlaps 
+    (lineWidth - distance). This is an estimate: it is exact for parallel 
+    and for crossing lines only.
+    """
+    lengthA = math.hypot(ax1 - ax0, ay1 - ay0)
+    lengthB = math.hypot(bx1 - bx0, by1 - by0)
+    if lengthA == 0.0 or lengthB == 0.0:
+        return 0.0
+    ux, uy = (ax1 - ax0) / lengthA, (ay1 - ay0) / lengthA
+    sinAngle = abs(ux * (by1 - by0) - uy * (bx1 - bx0)) / lengthB
+
+    if intersects:
+        return min(lineWidth * lineWidth / max(sinAngle, 1e-3), 
+                   lineWidth * min(lengthA, lengthB) + lineWidth * lineWidth)
+
+    # the part of b that runs alongside a: project b on a
+    t0 = (bx0 - ax0) * ux + (by0 - ay0) * uy
+    t1 = (bx1 - ax0) * ux + (by1 - ay0) * uy
+    alongside = max(0.0, min(max(t0, t1), lengthA) - max(min(t0, t1), 0.0))
+    return alongside * (lineWidth - distance)
+
+
+# ----- overlap detection -----
+def find_overlaps(extruders, lineWidth=0.4, cellSize=2.0):
+    """Find the extruded lines of different extruders that overlap on the same layer.
+    
+    Comparing all segments of all extruders would take O(n^2) time. Instead, 
+    every layer gets a uniform grid (a 'spatial hash': a dict with an entry 
+    per occupied cell of 'cellSize' mm). The segments of every extruder are
+    added to the cells that their bounding box (plus half the line width) 
+    touches; only segments of different extruders that share a cell are 
+    compared. 
+    
+    Two segments overlap if they are closer than 'lineWidth' (the lines of
+    plastic touch), and intersect if they cross. 
+    
+    extruders   :   a list of 'Extruder' instances, printed on the same machine
+                    (their transforms, like those of 'add_offset', are applied)
+    lineWidth   :   the width (mm) of an extruded line
+    cellSize    :   the size (mm) of the grid cells; about the length of a 
+                    typical segment works best
+    
+    return      :   a dict with:
+                    overlaps        :   list of (Z-value, extruder nr A, line A, extruder nr B, 
+                                        line B, distance, area, intersects) tuples, where 'line'
+                                        is the name (line number) of the Gcode instance
+                    intersections   :   the amount of crossing segment pairs
+                    area            :   the estimated total overlap area (mm2)
+                    layers          :   dict with the overlap area per Z-value
+    """
+    # 1. collect the segments per layer, per extruder
+    layers = dict()                                                             # Z-value: list (per extruder) of (coordinates, commands)
+    for extruderNr, extruder in enumerate(extruders):
+        for zValue, x0, y0, x1, y1, cmd in iter_extruded_segments(extruder.get_transformed_gcode()):
+            perExtruder = layers.setdefault(round(zValue, 4), [None] * len(extruders))
+            if perExtruder[extruderNr] is None:
+                perExtruder[extruderNr] = (array('d'), [])
+            perExtruder[extruderNr][0].extend((x0, y0, x1, y1))
+            perExtruder[extruderNr][1].append(cmd)
+
+    overlaps = []
+    layerAreas = dict()
+    margin = lineWidth / 2.0
+
+    for zValue in sorted(layers):
+        perExtruder = layers[zValue]
+        if sum(1 for segments in perExtruder if segments is not None) < 2:
+            continue
+
+        # 2. add the segments of every extruder to the grid cells they touch
+        grid = dict()                                                           # (cell x, cell y): list of (extruder nr, segment nr)
+        for extruderNr, segments in enumerate(perExtruder):
+            if segments is None:
+                continue
+            coordinates = segments[0]
+            for segmentNr in range(len(coordinates) // 4):
+                x0, y0, x1, y1 = coordinates[4 * segmentNr:4 * segmentNr + 4]
+                for cellX in range(int(math.floor((min(x0, x1) - margin) / cellSize)), 
+                                   int(math.floor((max(x0, x1) + margin) / cellSize)) + 1):
+                    for cellY in range(int(math.floor((min(y0, y1) - margin) / cellSize)), 
+                                       int(math.floor((max(y0, y1) + margin) / cellSize)) + 1):
+                        grid.setdefault((cellX, cellY), []).append((extruderNr, segmentNr))
+
+        # 3. compare the segments of different extruders within every cell
+        compared = set()
+        layerArea = 0.0
+        for cellSegments in grid.values():
+            if len(set(extruderNr for extruderNr, segmentNr in cellSegments)) < 2:
+                continue
+            for indexA in range(len(cellSegments)):
+                extruderA, segmentA = cellSegments[indexA]
+                for indexB in range(indexA + 1, len(cellSegments)):
+                    extruderB, segmentB = cellSegments[indexB]
+                    if extruderA == extruderB:
+                        continue
+                    key = (extruderA, segmentA, extruderB, segmentB) if extruderA < extruderB else \
+                          (extruderB, segmentB, extruderA, segmentA)
+                    if key in compared:                                         # (segments can share more than one cell)
+                        continue
+                    compared.add(key)
+
+                    a = perExtruder[key[0]][0][4 * key[1]:4 * key[1] + 4]
+                    b = perExtruder[key[2]][0][4 * key[3]:4 * key[3] + 4]
+                    distance, intersects = segment_distance(*(list(a) + list(b)))
+                    if distance >= lineWidth:
+                        continue
+                    area = overlap_area(*(list(a) + list(b) + [distance, intersects, lineWidth]))
+                    layerArea += area
+                    overlaps.append((zValue, key[0], perExtruder[key[0]][1][key[1]].name, 
+                                     key[2], perExtruder[key[2]][1][key[3]].name, distance, area, intersects))
+        if layerArea > 0.0:
+            layerAreas[zValue] = layerArea
+
+    result = {"overlaps": overlaps, 
+              "intersections": sum(1 for overlap in overlaps if overlap[7]),
+              "area": sum(layerAreas.values()),
+              "layers": layerAreas}
+    print("OK: overlap check of {0} extruders: {1} overlapping segment pairs ({2} crossing) on {3} layers, "
+          "about {4:.2f} mm2".format(len(extruders), len(overlaps), result["intersections"], 
+                                      len(layerAreas), result["area"]))
+    return result
+
+
+# ----- print time estimation -----
+printerSettings = {
+    "maxFeedrate": (300.0, 300.0, 12.0, 120.0),                                # X, Y, Z, E (mm/s)
+    "maxAcceleration": (3000.0, 3000.0, 200.0, 10000.0),                       # X, Y, Z, E (mm/s2)
+    "acceleration": 1250.0,                                                     # printing moves (mm/s2)
+    "travelAcceleration": 1250.0,                                               # moves without extrusion (mm/s2)
+    "retractAcceleration": 1250.0,                                              # moves of the extruder only (mm/s2)
+    "junctionDeviation": 0.013,                                                 # (mm)
+    "jerk": None,                                                               # X, Y, Z, E (mm/s), instead of the junction deviation
+    "minimumPlannerSpeed": 0.05,                                                # (mm/s)
+    "toolChangeTime": 0.0,                                                      # (s)
+    "filamentDiameter": 1.75,                                                   # (mm)
+    "filamentDensity": 1.24,                                                    # (g/cm3), PLA
+    "maxVolumetricFlow": 15.0,                                                  # what the hotend can melt (mm3/s)
+    }
+moveCommands = ("G0", "G1", "G2", "G3")
+syncCommands = ("G28", "M109", "M190", "M400", "M600")                          # the planner waits until all moves are done
+
+
+def get_move_columns(standardGcode):
+    """Returns the moves of a list of resolved Gcode instances as columns.
+    
+    Every move is a straight segment; arc moves (G2, G3) give one segment 
+    per tessellated piece, the extrusion is divided over the pieces by their
+    length. Moves that do not change the position are left out.
+    
+    The work is done by 'iter_move_columns'; this function simply runs that
+    generator until all commands are processed.
+    
+    return  :   dict with the columns; one value per segment:
+                dX, dY, dZ, dE  :   the displacement (mm) along every axis
+                X, Y, Z         :   the end point of the segment
+                feedrate        :   the requested speed (mm/s); 0.0 if unknown
+                layer           :   the layer key (see 'Gcode_parser.iter_layer_keys')
+                tool            :   the tool that prints the segment
+                lineNr          :   the line number ('Gcode.name') of the move, or -1
+                commandNr       :   the index of the move in 'standardGcode'
+                stop            :   1 if the machine is at rest at the start of the 
+                                    segment (after a dwell, heating, homing, tool change)
+                and the time spent outside of moves:
+                dwellTime       :   dict with the dwell time (s) per (layer key, tool)
+                toolChanges     :   dict with the amount of tool changes per (layer key, tool)
+    """
+    columns = new_move_columns()
+    for commandCount in iter_move_columns(standardGcode, columns):
+        pass
+    return columns
+
+
+def new_move_columns():
+    """Returns a dict with empty move columns (see 'get_move_columns')"""
+    columns = dict((name, array("d")) for name in ("dX", "dY", "dZ", "dE", "X", "Y", "Z", "feedrate", "layer"))
+    columns["tool"] = array("i")
+    columns["lineNr"] = array("i")
+    columns["commandNr"] = array("l")
+    columns["stop"] = array("b")
+    columns["dwellTime"] = dict()
+    columns["toolChanges"] = dict()
+    return columns
+
+
+def iter_move_columns(standardGcode, columns, chunkSize=20000):
+    """Add the moves of resolved Gcode instances to the move columns, in chunks.
+    
+    This generator does the same as 'get_move_columns', but adds the moves to
+    'columns' (see 'new_move_columns'), and hands back control after every 
+    'chunkSize' commands. It yields the amount of commands processed so far,
+    so a caller (e.g., the Blender import operator) can report progress.
+    """
+    appendX, appendY, appendZ = columns["dX"].append, columns["dY"].append, columns["dZ"].append
+    appendE, appendF, appendLayer = columns["dE"].append, columns["feedrate"].append, columns["layer"].append
+    appendTool, appendStop, appendLineNr = columns["tool"].append, columns["stop"].append, columns["lineNr"].append
+    appendEndX, appendEndY, appendEndZ = columns["X"].append, columns["Y"].append, columns["Z"].append
+    appendCommandNr = columns["commandNr"].append
+
+    lastX = lastY = lastZ = lastE = None
+    tool = 0
+    stop = 1
+    commandCount = 0
+    for layerKey, cmd in Gcode_parser.iter_layer_keys(standardGcode):
+        command = cmd.command
+        if command in moveCommands and lastX is not None and cmd.X is not None:
+            feedrate = cmd.F / 60.0 if cmd.F else 0.0
+            lineNr = int(cmd.name) if str(cmd.name).isdigit() else -1
+            extrusion = cmd.E - lastE if cmd.E is not None and lastE is not None else 0.0
+            if cmd.arcPoints is None:
+                pieces = [(cmd.X, cmd.Y, cmd.Z, extrusion)]
+            else:
+                pieces = []
+                x0, y0, z0 = lastX, lastY, lastZ
+                for x1, y1, z1 in iter_move_points(cmd):
+                    pieces.append((x1, y1, z1, math.sqrt((x1 - x0) ** 2 + (y1 - y0) ** 2 + (z1 - z0) ** 2)))
+                    x0, y0, z0 = x1, y1, z1
+                arcLength = sum(piece[3] for piece in pieces)
+                pieces = [(x1, y1, z1, extrusion * length / arcLength if arcLength > 0.0 else 0.0) 
+                          for x1, y1, z1, length in pieces]
+                pieces[-1] = pieces[-1][:3] + (extrusion - sum(piece[3] for piece in pieces[:-1]),)
+            x0, y0, z0 = lastX, lastY, lastZ
+            for x1, y1, z1, dE in pieces:
+                if x1 == x0 and y1 == y0 and z1 == z0 and dE == 0.0:
+                    continue
+                appendX(x1 - x0)
+                appendY(y1 - y0)
+                appendZ(z1 - z0)
+                appendE(dE)
+                appendEndX(x1)
+                appendEndY(y1)
+                appendEndZ(z1)
+                x0, y0, z0 = x1, y1, z1
+                appendF(feedrate)
+                appendLayer(layerKey)
+                appendTool(tool)
+                appendLineNr(lineNr)
+                appendCommandNr(commandCount)
+                appendStop(stop)
+                stop = 0
+        elif command in ("G4", "G04"):
+            seconds = cmd.parameters.get("P", 0.0) / 1000.0 or cmd.parameters.get("S", 0.0)
+            columns["dwellTime"][layerKey, tool] = columns["dwellTime"].get((layerKey, tool), 0.0) + seconds
+            stop = 1
+        elif command.startswith("T") and cmd.T != tool:
+            tool = cmd.T
+            columns["toolChanges"][layerKey, tool] = columns["toolChanges"].get((layerKey, tool), 0) + 1
+            stop = 1
+        elif command in syncCommands:
+            stop = 1
+
+        if cmd.X is not None:                                                   # (every command has the last known position, also G92)
+            lastX, lastY, lastZ = cmd.X, cmd.Y, cmd.Z
+        if cmd.E is not None:
+            lastE = cmd.E
+
+        commandCount += 1
+        if commandCount % chunkSize == 0:
+            yield commandCount
+    yield commandCount
+
+
+def get_segment_limits(columns, settings=None):
+    """Returns the length, nominal speed and acceleration of every segment.
+    
+    The nominal speed is the requested feedrate, and the acceleration the 
+    acceleration for the kind of move (printing, travel or retraction); both
+    are limited by the maximum of every axis (see 'printerSettings'). 
+    
+    columns     :   the move columns (see 'get_move_columns')
+    settings    :   dict with the machine settings to use instead of those
+                    in 'printerSettings'
+    
+    return      :   (planar, lengths, nominal, acceleration) lists; 'planar' is 
+                    the length in X/Y/Z, which is 0.0 for extruder-only moves, 
+                    and 'lengths' the length that is planned (the E-distance
+                    for extruder-only moves)
+    """
+    settings = dict(printerSettings, **(settings or {}))
+    sqrt = math.sqrt
+    maxFeedrate = settings["maxFeedrate"]
+    maxAcceleration = settings["maxAcceleration"]
+    dX, dY, dZ, dE = columns["dX"], columns["dY"], columns["dZ"], columns["dE"]
+
+    planar = [sqrt(x * x + y * y + z * z) for x, y, z in zip(dX, dY, dZ)]     # (0.0 for extruder-only moves)
+    lengths = [p or (e if e > 0.0 else -e) for p, e in zip(planar, dE)]
+    absolute = [[d if d > 0.0 else -d for d in delta] for delta in (dX, dY, dZ, dE)]
+    fX, fY, fZ, fE = [1.0 / limit for limit in maxFeedrate]                    # the axis that needs the most time per mm limits the speed
+    aX, aY, aZ, aE = [1.0 / limit for limit in maxAcceleration]
+    limits = [length / max(x * fX, y * fY, z * fZ, e * fE) for length, x, y, z, e in zip(lengths, *absolute)]
+    nominal = [f if 0.0 < f < limit else limit for f, limit in zip(columns["feedrate"], limits)]
+    limits = [length / max(x * aX, y * aY, z * aZ, e * aE) for length, x, y, z, e in zip(lengths, *absolute)]
+    printing, travel, retract = settings["acceleration"], settings["travelAcceleration"], settings["retractAcceleration"]
+    acceleration = [(printing if e > 0.0 else travel) if p else retract for p, e in zip(planar, dE)]
+    acceleration = [a if a < limit else limit for a, limit in zip(acceleration, limits)]
+    return planar, lengths, nominal, acceleration
+
+
+def get_segment_limits_numpy(columns, settings):
+    """The same as 'get_segment_limits', with numpy arrays instead of lists"""
+    dX, dY, dZ, dE, feedrate = [numpy.asarray(columns[name], dtype=numpy.float64) 
+                                for name in ("dX", "dY", "dZ", "dE", "feedrate")]
+    planar = numpy.sqrt(dX * dX + dY * dY + dZ * dZ)
+    lengths = numpy.where(planar > 0.0, planar, numpy.abs(dE))
+    absolute = [numpy.abs(delta) for delta in (dX, dY, dZ, dE)]
+    limits = lengths / numpy.maximum.reduce([delta / limit for delta, limit in zip(absolute, settings["maxFeedrate"])])
+    nominal = numpy.where((feedrate > 0.0) & (feedrate < limits), feedrate, limits)
+    limits = lengths / numpy.maximum.reduce([delta / limit for delta, limit in zip(absolute, settings["maxAcceleration"])])
+    acceleration = numpy.where(planar > 0.0, numpy.where(dE > 0.0, settings["acceleration"], settings["travelAcceleration"]),
+                               settings["retractAcceleration"])
+    acceleration = numpy.minimum(acceleration, limits)
+    return planar, lengths, nominal, acceleration
+
+
+def get_entry_limits(columns, settings):
+    """Steps 1 and 2 of 'plan_moves', for (a slice of) the move columns.
+    
+    return  :   (lengths, nominal, acceleration, entryMax2) lists; 'entryMax2' 
+                is the maximum squared entry speed of every segment
+    """
+    sqrt = math.sqrt
+    inf = float("inf")
+    minimumSpeed2 = settings["minimumPlannerSpeed"] ** 2
+    dX, dY, dZ = columns["dX"], columns["dY"], columns["dZ"]
+
+    # 1. length, nominal speed and acceleration
+    planar, lengths, nominal, acceleration = get_segment_limits(columns, settings)
+    nominal2 = [v * v for v in nominal]
+
+    # 2. the maximum (squared) entry speed of every segment
+    uX = [x / p if p else 0.0 for x, p in zip(dX, planar)]                      # the direction of every segment ...
+    uY = [y / p if p else 0.0 for y, p in zip(dY, planar)]
+    uZ = [z / p if p else 0.0 for z, p in zip(dZ, planar)]
+    directions = [1.0 if p and pp else 0.0 for p, pp in zip(planar, [0.0] + planar[:-1])]   # ... extruder-only moves have none
+    if settings["jerk"] is None:
+        deviation = settings["junctionDeviation"]
+        cosines = [-(px * x + py * y + pz * z) if d else 1.0                    # (1.0: a reversal, slow down to a stop)
+                   for px, py, pz, x, y, z, d in zip([0.0] + uX[:-1], [0.0] + uY[:-1], [0.0] + uZ[:-1], uX, uY, uZ, directions)]
+        junction2 = [minimumSpeed2 if c > 0.999999 else inf if c < -0.999999 else a * deviation * s / (1.0 - s)
+                     for c, s, a in zip(cosines, [sqrt(0.5 - 0.5 * c) if c < 1.0 else 0.0 for c in cosines], acceleration)]
+    else:
+        jX, jY, jZ = [1.0 / limit for limit in settings["jerk"][:3]]
+        changes = [max(abs(x - px) * jX, abs(y - py) * jY, abs(z - pz) * jZ) if d else inf
+                   for px, py, pz, x, y, z, d in zip([0.0] + uX[:-1], [0.0] + uY[:-1], [0.0] + uZ[:-1], uX, uY, uZ, directions)]
+        junction2 = [1.0 / (c * c) if c > 1e-9 else inf for c in changes]
+    junction2 = [j if j < v else v for j, v in zip(junction2, nominal2)]
+    junction2 = [j if j < v else v for j, v in zip(junction2, [0.0] + nominal2[:-1])]
+    entryMax2 = [0.0 if stop else j if j > minimumSpeed2 else minimumSpeed2 for j, stop in zip(junction2, columns["stop"])]
+    return lengths, nominal, acceleration, entryMax2
+
+
+def get_entry_limits_numpy(columns, settings):
+    """The same as 'get_entry_limits', with numpy arrays instead of lists"""
+    minimumSpeed2 = settings["minimumPlannerSpeed"] ** 2
+    planar, lengths, nominal, acceleration = get_segment_limits_numpy(columns, settings)
+    nominal2 = nominal * nominal
+
+    def previous(values):
+        return numpy.concatenate(([0.0], values[:-1]))
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):                    # (the values of the other branch of 'where')
+        directions = [numpy.where(planar > 0.0, numpy.asarray(columns[name], dtype=numpy.float64) / planar, 0.0) 
+                      for name in ("dX", "dY", "dZ")]
+        hasDirection = (planar > 0.0) & (previous(planar) > 0.0)
+        if settings["jerk"] is None:
+            cosines = numpy.where(hasDirection, -sum(previous(u) * u for u in directions), 1.0)
+            sines = numpy.where(cosines < 1.0, numpy.sqrt(numpy.maximum(0.5 - 0.5 * cosines, 0.0)), 0.0)
+            junction2 = numpy.where(cosines > 0.999999, minimumSpeed2, 
+                                    numpy.where(cosines < -0.999999, numpy.inf, 
+                                                acceleration * settings["junctionDeviation"] * sines / (1.0 - sines)))
+        else:
+            changes = numpy.maximum.reduce([numpy.abs(u - previous(u)) / limit 
+                                            for u, limit in zip(directions, settings["jerk"][:3])])
+            changes = numpy.where(hasDirection, changes, numpy.inf)
+            junction2 = numpy.where(changes > 1e-9, 1.0 / (changes * changes), numpy.inf)
+    junction2 = numpy.minimum(numpy.minimum(junction2, nominal2), previous(nominal2))
+    stops = numpy.asarray(columns["stop"], dtype=bool)
+    entryMax2 = numpy.where(stops, 0.0, numpy.maximum(junction2, minimumSpeed2))
+    return lengths, nominal, acceleration, entryMax2
+
+
+def find_lookahead_end(entryMax2, twoAL, nextNr):
+    """Returns where the backward pass of 'plan_moves' can stop, without a change in 
+    the entry speeds of the segments up to 'nextNr' (the first segment of the next chunk).
+    
+    That is at a stop (the entry speed is 0.0 there as well), or where the 
+    segments after 'nextNr' are long enough to decelerate from any of the entry 
+    speeds before it to a stop. Returns None if neither is in the slice.
+    """
+    bound = max(entryMax2[:nextNr + 1])
+    reach = 0.0
+    for segmentNr in range(nextNr, len(entryMax2) - 1):
+        reach += twoAL[segmentNr]
+        if entryMax2[segmentNr + 1] == 0.0 or reach >= bound:
+            return segmentNr + 1
+    return None
+
+
+def plan_chunk(entryMax2, twoAL, nominal, acceleration, lengths, startLimit, count):
+    """Steps 3, 4 and 5 of 'plan_moves' for a chunk of segments.
+    
+    The backward pass runs over all segments of the slice (the chunk and its
+    lookahead), the forward pass from 'startLimit' (the squared speed that 
+    the previous chunk can reach); the times are returned of the first 
+    'count' segments only.
+    
+    return  :   (times, limit); 'limit' is the 'startLimit' of the next chunk
+    """
+    sqrt = math.sqrt
+
+    # 3. backward pass
+    entry2 = []
+    exit2 = 0.0
+    for maximum, reach in zip(reversed(entryMax2), reversed(twoAL)):
+        exit2 += reach
+        if exit2 > maximum:
+            exit2 = maximum
+        entry2.append(exit2)
+    entry2.reverse()
+
+    # 4. forward pass (with the entry of the next chunk, for the exit speed of the last segment)
+    forward = []
+    limit = startLimit
+    for speed2, reach in zip(entry2[:count + 1], twoAL):
+        if speed2 > limit:
+            speed2 = limit
+        forward.append(speed2)
+        limit = speed2 + reach
+    entry2 = forward[:count]
+    exit2 = forward[1:count + 1] + [0.0] * (count + 1 - len(forward))
+    limit = entry2[-1] + twoAL[count - 1]
+
+    # 5. the trapezoids: a triangle if the segment is too short to reach the nominal speed
+    entry = [sqrt(v2) for v2 in entry2]
+    times = array("d", [(2.0 * vn - v0 - v1) / a + (length - (2.0 * vn2 - v02 - v12) / (2.0 * a)) / vn 
+                        if 2.0 * vn2 - v02 - v12 <= reach else
+                        (2.0 * sqrt(0.5 * (reach + v02 + v12)) - v0 - v1) / a
+                        for v0, v1, v02, v12, vn, vn2, a, length, reach 
+                        in zip(entry, entry[1:] + [sqrt(exit2[-1])], entry2, exit2, nominal, 
+                               [v * v for v in nominal], acceleration, lengths, twoAL)])
+    return times, limit
+
+
+def plan_chunk_numpy(entryMax2, twoAL, nominal, acceleration, lengths, startLimit, count):
+    """The same as 'plan_chunk', with numpy arrays.
+    
+    Both passes are a running minimum: with C the running sum of 'twoAL', 
+    the backward pass gives entry2[i] = min(entryMax2[j] + C[j] for j >= i) - C[i],
+    and the forward pass min(entry2[k] - C[k] for k <= i) + C[i].
+    """
+    reachSum = numpy.concatenate(([0.0], numpy.cumsum(twoAL)))
+    entry2 = numpy.minimum.accumulate((numpy.append(entryMax2, 0.0) + reachSum)[::-1])[::-1] - reachSum
+
+    size = min(count + 1, len(entryMax2))
+    values = entry2[:size] - reachSum[:size]
+    values[0] = min(values[0], startLimit)
+    forward = numpy.maximum(numpy.minimum.accumulate(values) + reachSum[:size], 0.0)
+    entry2 = forward[:count]
+    exit2 = numpy.append(forward[1:count + 1], [0.0] * (count + 1 - size))
+    limit = entry2[-1] + twoAL[count - 1]
+
+    nominal, acceleration, lengths, twoAL = nominal[:count], acceleration[:count], lengths[:count], twoAL[:count]
+    entry, exit, nominal2 = numpy.sqrt(entry2), numpy.sqrt(exit2), nominal * nominal
+    trapezoid = 2.0 * nominal2 - entry2 - exit2 <= twoAL
+    times = numpy.where(trapezoid, 
+                        (2.0 * nominal - entry - exit) / acceleration + (lengths - (2.0 * nominal2 - entry2 - exit2) / (2.0 * acceleration)) / nominal,
+                        (2.0 * numpy.sqrt(0.5 * (twoAL + entry2 + exit2)) - entry - exit) / acceleration)
+    return array("d", times.tobytes()), limit
+
+
+def plan_moves(columns, settings=None, chunkSize=50000):
+    """Compute the time of every segment, as a motion planner with lookahead would move.
+    
+    The speed of a segment follows a trapezoid: it accelerates from the entry
+    speed to the nominal speed, cruises, and decelerates to the exit speed 
+    (the entry speed of the next segment). If the segment is too short to 
+    reach the nominal speed, the trapezoid becomes a triangle.
+    
+    1.  the length, nominal speed and acceleration of every segment, limited
+        per axis (see 'get_segment_limits')
+    2.  the maximum speed at every junction of two segments: by the junction
+        deviation (as in Grbl and Marlin), or by the jerk per axis if 
+        settings["jerk"] is given
+    3.  the backward pass: every segment can decelerate to its exit speed
+    4.  the forward pass: every segment can accelerate to its exit speed
+    5.  the time of every trapezoid
+    
+    The segments are planned in chunks of 'chunkSize', so the lists of the 
+    steps are only as long as a chunk. Each chunk is planned with one segment
+    before it (for its first junction) and the lookahead after it that the
+    backward pass needs (see 'find_lookahead_end'), and the forward pass 
+    goes on from the speed the previous chunk reaches: the times are the 
+    same as when all segments are planned at once. With numpy, the steps of
+    a chunk are done on arrays ('get_entry_limits_numpy', 'plan_chunk_numpy');
+    otherwise with list comprehensions and two loops.
+    The lookahead covers all segments, and the machine is at rest at the 
+    start, at the end, and at every 'stop' of the columns. 
+    
+    columns     :   the move columns (see 'get_move_columns')
+    settings    :   dict with the machine settings to use instead of those
+                    in 'printerSettings'
+    chunkSize   :   the amount of segments that is planned at once
+    
+    return      :   array with the time (s) of every segment
+    """
+    settings = dict(printerSettings, **(settings or {}))
+    if numpy is not None:
+        entry_limits, plan = get_entry_limits_numpy, plan_chunk_numpy
+    else:
+        entry_limits, plan = get_entry_limits, plan_chunk
+    segmentCount = len(columns["dX"])
+    times = array("d")
+    limit = 0.0
+    start = 0
+    lookahead = min(chunkSize, 1000)                                            # (grows when it is too short)
+    while start < segmentCount:
+        end = min(start + chunkSize, segmentCount)
+        first = max(start - 1, 0)
+        while True:
+            last = min(end + lookahead, segmentCount)
+            chunk = dict((name, columns[name][first:last]) for name in ("dX", "dY", "dZ", "dE", "feedrate", "stop"))
+            lengths, nominal, acceleration, entryMax2 = entry_limits(chunk, settings)
+            lengths, nominal, acceleration, entryMax2 = [values[start - first:] 
+                                                         for values in (lengths, nominal, acceleration, entryMax2)]
+            twoAL = [2.0 * a * length for a, length in zip(acceleration, lengths)] if numpy is None else 2.0 * acceleration * lengths
+            if last == segmentCount:
+                cut = len(entryMax2)
+                break
+            cut = find_lookahead_end(entryMax2, twoAL, end - start)
+            if cut is not None:
+                break
+            lookahead *= 2
+
+        chunkTimes, limit = plan(entryMax2[:cut], twoAL[:cut], nominal, acceleration, lengths, limit, end - start)
+        times.extend(chunkTimes)
+        start = end
+    return times
+
+
+def format_duration(seconds):
+    """Returns a duration (s) as a string, like '2h 05m 09s'"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{0}h {1:02d}m {2:02d}s".format(hours, minutes, seconds)
+
+
+def estimate_print_time(standardGcode, settings=None):
+    """Estimate how long it takes to print a list of resolved Gcode instances.
+    
+    The moves are planned as the firmware of the printer would (see 
+    'plan_moves'), with acceleration, junction speeds and lookahead. The
+    time of dwells (G4) and tool changes is added; the time to heat up 
+    (M109, M190) and to home (G28) is unknown, and not included.
+    
+    standardGcode   :   list of resolved Gcode instances, for example of 
+                        an extruder, or of the merged extruders of a machine
+    settings        :   dict with the machine settings to use instead of 
+                        those in 'printerSettings'
+    
+    return          :   a dict with:
+                        total       :   the estimated print time (s)
+                        moves       :   the time (s) of the moves
+                        extruding   :   the time (s) of the moves that extrude
+                        travel      :   the time (s) of the other moves
+                        dwell       :   the time (s) of the dwells
+                        toolChanges :   the time (s) of the tool changes
+                        segments    :   the amount of planned segments
+                        layers      :   dict with the time (s) per layer key 
+                                        (see 'Gcode_parser.iter_layer_keys')
+                        tools       :   dict with the time (s) per tool
+    """
+    settings = dict(printerSettings, **(settings or {}))
+    startTime = time.time()
+    columns = get_move_columns(standardGcode)
+    times = plan_moves(columns, settings)
+
+    layers = dict()
+    tools = dict()
+    extruding = 0.0
+    for seconds, layerKey, tool, dE in zip(times, columns["layer"], columns["tool"], columns["dE"]):
+        layers[layerKey] = layers.get(layerKey, 0.0) + seconds
+        tools[tool] = tools.get(tool, 0.0) + seconds
+        if dE > 0.0:
+            extruding += seconds
+    extraTime = [(key, seconds) for key, seconds in columns["dwellTime"].items()]
+    extraTime.extend((key, count * settings["toolChangeTime"]) for key, count in columns["toolChanges"].items())
+    for (layerKey, tool), seconds in extraTime:
+        layers[layerKey] = layers.get(layerKey, 0.0) + seconds
+        tools[tool] = tools.get(tool, 0.0) + seconds
+
+    moves = sum(times)
+    result = {"moves": moves,
+              "extruding": extruding,
+              "travel": moves - extruding,
+              "dwell": sum(columns["dwellTime"].values(), 0.0),
+              "toolChanges": sum(columns["toolChanges"].values()) * settings["toolChangeTime"],
+              "segments": len(times),
+              "layers": layers,
+              "tools": tools}
+    result["total"] = moves + result["dwell"] + result["toolChanges"]
+    print("OK: estimated print time {0} ({1} segments planned in {2:.2f} s)".format(
+          format_duration(result["total"]), len(times), time.time() - startTime))
+    return result
+
+
+# ----- statistics -----
+def sum_statistics_cells(columns, times):
+    """Sum the move columns and planned times per (layer key, tool) cell, in a single pass.
+    
+    return  :   dict with a list per (layer key, tool): the filament, extrusion distance, 
+                travel distance, retractions, tool changes (0 here), time, and 
+                minX, minY, minZ, maxX, maxY, maxZ of the extruding moves
+    """
+    sqrt = math.sqrt
+    inf = float("inf")
+    cells = dict()
+    cellKey = cell = None
+    lastE = 0.0
+    for x, y, z, e, endX, endY, endZ, layerKey, tool, seconds in zip(
+            columns["dX"], columns["dY"], columns["dZ"], columns["dE"], columns["X"], columns["Y"], columns["Z"],
+            columns["layer"], columns["tool"], times):
+        if (layerKey, tool) != cellKey:
+            cellKey = (layerKey, tool)
+            cell = cells.get(cellKey)
+            if cell is None:
+                cell = cells[cellKey] = [0.0, 0.0, 0.0, 0, 0, 0.0, inf, inf, inf, -inf, -inf, -inf]
+        cell[0] += e
+        cell[5] += seconds
+        distance = sqrt(x * x + y * y + z * z)
+        if e > 0.0 and distance > 0.0:
+            cell[1] += distance
+            for axis, end, delta in ((0, endX, x), (1, endY, y), (2, endZ, z)):
+                low, high = (end - delta, end) if delta > 0.0 else (end, end - delta)
+                if low < cell[6 + axis]:
+                    cell[6 + axis] = low
+                if high > cell[9 + axis]:
+                    cell[9 + axis] = high
+        else:
+            cell[2] += distance
+            if e < 0.0 and lastE >= 0.0:                                        # the first segment of a retraction
+                cell[3] += 1
+        lastE = e
+    return cells
+
+
+def sum_statistics_cells_numpy(columns, times):
+    """The same as 'sum_statistics_cells', with numpy arrays.
+    
+    Every segment gets the number of its cell (with 'numpy.unique'); the 
+    sums are 'numpy.bincount' with weights, which adds up the values of a
+    cell in the same order as the loop, and the bounding boxes are 
+    'numpy.minimum.at' and 'numpy.maximum.at'.
+    """
+    if len(columns["dX"]) == 0:
+        return dict()
+    dX, dY, dZ, dE, endX, endY, endZ, layers, tools = [numpy.asarray(columns[name], dtype=numpy.float64) for name in 
+                                                       ("dX", "dY", "dZ", "dE", "X", "Y", "Z", "layer", "tool")]
+    # (the segments come in runs of the same cell: only the runs are sorted)
+    runStarts = numpy.flatnonzero(numpy.concatenate(([True], (layers[1:] != layers[:-1]) | (tools[1:] != tools[:-1]))))
+    keys, runCellNrs = numpy.unique(numpy.stack((layers[runStarts], tools[runStarts])), axis=1, return_inverse=True)
+    cellNrs = numpy.repeat(runCellNrs.reshape(-1), numpy.diff(numpy.append(runStarts, len(layers))))
+    cellCount = keys.shape[1]
+
+    def cell_sums(weights, selection=None):
+        if selection is None:
+            return numpy.bincount(cellNrs, weights, cellCount)
+        return numpy.bincount(cellNrs[selection], weights[selection], cellCount)
+
+    distance = numpy.sqrt(dX * dX + dY * dY + dZ * dZ)
+    extruding = (dE > 0.0) & (distance > 0.0)
+    previousE = numpy.concatenate(([0.0], dE[:-1]))
+    retractions = (dE < 0.0) & (previousE >= 0.0)                               # the first segment of a retraction
+    sums = [cell_sums(dE), cell_sums(distance, extruding), cell_sums(distance, ~extruding),
+            numpy.bincount(cellNrs[retractions], minlength=cellCount), numpy.zeros(cellCount),
+            cell_sums(numpy.asarray(times, dtype=numpy.float64))]
+    lows, highs = [], []
+    for end, delta in ((endX, dX), (endY, dY), (endZ, dZ)):
+        low, high = numpy.full(cellCount, numpy.inf), numpy.full(cellCount, -numpy.inf)
+        numpy.minimum.at(low, cellNrs[extruding], numpy.minimum(end, end - delta)[extruding])
+        numpy.maximum.at(high, cellNrs[extruding], numpy.maximum(end, end - delta)[extruding])
+        lows.append(low)
+        highs.append(high)
+
+    cells = dict()
+    values = zip(*[column.tolist() for column in sums + lows + highs])
+    for layerKey, tool, cellValues in zip(keys[0].tolist(), keys[1].tolist(), values):
+        cell = list(cellValues)
+        cell[3], cell[4] = int(cell[3]), int(cell[4])
+        cells[layerKey, int(tool)] = cell
+    return cells
+
+
+def compute_statistics(standardGcode, settings=None, columns=None):
+    """Compute the statistics of a list of resolved Gcode instances, per layer and per tool.
+    
+    The move columns (see 'get_move_columns') and the planned time of every
+    segment (see 'plan_moves') are summed per (layer key, tool) cell (see 
+    'sum_statistics_cells', or 'sum_statistics_cells_numpy' with numpy); 
+    the layers, tools and the total are then merged from the cells. The 
+    statistics of a layer, a tool, or the total are a dict with:
+    
+        filamentLength      :   the filament (mm) that is used: the extrusion
+                                minus the retractions
+        filamentMass        :   the mass (g) of that filament
+        extrusionDistance   :   the distance (mm) moved while extruding
+        travelDistance      :   the distance (mm) moved without extruding
+        retractions         :   the amount of retractions
+        toolChanges         :   the amount of tool changes
+        time                :   the estimated time (s), see 'estimate_print_time'
+        boundingBox         :   [minX, minY, minZ, maxX, maxY, maxZ] of the 
+                                extruding moves, or None if nothing is extruded
+    
+    standardGcode   :   list (or iterator) of resolved Gcode instances
+    settings        :   dict with the settings to use instead of those in 
+                        'printerSettings'; the filament settings are used 
+                        for the mass
+    columns         :   the move columns of 'standardGcode', if these are made
+                        already (see 'iter_move_columns'); 'standardGcode' 
+                        is then not used
+    
+    return          :   dict with:
+                        total   :   the statistics of all commands
+                        layers  :   dict with the statistics per layer key (see 
+                                    'Gcode_parser.iter_layer_keys')
+                        tools   :   dict with the statistics per tool
+    """
+    settings = dict(printerSettings, **(settings or {}))
+    inf = float("inf")
+    startTime = time.time()
+    if columns is None:
+        columns = get_move_columns(standardGcode)
+    times = plan_moves(columns, settings)
+
+    def new_cell():
+        # filament, extrusion distance, travel distance, retractions, tool changes, time, 
+        # minX, minY, minZ, maxX, maxY, maxZ
+        return [0.0, 0.0, 0.0, 0, 0, 0.0, inf, inf, inf, -inf, -inf, -inf]
+
+    # 1. sum the segments per (layer key, tool)
+    if numpy is not None:
+        cells = sum_statistics_cells_numpy(columns, times)
+    else:
+        cells = sum_statistics_cells(columns, times)
+    for key, seconds in columns["dwellTime"].items():
+        cells.setdefault(key, new_cell())[5] += seconds
+    for key, count in columns["toolChanges"].items():
+        cell = cells.setdefault(key, new_cell())
+        cell[4] += count
+        cell[5] += count * settings["toolChangeTime"]
+
+    # 2. merge the cells
+    def merge(cellList):
+        merged = new_cell()
+        for cell in cellList:
+            for index in range(6):
+                merged[index] += cell[index]
+            for index in range(6, 9):
+                merged[index] = min(merged[index], cell[index])
+                merged[index + 3] = max(merged[index + 3], cell[index + 3])
+        return merged
+
+    gramPerMm = math.pi * (settings["filamentDiameter"] / 2.0) ** 2 / 1000.0 * settings["filamentDensity"]
+
+    def as_dict(cell):
+        return {"filamentLength": cell[0],
+                "filamentMass": cell[0] * gramPerMm,
+                "extrusionDistance": cell[1],
+                "travelDistance": cell[2],
+                "retractions": cell[3],
+                "toolChanges": cell[4],
+                "time": cell[5],
+                "boundingBox": cell[6:12] if cell[6] <= cell[9] else None}
+
+    layers = dict()
+    tools = dict()
+    for (layerKey, tool), cell in cells.items():
+        layers.setdefault(layerKey, []).append(cell)
+        tools.setdefault(tool, []).append(cell)
+    statistics = {"total": as_dict(merge(cells.values())),
+                  "layers": dict((layerKey, as_dict(merge(cellList))) for layerKey, cellList in layers.items()),
+                  "tools": dict((tool, as_dict(merge(cellList))) for tool, cellList in tools.items())}
+    print("OK: statistics of {0} segments, {1} layers and {2} tools computed ({3:.2f} s)".format(
+          len(times), len(layers), len(tools), time.time() - startTime))
+    return statistics
+
+
+def format_statistics(statistics, perLayer=False):
+    """Returns the statistics (see 'compute_statistics') as a list of lines of text.
+    
+    The totals come first, then a line per tool if there is more than one
+    tool. With 'perLayer', a line per layer is added as well.
+    """
+    def describe(values):
+        return "{0:.2f} m filament ({1:.1f} g), {2}, {3:.1f} m extruding, {4:.1f} m travel, {5} retractions".format(
+                values["filamentLength"] / 1000.0, values["filamentMass"], format_duration(values["time"]),
+                values["extrusionDistance"] / 1000.0, values["travelDistance"] / 1000.0, values["retractions"])
+
+    total = statistics["total"]
+    lines = ["Filament: {0:.2f} m ({1:.1f} g)".format(total["filamentLength"] / 1000.0, total["filamentMass"]),
+             "Print time: " + format_duration(total["time"]),
+             "Extruding: {0:.1f} m, travel: {1:.1f} m".format(total["extrusionDistance"] / 1000.0, 
+                                                             total["travelDistance"] / 1000.0),
+             "Retractions: {0}, tool changes: {1}".format(total["retractions"], total["toolChanges"]),
+             "Layers: {0}".format(sum(1 for layerKey in statistics["layers"] if abs(layerKey) != float("inf")))]
+    if total["boundingBox"] is not None:
+        box = total["boundingBox"]
+        lines.append("Size: {0:.1f} x {1:.1f} x {2:.1f} mm".format(box[3] - box[0], box[4] - box[1], box[5] - box[2]))
+    if len(statistics["tools"]) > 1:
+        for tool in sorted(statistics["tools"]):
+            lines.append("T{0}: ".format(tool) + describe(statistics["tools"][tool]))
+    if perLayer:
+        for layerKey in sorted(statistics["layers"]):
+            name = {float("-inf"): "start", float("inf"): "end"}.get(layerKey, "Z={0:g}".format(layerKey))
+            lines.append(name + ": " + describe(statistics["layers"][layerKey]))
+    return lines
+
+
+# ----- volumetric flow -----
+flowBinCount = 8                                                                # the colors from no flow up to the maximum flow
+
+
+def get_filament_area(settings=None):
+    """Returns the cross-section (mm2) of the filament"""
+    settings = dict(printerSettings, **(settings or {}))
+    return math.pi * (settings["filamentDiameter"] / 2.0) ** 2
+
+
+def compute_flow(columns, settings=None):
+    """Returns an array with the volumetric flow (mm3/s) of every segment.
+    
+    The flow is the filament volume of a segment divided by the time it 
+    takes at its nominal speed (see 'get_segment_limits'): the flow the 
+    hotend has to melt while the segment is printed at full speed. Travel
+    moves, and moves of the extruder only (retractions), have no flow.
+    
+    columns     :   the move columns (see 'get_move_columns')
+    settings    :   dict with the settings to use instead of those in 'printerSettings'
+    """
+    area = get_filament_area(settings)
+    if numpy is not None:
+        planar, lengths, nominal, acceleration = get_segment_limits_numpy(columns, dict(printerSettings, **(settings or {})))
+        dE = numpy.asarray(columns["dE"], dtype=numpy.float64)
+        with numpy.errstate(divide="ignore", invalid="ignore"):                # (the values of the other branch of 'where')
+            flows = numpy.where((dE > 0.0) & (planar > 0.0), area * dE * nominal / planar, 0.0)
+        return array("d", flows.tolist())
+    planar, lengths, nominal, acceleration = get_segment_limits(columns, settings)
+    return array("d", [area * e * v / p if e > 0.0 and p > 0.0 else 0.0 
+                       for e, v, p in zip(columns["dE"], nominal, planar)])
+
+
+def find_flow_hotspots(standardGcode, maxFlow=None, settings=None, columns=None):
+    """Find the moves that need more volumetric flow than the hotend can melt.
+    
+    standardGcode   :   list (or iterator) of resolved Gcode instances
+    maxFlow         :   the maximum flow (mm3/s); settings["maxVolumetricFlow"] if None
+    settings        :   dict with the settings to use instead of those in 'printerSettings'
+    columns         :   the move columns of 'standardGcode', if these are made
+                        already (see 'iter_move_columns'); 'standardGcode' 
+                        is then not used
+    
+    return          :   a dict with:
+                        peakFlow    :   the highest flow (mm3/s) of all segments
+                        maxFlow     :   the threshold that is used
+                        segments    :   the amount of segments above the threshold
+                        hotspots    :   list of (layer key, line number, flow) tuples, 
+                                        one per move above the threshold, in file order
+                        layers      :   dict with (amount of moves, peak flow) per layer 
+                                        key, for the layers with hotspots
+    """
+    settings = dict(printerSettings, **(settings or {}))
+    if maxFlow is None:
+        maxFlow = settings["maxVolumetricFlow"]
+    if columns is None:
+        columns = get_move_columns(standardGcode)
+    flows = compute_flow(columns, settings)
+
+    hotspots = []
+    layers = dict()
+    segmentCount = 0
+    lastLineNr = None
+    for flow, layerKey, lineNr in zip(flows, columns["layer"], columns["lineNr"]):
+        if flow <= maxFlow:
+            continue
+        segmentCount += 1
+        newMove = (lineNr != lastLineNr)                                        # (an arc move has several segments)
+        if newMove:
+            hotspots.append((layerKey, lineNr, flow))
+        elif flow > hotspots[-1][2]:
+            hotspots[-1] = (layerKey, lineNr, flow)
+        count, peak = layers.get(layerKey, (0, 0.0))
+        layers[layerKey] = (count + newMove, max(peak, flow))
+        lastLineNr = lineNr
+
+    result = {"peakFlow": max(flows) if len(flows) > 0 else 0.0,
+              "maxFlow": maxFlow,
+              "segments": segmentCount,
+              "hotspots": hotspots,
+              "layers": layers}
+    print("OK: peak flow {0:.1f} mm3/s; {1} moves on {2} layers above {3:.1f} mm3/s".format(
+          result["peakFlow"], len(hotspots), len(layers), maxFlow))
+    return result
+
+
+def format_flow_hotspots(report, maxLines=20):
+    """Returns a flow report (see 'find_flow_hotspots') as a list of lines of text.
+    
+    A line per layer with hotspots, and a line per move for the first 
+    'maxLines' moves.
+    """
+    lines = ["Peak flow {0:.1f} mm3/s; {1} moves above {2:.1f} mm3/s".format(
+             report["peakFlow"], len(report["hotspots"]), report["maxFlow"])]
+    for layerKey in sorted(report["layers"]):
+        count, peak = report["layers"][layerKey]
+        lines.append("  layer Z={0:g}: {1} moves, up to {2:.1f} mm3/s".format(layerKey, count, peak))
+    for layerKey, lineNr, flow in report["hotspots"][:maxLines]:
+        lines.append("  line {0}: {1:.1f} mm3/s".format(lineNr, flow))
+    if len(report["hotspots"]) > maxLines:
+        lines.append("  ... and {0} more moves".format(len(report["hotspots"]) - maxLines))
+    return lines
+
+
+def get_flow_bin(flow, maxFlow, binCount=flowBinCount):
+    """Returns the color bin (0 .. binCount) of a flow; flows above 'maxFlow' get 'binCount'"""
+    if flow > maxFlow:
+        return binCount
+    return min(int(binCount * flow / maxFlow), binCount - 1)
+
+
+def split_splines_by_flow(commands, maxFlow, settings=None):
+    """Split the commands of a layer in splines, and split these where the color of their flow changes.
+    
+    Every move gets the bin (see 'get_flow_bin') of its volumetric flow, as
+    computed by 'compute_flow': the same flow as in the report of 
+    'find_flow_hotspots', so the colors agree with it. An arc move with 
+    several segments gets the bin of its highest flow. The splines of 
+    'Gcode_parser.split_splines' are split where the bin changes; a new 
+    spline starts at the last point of the previous one, so the splines 
+    stay connected. 
+    
+    commands    :   the Gcode instances of a layer, in the order of the file
+    maxFlow     :   the flow (mm3/s) of the highest bin
+    settings    :   dict with the settings to use instead of those in 'printerSettings'
+    
+    return      :   (splines, bins): lists of Gcode instances, and the bin of every spline
+    """
+    columns = get_move_columns(commands)
+    flows = compute_flow(columns, settings)
+    if numpy is not None:
+        flowArray = numpy.asarray(flows)
+        segmentBins = numpy.minimum((flowBinCount * flowArray / maxFlow).astype(int), flowBinCount - 1)
+        segmentBins[flowArray > maxFlow] = flowBinCount
+        commandBins = numpy.zeros(len(commands), dtype=int)
+        numpy.maximum.at(commandBins, numpy.asarray(columns["commandNr"]), segmentBins)
+        commandBins = commandBins.tolist()
+    else:
+        commandBins = [0] * len(commands)
+        for flow, commandNr in zip(flows, columns["commandNr"]):
+            flowBin = get_flow_bin(flow, maxFlow)
+            if flowBin > commandBins[commandNr]:
+                commandBins[commandNr] = flowBin
+    flowBins = dict(zip(map(id, commands), commandBins))                        # id(Gcode instance): flow bin
+
+    newSplines = []
+    bins = []
+    for spline in Gcode_parser.split_splines(commands):
+        current = None
+        for indexNr in range(1, len(spline)):
+            flowBin = flowBins.get(id(spline[indexNr]), 0)
+            if flowBin != current:
+                newSplines.append([spline[indexNr - 1]])
+                bins.append(flowBin)
+                current = flowBin
+            newSplines[-1].append(spline[indexNr])
+    return newSplines, bins
@@ -0,0 +1,350 @@
+#! /usr/bin/env python3 
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+"""
+Export the toolpath of a .gcode file as a mesh, without Blender.
+
+The Gcode is parsed by 'Gcode_parser.py', layer by layer. The splines of every
+layer are turned into a mesh of lines (one edge per move), or of tubes (a 
+ring of vertices around every point, connected by quads). The mesh is written
+as binary PLY or as binary glTF (.glb), which can be opened by most 3D 
+software and by web viewers.
+
+Both formats need the total size of the mesh at the start of the file. The
+mesh of each layer is therefore written to temporary files first, and only
+copied into the output file when all layers are done. Only the mesh of a 
+single layer is kept in memory.
+
+Use from the command line:
+    python3 Gcode_mesh_export.py model.gcode model.glb --style tubes --radius 0.2
+"""
+
+# ----- imports -----
+import argparse
+import json
+import math
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+try:
+    from . import Gcode_parser
+except (ImportError, SystemError, ValueError):
+    # not loaded as part of the Blender add-on, but as a script
+    import Gcode_parser
+
+
+# ----- mesh building -----
+def build_line_mesh(geometry):
+    """Returns the line mesh of a 'LayerGeometry': (vertices, edges).
+    
+    vertices    :   flat array('f') with x, y, z of every spline point
+    edges       :   flat array('I') with the two vertex indices of every move
+    """
+    vertices = array('f', geometry.coordinates)
+    edges = array('I')
+    start = 0
+    for pointCount in geometry.splineLengths:
+        for indexNr in range(start, start + pointCount - 1):
+            edges.append(indexNr)
+            edges.append(indexNr + 1)
+        start += pointCount
+    return vertices, edges
+
+
+def build_tube_mesh(geometry, radius=0.2, sides=6):
+    """Returns the tube mesh of a 'LayerGeometry': (vertices, quads).
+    
+    Every spline point gets a ring of 'sides' vertices, at distance 'radius' 
+    (mm) and perpendicular to the direction of the toolpath (the average of 
+    the moves before and after the point). The rings of a spline are 
+    connected by quads; the tube ends are open.
+    
+    vertices    :   flat array('f') with x, y, z of every ring vertex
+    quads       :   flat array('I') with the four vertex indices of every quad
+    """
+    vertices = array('f')
+    quads = array('I')
+    angles = [2.0 * math.pi * sideNr / sides for sideNr in range(sides)]
+    ring = [(radius * math.cos(angle), radius * math.sin(angle)) for angle in angles]
+
+    for spline in geometry.iter_splines():
+        points = [spline[indexNr:indexNr + 3] for indexNr in range(0, len(spline), 3)]
+        firstVertex = len(vertices) // 3
+        for pointNr, (x, y, z) in enumerate(points):
+            prevX, prevY, prevZ = points[max(pointNr - 1, 0)]
+            nextX, nextY, nextZ = points[min(pointNr + 1, len(points) - 1)]
+            tx, ty, tz = nextX - prevX, nextY - prevY, nextZ - prevZ           # tangent
+            length = math.sqrt(tx * tx + ty * ty + tz * tz) or 1.0
+            tx, ty, tz = tx / length, ty / length, tz / length
+
+            # normal: horizontal, perpendicular to the tangent (cross product with the Z axis)
+            nx, ny, nz = ty, -tx, 0.0
+            length = math.sqrt(nx * nx + ny * ny)
+            if length < 1e-9:                                                   # a vertical move
+                nx, ny, length = 1.0, 0.0, 1.0
+            nx, ny = nx / length, ny / length
+            # binormal: cross product of the normal and the tangent
+            bx, by, bz = ny * tz - nz * ty, nz * tx - nx * tz, nx * ty - ny * tx
+
+            for cosPart, sinPart in ring:
+                vertices.extend((x + cosPart * nx + sinPart * bx, 
+                                 y + cosPart * ny + sinPart * by, 
+                                 z + cosPart * nz + sinPart * bz))
+
+        for pointNr in range(len(points) - 1):
+            ringStart = firstVertex + pointNr * sides
+            for sideNr in range(sides):
+                nextSide = (sideNr + 1) % sides
+                quads.extend((ringStart + sideNr, ringStart + nextSide, 
+                              ringStart + sides + nextSide, ringStart + sides + sideNr))
+    return vertices, quads
+
+
+def quads_to_triangles(quads):
+    """Returns a flat array('I') with two triangles for every quad"""
+    triangles = array('I')
+    for indexNr in range(0, len(quads), 4):
+        a, b, c, d = quads[indexNr:indexNr + 4]
+        triangles.extend((a, b, c, a, c, d))
+    return triangles
+
+
+# ----- mesh files -----
+class MeshExport:
+    """Write the mesh of a toolpath to a binary PLY or glb file, layer by layer.
+    
+    Add the layers with 'add_layer'; the mesh is written to temporary files 
+    right away. 'close' writes the output file. Use it as a context manager
+    to close it automatically.
+    
+    Variables:
+        filename        :   the output file
+        fileFormat      :   'ply' or 'glb'
+        style           :   'lines' or 'tubes'
+        radius, sides   :   the size and amount of sides of the tubes
+        vertexCount     :   the amount of vertices written so far
+        elementCount    :   the amount of edges (lines), or faces (tubes) written so far
+        bounds          :   [minX, minY, minZ, maxX, maxY, maxZ] of the vertices,
+                            as written to the file
+    
+    NOTE: glTF uses the Y axis as 'up', and meters as unit. The glb output is
+          rotated accordingly, and its coordinates are scaled from mm to m.
+    """
+
+    def __init__(self, filename, fileFormat=None, style="lines", radius=0.2, sides=6):
+        """Prepare the export; 'fileFormat' is taken from the file name if not given"""
+        if fileFormat is None:
+            fileFormat = os.path.splitext(filename)[1].lower().lstrip(".")
+        if fileFormat not in ("ply", "glb"):
+            raise ValueError("unknown mesh format '{0}', use 'ply' or 'glb'".format(fileFormat))
+        if style not in ("lines", "tubes"):
+            raise ValueError("unknown mesh style '{0}', use 'lines' or 'tubes'".format(style))
+
+        self.filename = filename
+        self.fileFormat = fileFormat
+        self.style = style
+        self.radius = radius
+        self.sides = sides
+        self.vertexCount = 0
+        self.elementCount = 0
+        self.bounds = [float("inf")] * 3 + [float("-inf")] * 3
+        self.vertexFile = tempfile.TemporaryFile()
+        self.indexFile = tempfile.TemporaryFile()
+
+    def __repr__(self):
+        """return a representation of the 'MeshExport' instance"""
+        return "<MeshExport '{0.filename}' ({0.fileFormat}, {0.style}): {0.vertexCount} vertices>".format(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+        else:                                                                   # do not write a partial file
+            self.vertexFile.close()
+            self.indexFile.close()
+
+    def add_layer(self, geometry):
+        """Add the mesh of a 'LayerGeometry' to the export"""
+        if self.style == "lines":
+            vertices, indices = build_line_mesh(geometry)
+            perElement = 2
+        else:
+            vertices, indices = build_tube_mesh(geometry, self.radius, self.sides)
+            perElement = 4
+        if len(vertices) == 0:
+            return
+
+        offset = self.vertexCount
+        self.vertexCount += len(vertices) // 3
+        self.elementCount += len(indices) // perElement
+        indices = array('I', [indexNr + offset for indexNr in indices])
+
+        if self.fileFormat == "glb":
+            # glTF: Y is up, and the unit is meter
+            vertices = array('f', [value / 1000.0 for value in vertices])
+            vertices[1::3], vertices[2::3] = vertices[2::3], array('f', [-value for value in vertices[1::3]])
+            if self.style == "tubes":
+                indices = quads_to_triangles(indices)
+        elif self.style == "tubes":
+            indices = self.pack_ply_faces(indices)
+
+        for axisNr in range(3):
+            column = vertices[axisNr::3]
+            self.bounds[axisNr] = min(self.bounds[axisNr], min(column))
+            self.bounds[axisNr + 3] = max(self.bounds[axisNr + 3], max(column))
+
+        if sys.byteorder != "little":
+            vertices.byteswap()
+            if isinstance(indices, array):
+                indices.byteswap()
+        vertices.tofile(self.vertexFile)
+        if isinstance(indices, array):
+            indices.tofile(self.indexFile)
+        else:
+            self.indexFile.write(indices)
+
+    @staticmethod
+    def pack_ply_faces(quads):
+        """Returns the PLY face records (a count byte, and 4 vertex indices) of a quads array"""
+        if sys.byteorder != "little":
+            quads = array('I', quads)
+            quads.byteswap()
+        quadBytes = quads.tobytes()
+        faceCount = len(quads) // 4
+        faces = bytearray(17 * faceCount)
+        faces[0::17] = b"\x04" * faceCount
+        for byteNr in range(16):                                                # move every byte of the 16-byte quads in place
+            faces[1 + byteNr::17] = quadBytes[byteNr::16]
+        return faces
+
+    def close(self):
+        """Write the output file, and remove the temporary files"""
+        self.vertexFile.seek(0)
+        self.indexFile.seek(0)
+        with open(self.filename, mode="wb") as meshFile:
+            if self.fileFormat == "ply":
+                self.write_ply_header(meshFile)
+                shutil.copyfileobj(self.vertexFile, meshFile, 1 << 20)
+                shutil.copyfileobj(self.indexFile, meshFile, 1 << 20)
+            else:
+                self.write_glb(meshFile)
+        self.vertexFile.close()
+        self.indexFile.close()
+
+    def write_ply_header(self, meshFile):
+        """Write the header of a binary PLY file"""
+        header = ["ply", "format binary_little_endian 1.0", "comment toolpath exported by Gcode_mesh_export",
+                  "element vertex {0}".format(self.vertexCount),
+                  "property float x", "property float y", "property float z"]
+        if self.style == "lines":
+            header += ["element edge {0}".format(self.elementCount), 
+                       "property uint vertex1", "property uint vertex2"]
+        else:
+            header += ["element face {0}".format(self.elementCount), 
+                       "property list uchar uint vertex_indices"]
+        header.append("end_header\n")
+        meshFile.write("\n".join(header).encode("ascii"))
+
+    def write_glb(self, meshFile):
+        """Write a binary glTF file: a JSON chunk with the scene, and a BIN chunk with the mesh"""
+        vertexBytes = self.vertexCount * 12
+        indexCount = self.elementCount * (2 if self.style == "lines" else 6)
+        indexBytes = indexCount * 4
+        if self.vertexCount > 0:
+            minimum, maximum = self.bounds[:3], self.bounds[3:]
+        else:
+            minimum = maximum = [0.0, 0.0, 0.0]
+
+        gltf = {"asset": {"version": "2.0", "generator": "Gcode_mesh_export"},
+                "scene": 0, 
+                "scenes": [{"nodes": [0]}],
+                "nodes": [{"mesh": 0, "name": os.path.splitext(os.path.basename(self.filename))[0]}],
+                "meshes": [{"primitives": [{"attributes": {"POSITION": 0}, "indices": 1,
+                                            "mode": 1 if self.style == "lines" else 4}]}],
+                "buffers": [{"byteLength": vertexBytes + indexBytes}],
+                "bufferViews": [{"buffer": 0, "byteOffset": 0, "byteLength": vertexBytes, "target": 34962},
+                                {"buffer": 0, "byteOffset": vertexBytes, "byteLength": indexBytes, "target": 34963}],
+                "accessors": [{"bufferView": 0, "componentType": 5126, "count": self.vertexCount, 
+                               "type": "VEC3", "min": minimum, "max": maximum},
+                              {"bufferView": 1, "componentType": 5125, "count": indexCount, "type": "SCALAR"}]}
+        jsonChunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+        jsonChunk += b" " * (-len(jsonChunk) % 4)                               # chunks are 4-byte aligned
+        binLength = vertexBytes + indexBytes                                    # (a multiple of 4 already)
+
+        meshFile.write(struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(jsonChunk) + 8 + binLength))
+        meshFile.write(struct.pack("<I4s", len(jsonChunk), b"JSON"))
+        meshFile.write(jsonChunk)
+        meshFile.write(struct.pack("<I4s", binLength, b"BIN\0"))
+        shutil.copyfileobj(self.vertexFile, meshFile, 1 << 20)
+        shutil.copyfileobj(self.indexFile, meshFile, 1 << 20)
+
+
+def export_mesh(gcodeFile, meshFile, style="lines", radius=0.2, sides=6, 
+                chunkSize=2000, simplifyTolerance=0.0):
+    """Parse a .gcode file, and export its toolpath as a mesh.
+    
+    The layers are added to the mesh while the file is parsed 
+    (see 'Machine.iter_add_extruder_layers'), and the Gcode commands of
+    every layer are dropped once the layer is added.
+    
+    return  :   the 'MeshExport' instance (closed)
+    """
+    startTime = time.time()
+    myMachine = Gcode_parser.Machine()
+    with MeshExport(meshFile, style=style, radius=radius, sides=sides) as export:
+        for progress, layers in myMachine.iter_add_extruder_layers(gcodeFile, chunkSize, simplifyTolerance, 
+                                                                   keepCommands=False):
+            for geometry in layers:
+                export.add_layer(geometry)
+    print("OK: '{0}' exported to '{1}': {2} vertices, {3} {4} in {5:.2f} s".format(gcodeFile, meshFile, 
+                export.vertexCount, export.elementCount, "edges" if style == "lines" else "faces", 
+                time.time() - startTime))
+    return export
+
+
+def main(argv=None):
+    """The command line entry point"""
+    parser = argparse.ArgumentParser(description="Export the toolpath of a .gcode file as a PLY or glb mesh.")
+    parser.add_argument("gcode", help="the .gcode file (may be compressed: .gz, .xz, .bz2)")
+    parser.add_argument("mesh", help="the output file (.ply or .glb)")
+    parser.add_argument("--style", choices=("lines", "tubes"), default="lines", 
+                        help="export every move as a line, or as a tube (default: lines)")
+    parser.add_argument("--radius", type=float, default=0.2, help="the radius of the tubes in mm (default: 0.2)")
+    parser.add_argument("--sides", type=int, default=6, help="the amount of sides of the tubes (default: 6)")
+    parser.add_argument("--simplify", type=float, default=0.0, 
+                        help="simplify the splines with this tolerance in mm (default: 0, off)")
+    args = parser.parse_args(argv)
+
+    export_mesh(args.gcode, args.mesh, style=args.style, radius=args.radius, sides=max(args.sides, 3), 
+                simplifyTolerance=args.simplify)
+    return 0
+
+
+# ----- the body of the program -----
+if __name__ == "__main__":
+    sys.exit(main())
@@ -56,6 +56,35 @@ Ultimaker or Makerbot.
 
 """
 
+# ----- imports -----
+import base64
+import binascii
+import bz2
+import copy
+import gzip
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+
+try:
+    import lzma                                                                 # new in Python 3.3
+except ImportError:
+    lzma = None
+
+try:
+    import numpy                                                                # optional: for the arcs and 'simplify'
+except ImportError:
+    numpy = None
+
+
 # ----- class definitions -----
 class Reprap_Gcode:
     """Store information of Reprap-specific Gcode commands.
@@ -72,6 +101,17 @@ class Reprap_Gcode:
         """
         return cmd
         
+    def gcode_arc_move(cmd):
+        """Return the action on a clockwise (G2) or counter-clockwise (G3) arc move.
+        
+        Example: G2 X90.6 Y13.8 I5 J10 E22.4
+        The arc starts at the current position, and ends at X, Y. The center
+        is either given by I and J (offsets from the start position), or by R 
+        (the radius). The intermediate points of the arc can only be computed
+        when the start position is known; see 'tessellate_arcs'.
+        """
+        return cmd
+
     def gcode_set_units_to_inch(cmd):
         """Change the 'units' parameter to 'inch' """
         cmd.parameters["units"] = "inch"
@@ -94,10 +134,7 @@ class Reprap_Gcode:
     def gcode_select_tool(cmd):
         """Select the tool. In the case of RepRap Gcode, tools are extruders.
         """
-        if cmd.command == "T0":
-            cmd.T = 0
-        if cmd.command == "T1":
-            cmd.T = 1
+        cmd.T = int(cmd.command[1:])
         return cmd
     
     def gcode_move_to_origin(cmd):
@@ -223,8 +260,10 @@ class Reprap_Gcode:
                     # Gnnn 	Standard GCode command, such as move to a point
                     'G0'    : gcode_move,                                           # rapid move, but treated as G1
                     'G1'    : gcode_move,
-    #                'G4'    : gcode_dwell,
-    #                'G04'   : gcode_dwell,
+                    'G2'    : gcode_arc_move,                                       # clockwise arc
+                    'G3'    : gcode_arc_move,                                       # counter-clockwise arc
+                    'G4'    : gcode_dwell,
+                    'G04'   : gcode_dwell,
                     'G20'   : gcode_set_units_to_inch,
                     'G21'   : gcode_set_units_to_mm,
                     'G28'   : gcode_move_to_origin,
@@ -247,7 +286,13 @@ class Reprap_Gcode:
     
                     # Tnnn 	Select tool nnn. In RepRap, tools are extruders
                     'T0'    : gcode_select_tool,
-                    'T1'    : gcode_select_tool
+                    'T1'    : gcode_select_tool,
+                    'T2'    : gcode_select_tool,
+                    'T3'    : gcode_select_tool,
+                    'T4'    : gcode_select_tool,
+                    'T5'    : gcode_select_tool,
+                    'T6'    : gcode_select_tool,
+                    'T7'    : gcode_select_tool
     
                     # Snnn 	Command parameter, such as the voltage to send to a motor                
                     # Pnnn 	Command parameter, such as a time in milliseconds
@@ -312,6 +357,9 @@ class Gcode:
         Gcode.X .Y .Z    :   x, y, and z coordinates
         Gcode.E .F       :   extrusion and feed rate parametersrs
         Gcode.T          :   extruder this command operates on        
+        Gcode.arcPoints  :   for arc moves (G2, G3): a flat array with the intermediate
+                             points of the arc (x0, y0, z0, x1, ...), excluding the
+                             start and end point. 'None' for other commands.
     """
     
     def __init__(self, name):
@@ -325,6 +373,13 @@ class Gcode:
         self.E = None
         self.F = None
         self.T = 0
+        self.arcPoints = None
+
+    def copy(self):
+        """return a shallow copy of this instance (the same as 'copy.copy', but faster)"""
+        newCmd = Gcode.__new__(Gcode)
+        newCmd.__dict__.update(self.__dict__)
+        return newCmd
 
     def __repr__(self):
         """return a representation with the values of this object instance"""
@@ -348,14 +403,11 @@ class Gcode:
                 constructedGcode += "( *** " + self.name + ", without 'comment' parameter *** )"
                 return constructedGcode.strip()
         
-        # if command is T0, T1: only return T
+        # if command is T0, T1, ...: only return T
         elif self.command.startswith("T"):
-            if self.command == "T0":
-                return "T0"
-            elif self.command == "T1":
-                return "T1"
+            return self.command
 
-        elif self.command.startswith("M"):
+        elif self.command.startswith("M") or self.command in ("G4", "G04"):
             constructedGcode += self.command + " "
             for parameter in ["S", "P"]:
                 if parameter in self.parameters.keys():
@@ -368,6 +420,10 @@ class Gcode:
             constructedGcode += "Z" + str(self.Z) + " " if self.Z is not None else ""
             constructedGcode += "E" + str(self.E) + " " if self.E is not None else ""
             constructedGcode += "F" + str(self.F) + " " if self.F is not None else ""
+            if self.command in ("G2", "G3"):
+                for parameter in ["I", "J", "R"]:
+                    if parameter in self.parameters.keys():
+                        constructedGcode += parameter + str(self.parameters[parameter]) + " "
 #            constructedGcode += "T" + str(self.T) + " " if self.T is not None else ""
 
         # add a comment to the end of the line, if there is any
@@ -447,6 +503,17 @@ class Extruder:
         name            :   the name for the extruder, like 'Ultimaker' or 'Extruder 2'
         rawGcode        :   the Gcode commands are stored in a list, line by line
         standardGcode   :   the processed Gcode commands are stored in a list.
+        arcTolerance    :   the maximum distance (mm) between an arc move (G2, G3)
+                            and the line segments that approximate it
+        timings         :   dict with the time (s) spent on reading and decompressing
+                            the file ('decode'), and on converting it ('parse')
+        transform       :   the affine transform (see 'compose_transforms') of the X/Y 
+                            coordinates; it is applied when the commands are exported,
+                            drawn or merged, and the commands themselves keep their 
+                            original coordinates
+        statistics      :   the cached statistics (see 'get_statistics'), or None
+        statisticsKey   :   the amount of commands, transform and settings of the 
+                            cached statistics
         
         One may assume that the index position of the 'rawGcode' and 'commands' 
         lists point to the same command. Thus, 'myExtruder.rawGcode[4]' gives
@@ -459,6 +526,13 @@ class Extruder:
         self.name = name
         self.rawGcode = []                                                      # list to store raw Gcode
         self.standardGcode = []                                                 # extract the recognized gcode commands
+        self.arcTolerance = 0.01                                                # mm
+        self.timings = {"decode": 0.0, "parse": 0.0}
+        self.unknownGcodes = dict()                                             # unrecognized command: amount of lines
+        self.invalidArcs = []                                                   # line numbers of arcs without a defined path
+        self.transform = identityTransform
+        self.statistics = None
+        self.statisticsKey = None
 
     def __repr__(self):
         """returns a representation of a 'extruder' object"""
@@ -474,14 +548,50 @@ class Extruder:
         
         This method reads a *.gcode file into memory, and stores each line
         in the self.rawGcode list. From here, it can be used for later processing.
+        Compressed files (.gcode.gz, .gcode.xz, .gcode.bz2) are decompressed 
+        while reading (see 'iter_gcode_lines'); nothing is written to disk.
         
         filename    :   a file that contains the .gcode commands
         """
-        with open(filename, mode='rt') as gcodeFile:
-            for line in gcodeFile:
-                line = line.strip()                                             # remove trailing whitespace, including '\n'
-                self.rawGcode.append(line)
-        print("OK: Import of .gcode for '{0}' has finished".format(self.name))
+        startTime = time.time()
+        for lines in iter_gcode_lines(filename):
+            self.rawGcode.extend(lines)
+        self.timings["decode"] = time.time() - startTime
+        print("OK: Import of .gcode for '{0}' has finished ({1}, {2:.2f} s)".format(self.name, 
+                    detect_compression(filename) or "plain text", self.timings["decode"]))
+
+
+    def iter_import_rawGcode(self, filename, chunkSize=2000):
+        """Import a '*.gcode' file, and convert its lines while it is read.
+        
+        This generator does the same as 'import_rawGcode' followed by 
+        'iter_convert_rawGcode_to_standardGcode', but the file is read block by
+        block (see 'iter_gcode_blocks') while the lines are converted, so the
+        first chunk is yielded without reading the whole file first. It yields
+        the fraction (0.0 - 1.0) of the file read so far, after every 
+        'chunkSize' lines.
+        """
+        progress = [0.0]
+        self.timings["decode"] = 0.0
+
+        def iter_lines():
+            blocks = iter_gcode_blocks(filename)
+            while True:
+                startTime = time.time()
+                block = next(blocks, None)
+                self.timings["decode"] += time.time() - startTime
+                if block is None:
+                    return
+                lines, progress[0] = block
+                self.rawGcode.extend(lines)
+                for line in lines:
+                    yield line
+
+        for lineCount in self.iter_convert_lines(iter_lines(), chunkSize):
+            yield progress[0]
+        print("OK: Import of .gcode for '{0}' has finished ({1}, {2:.2f} s)".format(self.name, 
+                    detect_compression(filename) or "plain text", self.timings["decode"]))
+        yield 1.0
 
 
     def convert_rawGcode_to_standardGcode(self):
@@ -510,119 +620,373 @@ class Extruder:
         After processing, each Gcode instance is checked against their 
         Reprap Gcode, since the command might modify a parameter. 
         Example: 'G28' tells to set X,Y,Z to (0,0,0).          
+
+        The work is done by 'iter_convert_rawGcode_to_standardGcode'; this 
+        method simply runs that generator until all lines are processed.
         """
+        for progress in self.iter_convert_rawGcode_to_standardGcode():
+            pass
 
-        lineNr = 0                                                              # keep track of the current line number
-        for line in self.rawGcode:
-            lineNr += 1
-            
-            # 1. create a new 'Gcode' instance
-            currCommand = Gcode(name=lineNr)
-
-            # 2. check if the line contains Skeinforge-code. 
-            if line.startswith('(<'):                                           # Assumes that first character is always and only '(<'
-                line = line[1:-1]                                               # remove brackets '()'
-                currCommand.command = "skeinforge"
-                currCommand.parameters["skeinforge"] = line
-                self.standardGcode.append(currCommand)                               # add to the list of commands
-                continue
-            
-            # 3. Ignore everything to the right of ';'
-            if ';' in line:
-                currCommand.parameters["comment"] = line.split(";", 1)[1].strip()       # all to the right of ";" is a comment
-                line = line.split(";", 1)[0].strip()                                    # remainder is useable command
-
-            # 3. Ignore comments marked by '(..)'
-            if '(' in  line:
-                currCommand.parameters["comment"] = line.split("(", 1)[1].strip(";)")   # All to the right of '(' is a comment
-                line = line.split("(")[0].strip()
-
-            # 3. There is the chance that the whole line is a comment.
-            #    In that case, grab the raw gcode, and insert this line as a comment
-            if len(line) == 0:
-                currCommand.command = "comment"
-                currCommand.parameters["comment"] = self.rawGcode[lineNr-1].strip(";()")
-                self.standardGcode.append(currCommand)                               # add to the list of commands
-                continue
 
-            # 4. Store the 'command' parameter (the first code in the line)
-            commands = line.strip().split(" ")
-            if commands[0] in Reprap_Gcode.reprapGcodes.keys():                              # this line starts with a valid code
-                currCommand.command = commands[0].strip()                       # add command name; remove any double white space as some Gcode has two whitespaces
-                for item in commands[1:]:
-                    if item[0] == "X":
-                        currCommand.X = float(item[1:].strip())
-                    elif item[0] == "Y":
-                        currCommand.Y = float(item[1:].strip())
-                    elif item[0] == "Z":
-                        currCommand.Z = float(item[1:].strip())
-                    elif item[0] == "E":
-                        currCommand.E = float(item[1:].strip())
-                    elif item[0] == "F":
-                        currCommand.F = float(item[1:].strip())
-                    elif item[0] == "T":
-                        currCommand.T = int(item[1:].strip())
-                    else:
-                    # for every of the parameters, make the first character the
-                    # key, and add the remaining characters (excl. whitespace)
-                        currCommand.parameters[item[0]] = float(item[1:].strip())
-            else:
-                # the command is not in the list of Gcodes, treat as comment
-                print(">> Line {0}: unrecognized Gcode in '{1}'".format(lineNr, line.strip()))
-                currCommand.command = "unknown"
-                currCommand.parameters["comment"] = commands
+    def iter_convert_rawGcode_to_standardGcode(self, chunkSize=2000):
+        """Convert the raw Gcode to standardized Gcode in chunks of lines.
+        
+        This generator does the same as 'convert_rawGcode_to_standardGcode', 
+        but hands back control after every 'chunkSize' lines. It yields the 
+        fraction (0.0 - 1.0) of the raw Gcode lines processed so far, so a 
+        caller (e.g., the Blender import operator) can report progress or 
+        stop processing halfway.
+        
+        Every yielded chunk of 'Gcode' instances in self.standardGcode is 
+        complete: the Reprap Gcode function has been applied, and the 
+        last-known parameters have been transferred to it.
+        """
+        totalLines = float(max(len(self.rawGcode), 1))
+        for lineCount in self.iter_convert_lines(self.rawGcode, chunkSize):
+            yield lineCount / totalLines
+        yield 1.0
 
-            self.standardGcode.append(currCommand)                                   # Add the created Gcode instance to the list of commands
+
+    def iter_convert_lines(self, lines, chunkSize=2000):
+        """Convert raw Gcode lines to standardized Gcode, and yield the amount of 
+        lines converted after every 'chunkSize' lines.
         
-        # Send each of the created commands to its function, to check if there
-        # is any extra operation or action that must be done to the command.
-        for cmd in self.standardGcode:
-            if cmd.command in Reprap_Gcode.reprapGcodes.keys():                
-                cmd = Reprap_Gcode.reprapGcodes[cmd.command](cmd)
-
-        # Up to here, we have read all the raw Gcode commands, and transformed
-        # these to standardized 'Gcode' instances. 
-        # As a final step, we have to process all the commands and add the
-        # last-known parameters (which are stored in extruder memory) to each
-        # of these commands.
+        lines   :   any iterable of raw Gcode lines; it is only read as far as
+                    needed for the next chunk (see 'iter_import_rawGcode')
+        """
+        # Commands must be expanded with the last-known parameters (which are 
+        # stored in extruder memory).
         # Example: line 1 = G1 X2 Y2 Z2 E10 F10
         #          line 2 = G1 Y4
         #           --> the X, Z, E, and F positions are not modified in line #2, 
         #               and can be transferred from line #1. 
         lastState = self.create_lastState("lastState")
+        arcs = []                                                               # the arc moves of the current chunk
+        tessellate = tessellate_arcs_numpy if numpy is not None else tessellate_arcs
+        self.timings["parse"] = 0.0
+        decodeTime = self.timings["decode"]                                     # (reading 'lines' may decode the file)
+        startTime = time.time()                                                 # (time spent outside this generator is not counted)
 
-        for cmd in self.standardGcode:
-            cmd.update_state(lastState)
-        print("OK: Gcode commands for '{0}' have been expanded with previous values".format(self.name))
+        lineNr = 0                                                              # keep track of the current line number
+        for line in lines:
+            lineNr += 1
+            currCommand = self.convert_rawGcode_line(line, lineNr)
+
+            # Send the created command to its function, to check if there
+            # is any extra operation or action that must be done to the command.
+            if currCommand.command in Reprap_Gcode.reprapGcodes.keys():
+                currCommand = Reprap_Gcode.reprapGcodes[currCommand.command](currCommand)
+
+            # An arc starts at the last known position: keep that, before the state is updated
+            if currCommand.command in ("G2", "G3"):
+                arcs.append((currCommand, lastState.X, lastState.Y, lastState.Z))
+
+            currCommand.update_state(lastState)
+            self.standardGcode.append(currCommand)                              # Add the created Gcode instance to the list of commands
+
+            if lineNr % chunkSize == 0:
+                self.invalidArcs.extend(tessellate(arcs, self.arcTolerance))
+                arcs = []
+                self.timings["parse"] += time.time() - startTime
+                yield lineNr
+                startTime = time.time()
+
+        self.invalidArcs.extend(tessellate(arcs, self.arcTolerance))
+        self.timings["parse"] += time.time() - startTime - (self.timings["decode"] - decodeTime)
+
+        if self.unknownGcodes:
+            print(">> {0} lines with unrecognized Gcode ({1})".format(sum(self.unknownGcodes.values()), 
+                        ", ".join("{0}: {1}x".format(command, count) for command, count in 
+                                  sorted(self.unknownGcodes.items(), key=lambda item: -item[1])[:10])))
+        if self.invalidArcs:
+            print(">> {0} arcs with R that end where they start are drawn as a straight move (lines {1})".format(
+                        len(self.invalidArcs), ", ".join(str(lineNr) for lineNr in self.invalidArcs[:10])))
+        print("OK: Gcode commands for '{0}' have been expanded with previous values ({1:.2f} s)".format(
+                    self.name, self.timings["parse"]))
+
+
+    def convert_rawGcode_line(self, line, lineNr):
+        """Transform one line of raw Gcode to a 'Gcode' instance.
+        
+        line    :   the raw Gcode line (without trailing whitespace)
+        lineNr  :   the line number of this line in the .gcode file
+        
+        return  :   a 'Gcode' instance; the last-known parameters are not yet added
+        """
+        # 1. create a new 'Gcode' instance
+        currCommand = Gcode(name=lineNr)
+        rawLine = line
+
+        # 2. check if the line contains Skeinforge-code. 
+        if line.startswith('(<'):                                               # Assumes that first character is always and only '(<'
+            line = line[1:-1]                                                   # remove brackets '()'
+            currCommand.command = "skeinforge"
+            currCommand.parameters["skeinforge"] = line
+            return currCommand
+        
+        # 3. Ignore everything to the right of ';'
+        if ';' in line:
+            currCommand.parameters["comment"] = line.split(";", 1)[1].strip()   # all to the right of ";" is a comment
+            line = line.split(";", 1)[0].strip()                                # remainder is useable command
+
+        # 3. Ignore comments marked by '(..)'
+        if '(' in  line:
+            currCommand.parameters["comment"] = line.split("(", 1)[1].strip(";)")   # All to the right of '(' is a comment
+            line = line.split("(")[0].strip()
+
+        # 3. There is the chance that the whole line is a comment.
+        #    In that case, grab the raw gcode, and insert this line as a comment
+        if len(line) == 0:
+            currCommand.command = "comment"
+            currCommand.parameters["comment"] = rawLine.strip(";()")
+            return currCommand
+
+        # 4. Store the 'command' parameter (the first code in the line)
+        commands = line.strip().split(" ")
+        if commands[0] in Reprap_Gcode.reprapGcodes.keys():                    # this line starts with a valid code
+            currCommand.command = commands[0].strip()                           # add command name; remove any double white space as some Gcode has two whitespaces
+            for item in commands[1:]:
+                if item[0] == "X":
+                    currCommand.X = float(item[1:].strip())
+                elif item[0] == "Y":
+                    currCommand.Y = float(item[1:].strip())
+                elif item[0] == "Z":
+                    currCommand.Z = float(item[1:].strip())
+                elif item[0] == "E":
+                    currCommand.E = float(item[1:].strip())
+                elif item[0] == "F":
+                    currCommand.F = float(item[1:].strip())
+                elif item[0] == "T":
+                    currCommand.T = int(item[1:].strip())
+                else:
+                # for every of the parameters, make the first character the
+                # key, and add the remaining characters (excl. whitespace)
+                    currCommand.parameters[item[0]] = float(item[1:].strip())
+        else:
+            # the command is not in the list of Gcodes, treat as comment (and count 
+            # it; printing every line is slower than the parsing on noisy files)
+            self.unknownGcodes[commands[0]] = self.unknownGcodes.get(commands[0], 0) + 1
+            currCommand.command = "unknown"
+            currCommand.parameters["comment"] = commands
+
+        return currCommand
 
 
-    def export_standardGcode(self, outFile = '/home/douwe/Desktop/output.gcode'):
+    def export_standardGcode(self, outFile = '/home/douwe/Desktop/output.gcode', fitArcs = False, fitTolerance = 0.01,
+                             decimals = None, blockSize = 50000):
         """
         Reconstruct raw Gcode commands from processed, standardized Gcode commands.
         
         This method will return all the 'Gcode' instances as strings.
         It should return functional equivalents of the original raw Gcode command.
-
+        The commands are written by 'write_gcode', with a fixed amount of 
+        decimals per parameter, so the output is the same on every run.
+
+        outFile         :   a file name, or an open file object (like sys.stdout or a pipe)
+        fitArcs         :   if True, runs of G1 moves that lie on a circular arc
+                            are written as one G2/G3 arc move (see 'fit_arcs'). 
+                            This reduces the amount of lines a printer has to 
+                            read over its serial connection or from SD card.
+        fitTolerance    :   the maximum deviation (mm) of the arc from the moves
+        decimals        :   dict with the amount of decimals per parameter 
+                            (default: 'exportDecimals')
+        blockSize       :   the amount of commands that is written at once
+        
         return  :   file (that contains reconstructed gcode commands)
         """
+        standardGcode = self.standardGcode
+        if fitArcs == True:
+            standardGcode = fit_arcs(self.standardGcode, fitTolerance)
+            print("OK: arc fitting for '{0}': {1} -> {2} lines ({3:.2f}x compression)".format(self.name, 
+                        len(self.standardGcode), len(standardGcode), 
+                        len(self.standardGcode) / max(len(standardGcode), 1)))
         
-        with open(outFile, mode = 'w') as gcodeOutFile:
-            for indexNr in range(0, len(self.standardGcode)):                
-#                gcodeOutFile.write(self.standardGcode[indexNr].name + " " + str(self.standardGcode[indexNr]) + "\n")
-                gcodeOutFile.write(str(self.standardGcode[indexNr]) + "\n")
+        write_gcode(standardGcode, outFile, decimals, blockSize, self.transform)
+
+
+    def get_columns(self):
+        """Returns the standardized Gcode commands as columns.
+        
+        Each column is an array with one value per command (the index is the
+        same as in 'self.standardGcode'). This is the form that is stored by
+        'save_toolpath', and a compact form to run analyses on.
+        
+        return  :   dict with the columns (see 'toolpathColumns'):
+                    lineNr      :   the line number ('Gcode.name', when that is an int), or -1
+                    name        :   index of 'Gcode.name' in 'strings' when that is not 
+                                    an int (like 'x_12' of merged commands), or -1
+                    command     :   index of the command ('G1', 'M104', ...) in 'strings'
+                    X, Y, Z, E, F   :   coordinates; NaN when unknown (None)
+                    T           :   the tool number
+                    comment     :   index of the comment in 'strings', or -1
+                    parameters  :   index of the other parameters (as JSON) in 'strings'; 
+                                    a comment that is not a string (the list of 
+                                    words of an 'unknown' command) is kept here
+                    arcIndex    :   arc points of command n are arcPoints[arcIndex[n]:arcIndex[n + 1]]
+                    arcPoints   :   the flat x, y, z points of all arcs
+                    strings     :   a list with the unique strings the columns point to
+        """
+        nan = float("nan")
+        columns = dict((columnName, array(typeCode)) for columnName, typeCode in toolpathColumns)
+        strings = []
+        stringIndex = dict()
+
+        def index_of(text):
+            index = stringIndex.get(text)
+            if index is None:
+                index = stringIndex[text] = len(strings)
+                strings.append(text)
+            return index
+
+        columns["arcIndex"].append(0)
+        for cmd in self.standardGcode:
+            if isinstance(cmd.name, int) and 0 <= cmd.name < 2 ** 31:
+                columns["lineNr"].append(cmd.name)
+                columns["name"].append(-1)
+            else:
+                columns["lineNr"].append(-1)
+                columns["name"].append(index_of(str(cmd.name)))
+            columns["command"].append(index_of(cmd.command))
+            for axis, value in (("X", cmd.X), ("Y", cmd.Y), ("Z", cmd.Z), ("E", cmd.E), ("F", cmd.F)):
+                columns[axis].append(nan if value is None else value)
+            columns["T"].append(cmd.T or 0)
+            parameters = dict(cmd.parameters)
+            comment = parameters.pop("comment") if isinstance(parameters.get("comment"), str) else None
+            columns["comment"].append(-1 if comment is None else index_of(comment))
+            columns["parameters"].append(index_of(json.dumps(parameters)))
+            if cmd.arcPoints is not None:
+                columns["arcPoints"].extend(cmd.arcPoints)
+            columns["arcIndex"].append(len(columns["arcPoints"]))
+
+        columns["strings"] = strings
+        return columns
+
+
+    def get_statistics(self, settings=None, columns=None):
+        """Returns the statistics of the commands, per layer and per tool.
+        
+        See 'Gcode_analysis.compute_statistics'; the transform of the extruder
+        is applied. The result is cached, and only computed again when commands
+        are added, the transform is changed, or other 'settings' are given.
+        A toolpath file keeps the statistics (see 'save_toolpath').
+        If the move 'columns' of the transformed commands are made already 
+        (see 'Gcode_analysis.iter_move_columns'), these are used.
+        """
+        statisticsKey = (len(self.standardGcode), self.transform, repr(sorted((settings or {}).items())))
+        if self.statistics is None or self.statisticsKey != statisticsKey:
+            try:
+                from . import Gcode_analysis
+            except (ImportError, SystemError, ValueError):
+                import Gcode_analysis
+            self.statistics = Gcode_analysis.compute_statistics(self.get_transformed_gcode(), settings, columns)
+            self.statisticsKey = statisticsKey
+        return self.statistics
+
+
+    def save_toolpath(self, filename, withStatistics=True):
+        """Save the standardized Gcode commands in the binary toolpath format.
+        
+        See 'write_toolpath' for the format. Reading it back with 
+        'load_toolpath' is much faster than parsing the .gcode text again.
+        With 'withStatistics', the statistics (see 'get_statistics') are 
+        stored in the file as well. The file has the original coordinates, so
+        the statistics are only stored if the extruder has no transform.
+        """
+        withStatistics = withStatistics and self.transform == identityTransform
+        write_toolpath(self.get_columns(), filename, self.get_statistics() if withStatistics else None)
+        print("OK: toolpath of '{0}' has been saved to '{1}'".format(self.name, filename))
+
+
+    def load_toolpath(self, filename):
+        """Load standardized Gcode commands from a binary toolpath file.
+        
+        The file is memory mapped (see 'ToolpathFile'); the Gcode instances
+        are created directly from the columns, without any text parsing.
+        The commands replace those in 'self.standardGcode'. Statistics that
+        are stored in the file become the cached statistics.
+        """
+        with ToolpathFile(filename) as toolpath:
+            self.standardGcode = toolpath.create_gcode()
+            self.statistics = toolpath.get_statistics()
+        self.statisticsKey = (len(self.standardGcode), identityTransform, repr([]))
+        print("OK: toolpath of '{0}' has been loaded from '{1}'".format(self.name, filename))
 
 
     def add_offset(self, offsetX = 1000, offsetY = 1000):
         """Add offset values to extruder's X and Y coordinates
+        
+        The offset is added to 'self.transform' (see 'translate'); the 
+        commands are not changed until they are exported, drawn or merged.
         """
+        self.translate(offsetX, offsetY)
+        print("OK: offset ({0}, {1}) added to extruder '{2}'".format(offsetX, offsetY, self.name))
+
+
+    def add_transform(self, matrix):
+        """Apply an affine transform after the current 'self.transform'.
+        
+        Transforms are only combined here (one matrix product); the 
+        coordinates of the commands are not touched. 
         
-        for command in self.standardGcode:
-            if command.X is not None:
-                command.X += offsetX
-            if command.Y is not None:
-                command.Y += offsetY
+        matrix  :   (a, b, c, d, e, f): x' = a*x + b*y + c, and y' = d*x + e*y + f
+        """
+        self.transform = compose_transforms(self.transform, matrix)
 
-        print("OK: offset ({0}, {1}) added to extruder '{2}'".format(offsetX, offsetY, self.name))
+
+    def translate(self, offsetX, offsetY):
+        """Move the X/Y coordinates by (offsetX, offsetY) mm"""
+        self.add_transform((1.0, 0.0, offsetX, 0.0, 1.0, offsetY))
+
+
+    def rotate(self, angle, centerX = 0.0, centerY = 0.0):
+        """Rotate the X/Y coordinates counter-clockwise by 'angle' degrees around (centerX, centerY)"""
+        cosAngle, sinAngle = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        self.add_transform((cosAngle, -sinAngle, centerX - cosAngle * centerX + sinAngle * centerY,
+                            sinAngle, cosAngle, centerY - sinAngle * centerX - cosAngle * centerY))
+
+
+    def scale(self, scaleX, scaleY = None, centerX = 0.0, centerY = 0.0):
+        """Scale the X/Y coordinates around (centerX, centerY); 'scaleY' is 'scaleX' if not given.
+        
+        NOTE: with a different scaleX and scaleY, arcs (G2, G3) become ellipses,
+              which Gcode cannot describe. These are exported as G1 moves 
+              through the tessellated points of the arc (see 'iter_transform_gcode').
+        """
+        if scaleY is None:
+            scaleY = scaleX
+        self.add_transform((scaleX, 0.0, centerX - scaleX * centerX, 
+                            0.0, scaleY, centerY - scaleY * centerY))
+
+
+    def mirror(self, axis = "X", center = 0.0):
+        """Mirror the coordinates in the line X = center ('X'), or Y = center ('Y').
+        
+        Use the center of the bed as 'center' to mirror a print on the bed.
+        Arcs change direction (G2 <-> G3) when they are exported.
+        """
+        if axis.upper() == "X":
+            self.add_transform((-1.0, 0.0, 2.0 * center, 0.0, 1.0, 0.0))
+        else:
+            self.add_transform((1.0, 0.0, 0.0, 0.0, -1.0, 2.0 * center))
+
+
+    def reset_transform(self):
+        """Remove all transforms: the commands are used with their original coordinates"""
+        self.transform = identityTransform
+
+
+    def get_transformed_gcode(self):
+        """Yield the commands with 'self.transform' applied (see 'iter_transform_gcode').
+        
+        Without a transform, the commands themselves are yielded; otherwise
+        transformed copies, so the original coordinates are kept.
+        """
+        if self.transform == identityTransform:
+            for cmd in self.standardGcode:
+                yield cmd
+        else:
+            for cmd in iter_transform_gcode(self.standardGcode, self.transform):
+                yield cmd
         
 
     def create_lastState(self, name="lastState_T0"):
@@ -661,6 +1025,1749 @@ class Extruder:
 
 
 
+class LayerGeometry:
+    """Store the spline points of one layer in compact, flat arrays.
+    
+    This is the 'geometry buffer' of a layer: it holds only the coordinates
+    that are needed to draw the layer, and no Gcode instances. It can be 
+    passed between threads and processes, and drawn without any further
+    processing of Gcode.
+
+    Variables:
+        LayerGeometry.name              :   the name of the layer; normally the Z-value
+        LayerGeometry.coordinates       :   flat array with the points of all splines: 
+                                            x0, y0, z0, x1, y1, z1, ...
+        LayerGeometry.splineLengths     :   array with the amount of points of each spline
+        LayerGeometry.removedPointCount :   the amount of points removed by 'simplify'
+        LayerGeometry.levels            :   the coarser levels of detail (see 'create_levels'), 
+                                            as a list of (coordinates, splineLengths) tuples.
+                                            'None' if these are not created yet.
+        LayerGeometry.materialIndices   :   array with the material index of each spline, for
+                                            example the flow bin (see 'from_commands'); 'None' 
+                                            if the splines have no materials
+    """
+
+    # Every level of detail keeps 1 in 'factor' points of the full geometry
+    levelFactors = (4, 16)
+
+    def __init__(self, name):
+        """Initialize a new, empty 'LayerGeometry' instance"""
+        self.name = name
+        self.coordinates = array('d')
+        self.splineLengths = array('L')
+        self.removedPointCount = 0
+        self.levels = None
+        self.materialIndices = None
+
+
+    def __repr__(self):
+        """return a representation of the 'LayerGeometry' instance"""
+        return "<LayerGeometry '{0}': {1} splines, {2} points>".format(self.name, 
+                                        self.count_splines(), self.count_points())
+
+
+    @classmethod
+    def from_splines(cls, name, splines, materialIndices=None):
+        """Create a 'LayerGeometry' from a list of splines with 'Gcode' instances
+        (such as the output of the 'split_splines' function), and optionally 
+        a material index for every spline."""
+        geometry = cls(name)
+        for spline in splines:
+            geometry.add_spline(iter_spline_points(spline))
+        if materialIndices is not None:
+            geometry.materialIndices = array('B', materialIndices)
+        return geometry
+
+
+    @classmethod
+    def from_commands(cls, name, commands, maxFlow=None):
+        """Create a 'LayerGeometry' from the Gcode instances of a layer.
+        
+        The commands are split in splines (see 'split_splines'). If 'maxFlow'
+        (mm3/s) is given, the splines are also split where their volumetric
+        flow changes color, and the material index of every spline is its 
+        flow bin (see 'Gcode_analysis.split_splines_by_flow').
+        """
+        if maxFlow is None:
+            return cls.from_splines(name, split_splines(commands))
+        try:
+            from . import Gcode_analysis
+        except (ImportError, SystemError, ValueError):
+            import Gcode_analysis
+        return cls.from_splines(name, *Gcode_analysis.split_splines_by_flow(commands, maxFlow))
+
+
+    def add_spline(self, points):
+        """Add a spline; 'points' is an iterable of (x, y, z) tuples"""
+        pointCount = 0
+        for point in points:
+            self.coordinates.extend(point)
+            pointCount += 1
+        self.splineLengths.append(pointCount)
+
+
+    def extend(self, other):
+        """Add the splines of another 'LayerGeometry' instance to this one"""
+        if self.materialIndices is not None or other.materialIndices is not None:
+            materialIndices = self.materialIndices or array('B', [0] * self.count_splines())
+            materialIndices.extend(other.materialIndices or array('B', [0] * other.count_splines()))
+            self.materialIndices = materialIndices
+        self.coordinates.extend(other.coordinates)
+        self.splineLengths.extend(other.splineLengths)
+        self.removedPointCount += other.removedPointCount
+        if self.levels is not None and other.levels is not None:
+            for level, otherLevel in zip(self.levels, other.levels):
+                level[0].extend(otherLevel[0])
+                level[1].extend(otherLevel[1])
+        else:
+            self.levels = None                                                  # out of date; created again when needed
+
+
+    def simplify(self, tolerance):
+        """Remove the points that deviate less than 'tolerance' (mm) from a straight line.
+        
+        Every spline is simplified on its own (see 'simplify_spline', or 
+        'simplify_splines_numpy' with numpy), and the first and last point 
+        of every spline are always kept. Since a spline
+        starts and ends where the extrusion starts and stops, the extrusion 
+        boundaries are not changed.
+        
+        return  :   the amount of points that were removed
+        """
+        pointCount = self.count_points()
+        if numpy is not None:
+            coordinates, splineLengths = simplify_splines_numpy(self.coordinates, self.splineLengths, tolerance)
+        else:
+            coordinates = array('d')
+            splineLengths = array('L')
+            for splineCoordinates in self.iter_splines():
+                simplifiedCoordinates = simplify_spline(splineCoordinates, tolerance)
+                coordinates.extend(simplifiedCoordinates)
+                splineLengths.append(len(simplifiedCoordinates) // 3)
+
+        self.coordinates = coordinates
+        self.splineLengths = splineLengths
+        self.levels = None                                                      # out of date; created again when needed
+        removed = pointCount - self.count_points()
+        self.removedPointCount += removed
+        return removed
+
+
+    def create_levels(self):
+        """Create the coarser levels of detail of this layer.
+        
+        A level of detail is a decimated copy of the splines: of every spline, 
+        1 in 'factor' points is kept (see 'LayerGeometry.levelFactors'), and 
+        always the first and last point. With the default factors, the levels
+        have about 1/4 and 1/16 of the points of the full geometry; the 
+        complete pyramid costs less than 1/3 extra memory.
+        """
+        self.levels = list()
+        for factor in self.levelFactors:
+            coordinates = array('d')
+            splineLengths = array('L')
+            for splineCoordinates in self.iter_splines():
+                decimatedCoordinates = decimate_spline(splineCoordinates, factor)
+                coordinates.extend(decimatedCoordinates)
+                splineLengths.append(len(decimatedCoordinates) // 3)
+            self.levels.append((coordinates, splineLengths))
+
+
+    def transform(self, matrix):
+        """Apply an affine transform (see 'compose_transforms') to all points, 
+        including those of the levels of detail."""
+        transform_coordinates(self.coordinates, matrix)
+        if self.levels is not None:
+            for coordinates, splineLengths in self.levels:
+                transform_coordinates(coordinates, matrix)
+
+
+    def get_level(self, level):
+        """Returns a level of detail as a 'LayerGeometry' instance.
+        
+        level   :   0 is the full geometry (this instance itself); 1, 2, ... are 
+                    the coarser levels, in the order of 'LayerGeometry.levelFactors'
+        """
+        if level == 0:
+            return self
+        if self.levels is None:
+            self.create_levels()
+
+        geometry = LayerGeometry(self.name)
+        geometry.coordinates, geometry.splineLengths = self.levels[level - 1]
+        geometry.materialIndices = self.materialIndices                        # (the levels keep every spline)
+        return geometry
+
+
+    def get_bounds(self):
+        """Returns the ((xMin, yMin, zMin), (xMax, yMax, zMax)) of all points, or None without points"""
+        if len(self.coordinates) == 0:
+            return None
+        xs = self.coordinates[0::3]
+        ys = self.coordinates[1::3]
+        zs = self.coordinates[2::3]
+        return (min(xs), min(ys), min(zs)), (max(xs), max(ys), max(zs))
+
+
+    def count_splines(self):
+        """Returns the amount of splines in this layer"""
+        return len(self.splineLengths)
+
+
+    def count_points(self):
+        """Returns the amount of points of all splines in this layer"""
+        return len(self.coordinates) // 3
+
+
+    def iter_splines(self):
+        """Yield the flat coordinates (x0, y0, z0, x1, ...) of every spline"""
+        start = 0
+        for pointCount in self.splineLengths:
+            end = start + 3 * pointCount
+            yield self.coordinates[start:end]
+            start = end
+
+
+class LayerSorter:
+    """Sort resolved Gcode instances into layers while a file is being parsed.
+    
+    Gcode instances are added one by one (in file order). A layer (all commands
+    with the same Z-value) is regarded as 'finished' as soon as plastic is 
+    extruded at a higher Z-value. Commands at a higher Z-value that do not 
+    extrude, such as a 'Z-hop' travel move, do not finish a layer.
+    
+    If a print returns to a layer that was already finished, the new commands
+    are collected in a second batch for the same Z-value.
+
+    Variables:
+        LayerSorter.openLayers  :   dict with (Z-value: list of Gcode instances) 
+                                    pairs of the layers that are not finished yet
+        LayerSorter.lastCommand :   the last Gcode instance with position information
+    """
+
+    def __init__(self):
+        """Initialize a new 'LayerSorter' instance"""
+        self.openLayers = dict()
+        self.lastCommand = None
+
+
+    def add_gcode(self, cmd):
+        """Add a resolved Gcode instance.
+        
+        return  :   a list of (Z-value, commands) tuples for the layers that 
+                    are finished by this command, from low to high Z.
+        """
+        # process only the commands that contain useful position information
+        if cmd.command in ("comment", "skeinforge", "unknown") or cmd.Z is None:
+            return []
+
+        finished = []
+        lastCmd = self.lastCommand
+        if lastCmd is not None and cmd.E > lastCmd.E and (cmd.X != lastCmd.X or cmd.Y != lastCmd.Y 
+                                                          or cmd.arcPoints is not None):
+            # plastic is extruded at this Z: all lower layers are finished
+            for zValue in sorted(self.openLayers):
+                if zValue >= cmd.Z:
+                    break
+                finished.append((zValue, self.openLayers.pop(zValue)))
+
+        self.openLayers.setdefault(cmd.Z, []).append(cmd)
+        self.lastCommand = cmd
+        return finished
+
+
+    def finish(self):
+        """Return all the layers that are not finished yet, as (Z-value, commands) tuples"""
+        finished = [(zValue, self.openLayers[zValue]) for zValue in sorted(self.openLayers)]
+        self.openLayers = dict()
+        return finished
+
+
+def iter_sort_layers(standardGcode):
+    """Sort resolved Gcode instances into layers (see 'LayerSorter').
+    
+    yield   :   (Z-value, commands) tuples of the layers, in the order in which
+                they are finished
+    """
+    sorter = LayerSorter()
+    for cmd in standardGcode:
+        for layer in sorter.add_gcode(cmd):
+            yield layer
+    for layer in sorter.finish():
+        yield layer
+
+
+def create_E_reset(name, position, eValue, toolNr, comment):
+    """Returns a 'G92' Gcode instance that sets E to 'eValue' at the position of 
+    the Gcode instance 'position' (so X, Y and Z are not changed)."""
+    resetCommand = Gcode(name=name)
+    resetCommand.command = "G92"
+    resetCommand.X, resetCommand.Y, resetCommand.Z = position.X, position.Y, position.Z
+    resetCommand.E, resetCommand.F = eValue, position.F
+    resetCommand.T = toolNr
+    resetCommand.parameters["comment"] = comment
+    return resetCommand
+
+
+def split_islands(commands):
+    """Split the commands of one layer in islands: parts that can be printed in any order.
+    
+    An island starts with the first travel move (a move in X/Y without 
+    extrusion) after plastic has been extruded, so every island contains 
+    its own travel, (un)retraction and extrusion moves. 
+    
+    return  :   a list of islands (lists of Gcode instances), or None if the
+                commands contain anything else than G0/G1 moves and comments;
+                such layers are left as they are.
+    """
+    islands = [[]]
+    extruded = False
+    lastCmd = None
+    for cmd in commands:
+        if cmd.command not in ("G0", "G1", "comment"):
+            return None
+        if cmd.command != "comment" and lastCmd is not None:
+            moves = cmd.X != lastCmd.X or cmd.Y != lastCmd.Y
+            if moves and cmd.E > lastCmd.E:
+                extruded = True
+            elif moves and extruded:                                            # a travel move after extrusion
+                islands.append([])
+                extruded = False
+        if cmd.command != "comment":
+            lastCmd = cmd
+        islands[-1].append(cmd)
+    return islands
+
+
+def island_ends(island, before):
+    """Returns the (start, end) X/Y points of the extrusion of an island.
+    
+    before  :   the Gcode instance before the island (the start of its first move)
+    """
+    start = end = None
+    lastCmd = before
+    for cmd in island:
+        if cmd.command == "comment":
+            continue
+        if (cmd.X != lastCmd.X or cmd.Y != lastCmd.Y) and cmd.E > lastCmd.E:
+            if start is None:
+                start = (lastCmd.X, lastCmd.Y)
+            end = (cmd.X, cmd.Y)
+        lastCmd = cmd
+    if start is None:                                                           # no extrusion: a travel only
+        start = end = (lastCmd.X, lastCmd.Y)
+    return start, end
+
+
+def order_islands(starts, ends, position, maxTwoOptSize=500, maxPasses=5):
+    """Find a short order to visit islands, with nearest-neighbour and 2-opt.
+    
+    Islands are entered at their start and left at their end point (they are
+    never reversed, so the distances are not symmetric). Travel starts at 
+    'position'. 2-opt reverses the visiting order of a part of the tour as 
+    long as that makes the total travel shorter; it is skipped for more than
+    'maxTwoOptSize' islands, and stops after 'maxPasses' passes.
+    
+    return  :   the new order, as a list of island indices
+    """
+    def distance(a, b):
+        return math.hypot(a[0] - b[0], a[1] - b[1])
+
+    # nearest neighbour: always go to the closest island that is left
+    remaining = set(range(len(starts)))
+    order = []
+    current = position
+    while remaining:
+        nearest = min(remaining, key=lambda islandNr: (distance(current, starts[islandNr]), islandNr))
+        remaining.remove(nearest)
+        order.append(nearest)
+        current = ends[nearest]
+
+    if len(order) > maxTwoOptSize:
+        return order
+
+    # 2-opt: reverse order[first:last + 1] if that is shorter. The cost of the
+    # part (forward and reversed) is updated move by move while 'last' grows.
+    islandCount = len(order)
+    for passNr in range(maxPasses):
+        improved = False
+        for first in range(islandCount - 1):
+            previousEnd = ends[order[first - 1]] if first > 0 else position
+            forward = reverse = 0.0                                             # the travel within the part
+            for last in range(first + 1, islandCount):
+                forward += distance(ends[order[last - 1]], starts[order[last]])
+                reverse += distance(ends[order[last]], starts[order[last - 1]])
+                before = distance(previousEnd, starts[order[first]]) + forward
+                after = distance(previousEnd, starts[order[last]]) + reverse
+                if last + 1 < islandCount:
+                    before += distance(ends[order[last]], starts[order[last + 1]])
+                    after += distance(ends[order[first]], starts[order[last + 1]])
+                if after < before - 1e-9:
+                    order[first:last + 1] = order[first:last + 1][::-1]
+                    improved = True
+                    break
+        if not improved:
+            break
+    return order
+
+
+def optimize_island_order(commands, before, toolNr, new_name):
+    """Print the islands of one layer of one tool in a shorter order.
+    
+    The islands (see 'split_islands') are ordered by 'order_islands'. Since
+    all E values are absolute, a 'G92' is added before every island that 
+    now follows another island than before, and at the end, so the E values 
+    of all commands stay valid.
+    
+    commands    :   the commands of one layer of one tool
+    before      :   the Gcode instance before these commands (the start position)
+    new_name    :   a function that returns a name for a new Gcode instance
+    
+    return      :   (commands, travel before (mm), travel after (mm), travel time saved (s))
+    """
+    islands = split_islands(commands)
+    if islands is None or len(islands) < 3:
+        return commands, 0.0, 0.0, 0.0
+
+    # the point where each island starts and ends, the E value before it, and its travel speed
+    starts, ends, entryE, speeds = [], [], [], []
+    lastCmd = before
+    for island in islands:
+        start, end = island_ends(island, lastCmd)
+        starts.append(start)
+        ends.append(end)
+        entryE.append(lastCmd.E)
+        moves = [cmd for cmd in island if cmd.command != "comment"]
+        speeds.append(max(moves[0].F / 60.0, 1.0) if moves else 1.0)           # mm/s
+        if moves:
+            lastCmd = moves[-1]
+    exitE = lastCmd.E
+
+    position = (before.X, before.Y)
+    order = order_islands(starts, ends, position)
+    if order == list(range(len(islands))):
+        return commands, 0.0, 0.0, 0.0
+
+    def travel(islandOrder):
+        total = timeTotal = 0.0
+        previousEnd = position
+        for islandNr in islandOrder:
+            length = math.hypot(starts[islandNr][0] - previousEnd[0], starts[islandNr][1] - previousEnd[1])
+            total += length
+            timeTotal += length / speeds[islandNr]
+            previousEnd = ends[islandNr]
+        return total, timeTotal
+
+    travelBefore, timeBefore = travel(range(len(islands)))
+    travelAfter, timeAfter = travel(order)
+
+    optimized = []
+    lastIsland = -1
+    lastPosition = before
+    for islandNr in order:
+        if islandNr != lastIsland + 1:                                          # the E value before this island changed
+            optimized.append(create_E_reset(new_name(), lastPosition, entryE[islandNr], toolNr, 
+                                            "** island {0} moved **".format(islandNr)))
+        optimized.extend(islands[islandNr])
+        lastIsland = islandNr
+        lastPosition = [cmd for cmd in [lastPosition] + islands[islandNr] if cmd.command != "comment"][-1]
+    if lastIsland != len(islands) - 1:
+        optimized.append(create_E_reset(new_name(), lastPosition, exitE, toolNr, "** islands reordered **"))
+
+    return optimized, travelBefore, travelAfter, timeBefore - timeAfter
+
+
+def iter_layer_keys(standardGcode):
+    """Yield (layer key, Gcode instance) tuples for a list of resolved Gcode instances.
+    
+    The layer key is the highest Z-value at which plastic has been extruded,
+    and it never decreases; this makes it a sort key to merge several files
+    layer by layer (see 'Machine.merge_extruders'). 
+    Commands that do not extrude (travel moves, Z-hops, settings) are kept 
+    until the next extruding move, and get the key of that move: the travel 
+    to a new layer belongs to the new layer. 
+    
+    The commands before the first extrusion (the 'initialization' code, 
+    without the moves right before the first extrusion) get the key -inf;
+    those after the last extrusion (the 'end' code) get +inf.
+    """
+    pending = []                                                                # the non-extruding commands since the last extrusion
+    layerKey = float("-inf")
+    lastE = None
+
+    for cmd in standardGcode:
+        extrudes = (cmd.command in ("G0", "G1", "G2", "G3") and lastE is not None 
+                    and cmd.E is not None and cmd.E > lastE and cmd.Z is not None)
+        if cmd.E is not None:
+            lastE = cmd.E
+        if not extrudes:
+            pending.append(cmd)
+            continue
+
+        if layerKey == float("-inf"):                                           # the first extrusion: the initialization ends ...
+            initEnd = len(pending)
+            while initEnd > 0 and pending[initEnd - 1].command in ("G0", "G1", "G2", "G3"):
+                initEnd -= 1                                                    # ... but the moves to the first layer belong to that layer
+            for pendingCmd in pending[:initEnd]:
+                yield layerKey, pendingCmd
+            pending = pending[initEnd:]
+        layerKey = max(layerKey, cmd.Z)
+        for pendingCmd in pending:
+            yield layerKey, pendingCmd
+        pending = []
+        yield layerKey, cmd
+
+    for pendingCmd in pending:
+        yield float("inf"), pendingCmd
+
+
+def split_splines(standardGcode):
+    """Split a list of Gcode instances with identical Z-value in splines.
+    
+    A spline is a series of points that are connected by an extruded line.
+    A new spline starts at every move in the X/Y plane where no plastic is
+    extruded (i.e., E is not changed, or plastic is retracted).
+    
+    return  :   a list of lists of Gcode instances. Only splines with 2 or 
+                more points are returned.
+    """
+    # create a list of points for the first spline.
+    lastSplinePoint = standardGcode[0]                                 
+    splines = [[lastSplinePoint]]
+    
+    for indexNr in range(1, len(standardGcode)):
+        currSplinePoint = standardGcode[indexNr]
+        
+        if (currSplinePoint.X != lastSplinePoint.X or currSplinePoint.Y != lastSplinePoint.Y    # X and/or Y coordinates differ --> movement
+                or currSplinePoint.arcPoints is not None):                      # (a full circle arc ends where it started)
+            if currSplinePoint.E - lastSplinePoint.E > 0.0:                     # E-value changed: plastic is extruded
+                splines[-1].append(currSplinePoint)                             # take the last spline we're working on, and append to it
+            else:                                                               # E-value is not changed, or plastic is retracted
+                splines.append([currSplinePoint])                               # add a new spline, with this point as first point
+            lastSplinePoint = currSplinePoint
+        else:
+            # no movement in X and Y directions. We don't care what happens for now
+            # might become useful later, when dE- or dF-value information is used
+            pass
+
+    # For drawing stuff, we are only interested in splines with 2 or more points.
+    # Hence, remove all the splines with length of 1, i.e. that contain only one command        
+    return [spline for spline in splines if len(spline) >= 2]
+
+
+def iter_spline_points(spline):
+    """Yield the (x, y, z) points of a spline of Gcode instances.
+    
+    For arc moves, the intermediate points of the arc are included. The arc
+    points of the first command are skipped: the spline starts at its end point.
+    """
+    for indexNr, cmd in enumerate(spline):
+        if cmd.arcPoints is not None and indexNr > 0:
+            arcPoints = cmd.arcPoints
+            for pointNr in range(0, len(arcPoints), 3):
+                yield arcPoints[pointNr], arcPoints[pointNr + 1], arcPoints[pointNr + 2]
+        yield cmd.X, cmd.Y, cmd.Z
+
+
+def tessellate_arcs(arcs, tolerance=0.01):
+    """Compute the intermediate points of arc moves (G2, G3).
+    
+    All arcs are processed in one go: first the center, radius and sweep 
+    angle of every arc are computed, then the amount of segments each arc 
+    needs, and finally the points. An arc is split in so many segments that
+    the distance between the arc and a segment (the chord error) is at most
+    'tolerance' (mm). If the end point has another Z than the start point 
+    (a helix), Z changes linearly along the arc.
+    
+    The points are stored in 'cmd.arcPoints' of each arc.
+    
+    An arc with I/J that ends where it starts is a full circle. With R, such
+    an arc has no defined center (any circle through the start point fits);
+    it gets no points, so it is drawn as a straight move, and is returned.
+    
+    arcs        :   a list of (cmd, startX, startY, startZ) tuples: the resolved
+                    arc Gcode instance, and the position where the arc starts
+    tolerance   :   the maximum chord error in mm
+    
+    return      :   list with the names (line numbers) of the arcs without points
+    """
+    invalidArcs = []
+    # (1) center, radius, start angle and sweep angle of every arc
+    arcGeometry = []
+    for cmd, startX, startY, startZ in arcs:
+        clockwise = (cmd.command == "G2")
+        endX, endY = cmd.X, cmd.Y
+
+        if "R" in cmd.parameters:
+            # radius format: the center lies on the perpendicular bisector of 
+            # start and end point. A negative R selects the arc larger than 180 degrees.
+            radius = cmd.parameters["R"]
+            dx, dy = endX - startX, endY - startY
+            chord = math.hypot(dx, dy)
+            if chord == 0.0:
+                cmd.arcPoints = array('d')
+                invalidArcs.append(cmd.name)
+                continue
+            h = -math.sqrt(max(4.0 * radius * radius - dx * dx - dy * dy, 0.0)) / chord
+            if not clockwise:
+                h = -h
+            if radius < 0.0:
+                h = -h
+            centerX = startX + 0.5 * (dx - dy * h)
+            centerY = startY + 0.5 * (dy + dx * h)
+        else:
+            centerX = startX + cmd.parameters.get("I", 0.0)
+            centerY = startY + cmd.parameters.get("J", 0.0)
+
+        radius = math.hypot(startX - centerX, startY - centerY)
+        startAngle = math.atan2(startY - centerY, startX - centerX)
+        sweep = math.atan2(endY - centerY, endX - centerX) - startAngle
+        if clockwise and sweep >= -1e-9:
+            sweep -= 2.0 * math.pi
+        elif not clockwise and sweep <= 1e-9:
+            sweep += 2.0 * math.pi
+        arcGeometry.append((cmd, centerX, centerY, radius, startAngle, sweep, startZ))
+
+    # (2) the amount of segments for every arc, from the maximum angle per segment
+    segmentCounts = []
+    for cmd, centerX, centerY, radius, startAngle, sweep, startZ in arcGeometry:
+        if radius > tolerance:
+            maxAngle = 2.0 * math.acos(1.0 - tolerance / radius)
+        else:
+            maxAngle = math.pi / 2.0
+        segmentCounts.append(max(1, int(math.ceil(abs(sweep) / maxAngle))))
+
+    # (3) the intermediate points
+    for (cmd, centerX, centerY, radius, startAngle, sweep, startZ), segmentCount in zip(arcGeometry, segmentCounts):
+        arcPoints = array('d')
+        deltaZ = cmd.Z - startZ
+        for segmentNr in range(1, segmentCount):
+            fraction = segmentNr / segmentCount
+            angle = startAngle + sweep * fraction
+            arcPoints.append(centerX + radius * math.cos(angle))
+            arcPoints.append(centerY + radius * math.sin(angle))
+            arcPoints.append(startZ + deltaZ * fraction)
+        cmd.arcPoints = arcPoints
+    return invalidArcs
+
+
+def tessellate_arcs_numpy(arcs, tolerance=0.01):
+    """The same as 'tessellate_arcs', with numpy arrays.
+    
+    Each of the three steps is done for all arcs at once; only the values
+    of the commands are collected, and the points are stored, per arc.
+    """
+    if not arcs:
+        return []
+    commands = [arc[0] for arc in arcs]
+    startX, startY, startZ = [numpy.array([arc[index] for arc in arcs], dtype=numpy.float64) for index in (1, 2, 3)]
+    endX, endY, endZ = [numpy.array([getattr(cmd, axis) for cmd in commands], dtype=numpy.float64) for axis in "XYZ"]
+    clockwise = numpy.array([cmd.command == "G2" for cmd in commands])
+    withRadius = numpy.array(["R" in cmd.parameters for cmd in commands])
+    radius, offsetI, offsetJ = [numpy.array([cmd.parameters.get(name, 0.0) for cmd in commands], dtype=numpy.float64) 
+                                for name in ("R", "I", "J")]
+
+    # (1) center, radius, start angle and sweep angle of every arc
+    dx, dy = endX - startX, endY - startY
+    chord = numpy.hypot(dx, dy)
+    invalid = withRadius & (chord == 0.0)                                       # (these get no points)
+    h = -numpy.sqrt(numpy.maximum(4.0 * radius * radius - dx * dx - dy * dy, 0.0)) / numpy.where(chord > 0.0, chord, 1.0)
+    h = numpy.where(clockwise, h, -h)
+    h = numpy.where(radius < 0.0, -h, h)
+    centerX = numpy.where(withRadius, startX + 0.5 * (dx - dy * h), startX + offsetI)
+    centerY = numpy.where(withRadius, startY + 0.5 * (dy + dx * h), startY + offsetJ)
+    radius = numpy.hypot(startX - centerX, startY - centerY)
+    startAngle = numpy.arctan2(startY - centerY, startX - centerX)
+    sweep = numpy.arctan2(endY - centerY, endX - centerX) - startAngle
+    sweep = numpy.where(clockwise & (sweep >= -1e-9), sweep - 2.0 * math.pi, sweep)
+    sweep = numpy.where(~clockwise & (sweep <= 1e-9), sweep + 2.0 * math.pi, sweep)
+
+    # (2) the amount of segments for every arc, from the maximum angle per segment
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        maxAngle = numpy.where(radius > tolerance, 2.0 * numpy.arccos(1.0 - tolerance / radius), math.pi / 2.0)
+    segmentCounts = numpy.maximum(1, numpy.ceil(numpy.abs(sweep) / maxAngle)).astype(numpy.int64)
+    segmentCounts[invalid] = 1
+
+    # (3) the intermediate points of all arcs, as (arc, segment) pairs
+    pointCounts = segmentCounts - 1
+    pointEnds = numpy.cumsum(pointCounts)
+    arcNrs = numpy.repeat(numpy.arange(len(arcs)), pointCounts)
+    fraction = (numpy.arange(len(arcNrs)) - (pointEnds - pointCounts)[arcNrs] + 1) / segmentCounts[arcNrs]
+    angle = startAngle[arcNrs] + sweep[arcNrs] * fraction
+    points = numpy.empty((len(arcNrs), 3))
+    points[:, 0] = centerX[arcNrs] + radius[arcNrs] * numpy.cos(angle)
+    points[:, 1] = centerY[arcNrs] + radius[arcNrs] * numpy.sin(angle)
+    points[:, 2] = startZ[arcNrs] + (endZ - startZ)[arcNrs] * fraction
+    allPoints = array('d')
+    allPoints.frombytes(points.tobytes())
+    pointStart = 0
+    for cmd, pointEnd in zip(commands, (3 * pointEnds).tolist()):
+        cmd.arcPoints = allPoints[pointStart:pointEnd]
+        pointStart = pointEnd
+    return [cmd.name for cmd, isInvalid in zip(commands, invalid.tolist()) if isInvalid]
+
+
+# the affine transform that does not change anything (see 'compose_transforms')
+identityTransform = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+
+def compose_transforms(first, second):
+    """Returns the affine transform that applies 'first', and then 'second'.
+    
+    A transform (a, b, c, d, e, f) is the matrix [[a, b, c], [d, e, f], [0, 0, 1]]:
+    it moves the point (x, y) to (a*x + b*y + c, d*x + e*y + f).
+    """
+    a1, b1, c1, d1, e1, f1 = first
+    a2, b2, c2, d2, e2, f2 = second
+    return (a2 * a1 + b2 * d1, a2 * b1 + b2 * e1, a2 * c1 + b2 * f1 + c2,
+            d2 * a1 + e2 * d1, d2 * b1 + e2 * e1, d2 * c1 + e2 * f1 + f2)
+
+
+def transform_coordinates(coordinates, matrix, stride=3, offset=0):
+    """Apply an affine transform to a flat array (x0, y0, z0, x1, ...), in place.
+    
+    All X and all Y values are computed at once, as slices of the array.
+    The X values are at 'offset', 'offset + stride', ...; each Y follows its X.
+    """
+    a, b, c, d, e, f = matrix
+    xValues, yValues = coordinates[offset::stride], coordinates[offset + 1::stride]
+    coordinates[offset::stride] = array('d', [a * x + b * y + c for x, y in zip(xValues, yValues)])
+    coordinates[offset + 1::stride] = array('d', [d * x + e * y + f for x, y in zip(xValues, yValues)])
+    return coordinates
+
+
+def is_conformal(matrix, tolerance=1e-9):
+    """Returns True if an affine transform keeps a circle a circle.
+    
+    That is any combination of moves, rotations, mirrors and a scale that
+    is the same along X and Y. Other transforms turn arcs into ellipses,
+    which Gcode cannot describe.
+    """
+    a, b, c, d, e, f = matrix
+    tolerance = tolerance * (abs(a) + abs(b) + abs(d) + abs(e))
+    return ((abs(a - e) <= tolerance and abs(b + d) <= tolerance) or 
+            (abs(a + e) <= tolerance and abs(b - d) <= tolerance))
+
+
+def arc_to_moves(cmd, lastCmd):
+    """Returns the G1 moves through the tessellated points of an arc move (G2, G3).
+    
+    The extrusion is divided over the moves like the points divide the arc
+    (see 'tessellate_arcs'); the last move has the end point and the 
+    comment of the arc. 
+    
+    lastCmd :   the command before the arc (the arc starts at its E), or None
+    """
+    points = cmd.arcPoints or ()
+    pointCount = len(points) // 3
+    startE = lastCmd.E if lastCmd is not None else None
+    moves = []
+    for pointNr in range(pointCount):
+        move = Gcode(cmd.name)
+        move.command = "G1"
+        move.X, move.Y, move.Z = points[3 * pointNr], points[3 * pointNr + 1], points[3 * pointNr + 2]
+        if cmd.E is None or startE is None:
+            move.E = cmd.E
+        else:
+            move.E = startE + (cmd.E - startE) * (pointNr + 1) / (pointCount + 1)
+        move.F, move.T = cmd.F, cmd.T
+        moves.append(move)
+    endMove = cmd.copy()
+    endMove.command = "G1"
+    endMove.parameters = dict((key, value) for key, value in cmd.parameters.items() 
+                              if key not in ("I", "J", "K", "R", "P"))
+    endMove.arcPoints = None
+    moves.append(endMove)
+    return moves
+
+
+def transform_gcode(cmd, matrix):
+    """Returns a copy of a Gcode instance, with an affine transform applied.
+    
+    X and Y are transformed (when both are known), like the tessellated 
+    points of an arc. The I/J offsets of an arc are rotated and scaled with 
+    it, R is scaled, and a mirrored arc changes direction (G2 <-> G3).
+    The I/J of an arc are only valid for a conformal transform (see 
+    'is_conformal'); 'iter_transform_gcode' replaces the arc by G1 moves 
+    otherwise.
+    """
+    a, b, c, d, e, f = matrix
+    newCmd = cmd.copy()
+    if cmd.X is not None and cmd.Y is not None:
+        newCmd.X = a * cmd.X + b * cmd.Y + c
+        newCmd.Y = d * cmd.X + e * cmd.Y + f
+    if cmd.command in ("G2", "G3"):
+        newCmd.parameters = dict(cmd.parameters)
+        if "I" in cmd.parameters or "J" in cmd.parameters:
+            offsetI, offsetJ = cmd.parameters.get("I", 0.0), cmd.parameters.get("J", 0.0)
+            newCmd.parameters["I"] = a * offsetI + b * offsetJ
+            newCmd.parameters["J"] = d * offsetI + e * offsetJ
+        if "R" in cmd.parameters:
+            newCmd.parameters["R"] = cmd.parameters["R"] * math.sqrt(abs(a * e - b * d))
+        if a * e - b * d < 0.0:
+            newCmd.command = "G3" if cmd.command == "G2" else "G2"
+    if cmd.arcPoints is not None:
+        newCmd.arcPoints = transform_coordinates(array('d', cmd.arcPoints), matrix)
+    return newCmd
+
+
+def iter_transform_gcode(standardGcode, matrix, lastCmd=None):
+    """Yields transformed copies of Gcode instances (see 'transform_gcode').
+    
+    When the transform is not conformal (see 'is_conformal'), each arc is 
+    replaced by G1 moves through its transformed points (see 'arc_to_moves'),
+    so the result is still valid Gcode.
+    
+    lastCmd :   the command before 'standardGcode', or None
+    """
+    conformal = is_conformal(matrix)
+    for cmd in standardGcode:
+        newCmd = transform_gcode(cmd, matrix)
+        if conformal or cmd.command not in ("G2", "G3"):
+            yield newCmd
+        else:
+            for move in arc_to_moves(newCmd, lastCmd):
+                yield move
+        lastCmd = cmd
+
+
+# the first bytes of compressed files, and the file name suffixes, per type of compression
+compressionMagic = ((b"\x1f\x8b", "gzip"), (b"\xfd7zXZ\x00", "xz"), (b"BZh", "bz2"))
+compressionSuffixes = {".gz": "gzip", ".xz": "xz", ".lzma": "xz", ".bz2": "bz2"}
+
+
+def detect_compression(filename):
+    """Returns the compression of a file: 'gzip', 'xz', 'bz2', or None for plain text.
+    
+    The first bytes of the file decide; the file name suffix is only used
+    when these do not match a known compression.
+    """
+    with open(filename, mode="rb") as gcodeFile:
+        head = gcodeFile.read(6)
+    for magic, compression in compressionMagic:
+        if head.startswith(magic):
+            return compression
+    return compressionSuffixes.get(os.path.splitext(filename)[1].lower())
+
+
+def open_gcode(filename):
+    """Open a .gcode file for reading (in binary mode). 
+    
+    Compressed files are decompressed while they are read."""
+    compression = detect_compression(filename)
+    if compression == "gzip":
+        return gzip.open(filename, mode="rb")
+    elif compression == "bz2":
+        return bz2.BZ2File(filename, mode="rb")
+    elif compression == "xz":
+        if lzma is None:
+            raise IOError("'{0}' is xz compressed; this needs Python 3.3 or newer".format(filename))
+        return lzma.open(filename, mode="rb")
+    return open(filename, mode="rb")
+
+
+def iter_gcode_blocks(filename, blockSize=1 << 20):
+    """Yields the lines of a (compressed) .gcode file, one (lines, fraction) tuple per block.
+    
+    The file is read (and decompressed) in blocks of 'blockSize' bytes. Every
+    block is cut after its last line break and decoded at once; the rest 
+    is kept for the next block. Trailing whitespace is removed from the lines,
+    like 'import_rawGcode' always did. The fraction (0.0 - 1.0) is the part 
+    of the file (as stored on disk, so also for compressed files) read so far.
+    """
+    fileSize = float(max(os.path.getsize(filename), 1))
+    compression = detect_compression(filename)
+    with open(filename, mode="rb") as rawFile:
+        if compression == "gzip":
+            gcodeFile = gzip.GzipFile(fileobj=rawFile, mode="rb")
+        elif compression == "bz2":
+            gcodeFile = bz2.BZ2File(rawFile, mode="rb")
+        elif compression == "xz":
+            if lzma is None:
+                raise IOError("'{0}' is xz compressed; this needs Python 3.3 or newer".format(filename))
+            gcodeFile = lzma.LZMAFile(rawFile, mode="rb")
+        else:
+            gcodeFile = rawFile
+        rest = b""
+        while True:
+            block = gcodeFile.read(blockSize)
+            if not block:
+                break
+            block = rest + block
+            end = block.rfind(b"\n") + 1
+            rest = block[end:]
+            if end > 0:
+                yield ([line.strip() for line in block[:end].decode("utf-8", "replace").split("\n")[:-1]], 
+                       min(rawFile.tell() / fileSize, 1.0))
+        if rest:
+            yield [rest.decode("utf-8", "replace").strip()], 1.0
+
+
+def iter_gcode_lines(filename, blockSize=1 << 20):
+    """Yields the lines of a (compressed) .gcode file, one list of lines per block 
+    (see 'iter_gcode_blocks')."""
+    for lines, fraction in iter_gcode_blocks(filename, blockSize):
+        yield lines
+
+
+# ----- slicer metadata -----
+# the comment lines that start or end a thumbnail (base64 image data in between)
+thumbnailPattern = re.compile(r"thumbnail(?:_(\w+))? (begin|end)(?: (\d+)x(\d+))?")
+# the start of the first layer ends the header; the last move (not G28 and the like) starts the footer
+layerStartPattern = re.compile(r";\s*(?:LAYER:|LAYER_CHANGE|CHANGE_LAYER|layer \d)")
+movePattern = re.compile(r"G[0-3](?![0-9])")
+durationPattern = re.compile(r"(\d+(?:\.\d+)?)\s*([dhms])")
+durationUnits = {"d": 86400.0, "h": 3600.0, "m": 60.0, "s": 1.0}
+numberPattern = re.compile(r"-?\d+(?:\.\d+)?")
+commaSettingPattern = re.compile(r"(\w+),(.*)$")                                  # Simplify3D: 'layerHeight,0.2'
+colonSettingPattern = re.compile(r"([A-Za-z][\w .\[\]()/-]{0,60}?)\s*:\s*(.*)$")   # Cura: 'Layer height: 0.2'
+
+# the values that 'read_gcode_metadata' normalizes: (name, the key of a slicer, how to convert
+# its value). The first key that is found (and converts) gives the value.
+metadataKeys = (("printTime", "estimated printing time (normal mode)", "duration"),     # PrusaSlicer, SuperSlicer, OrcaSlicer
+                ("printTime", "TIME", "duration"),                                      # Cura (seconds)
+                ("printTime", "Build time", "duration"),                                # Simplify3D
+                ("printTime", "total estimated time", "duration"),                      # Bambu Studio, OrcaSlicer
+                ("filamentLength", "filament used [mm]", "sum"),
+                ("filamentLength", "Filament used", "meters"),
+                ("filamentLength", "Filament length", "first"),
+                ("filamentWeight", "total filament used [g]", "first"),
+                ("filamentWeight", "filament used [g]", "sum"),
+                ("filamentWeight", "Plastic weight", "first"),
+                ("layerHeight", "layer_height", "first"),
+                ("layerHeight", "Layer height", "first"),
+                ("layerHeight", "layerHeight", "first"),
+                ("layerCount", "LAYER_COUNT", "first"),
+                ("layerCount", "total layer number", "first"),
+                ("layerCount", "total layers count", "first"))
+
+
+def parse_duration(text):
+    """Returns the seconds (float) of a duration like '1d 2h 3m 4s', '1 hour 25 minutes' 
+    or '5025' (seconds), or None if there is no duration in the text."""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    seconds = None
+    for number, unit in durationPattern.findall(text.lower()):
+        seconds = (seconds or 0.0) + float(number) * durationUnits[unit]
+    return seconds
+
+
+def convert_metadata_value(text, conversion):
+    """Returns the number in a metadata value (see 'metadataKeys'), or None"""
+    if conversion == "duration":
+        return parse_duration(text)
+    numbers = [float(number) for number in numberPattern.findall(text)]
+    if not numbers:
+        return None
+    if conversion == "sum":                                                     # one value per extruder: '12.3, 45.6'
+        return sum(numbers)
+    elif conversion == "meters":
+        return sum(numbers) * 1000.0
+    return numbers[0]
+
+
+def parse_metadata_comments(lines, metadata):
+    """Add the key/values and thumbnails of the comment lines to 'metadata' (see 'read_gcode_metadata').
+    
+    Recognized are the comments of PrusaSlicer and its derivatives ('; key = value'),
+    Cura (';KEY:value') and Simplify3D (';   key,value' and ';   Key: value'). 
+    Lines that are not comments are skipped.
+    """
+    settings = metadata["settings"]
+    thumbnail = None
+    for line in lines:
+        if not line.startswith(";"):
+            continue
+        text = line[1:].strip()
+
+        match = thumbnailPattern.match(text)
+        if thumbnail is not None:
+            if match is None or match.group(2) != "end":
+                thumbnail["data"].append(text)
+                continue
+            try:
+                thumbnail["data"] = base64.b64decode("".join(thumbnail["data"]).encode("ascii"))
+                metadata["thumbnails"].append(thumbnail)
+            except (binascii.Error, UnicodeEncodeError, ValueError):
+                pass                                                            # (a damaged thumbnail is left out)
+            thumbnail = None
+            continue
+        if match is not None:
+            if match.group(2) == "begin" and match.group(3) is not None:
+                thumbnail = {"width": int(match.group(3)), "height": int(match.group(4)),
+                             "format": (match.group(1) or "png").lower(), "data": []}
+            continue
+
+        lowerText = text.lower()
+        if metadata["slicer"] is None and ("generated by " in lowerText or "generated with " in lowerText):
+            start = lowerText.find("generated by ") if "generated by " in lowerText else lowerText.find("generated with ")
+            metadata["slicer"] = text[start:].split(" ", 2)[2].strip()
+            continue
+        if text.startswith("SETTING_"):                                         # Cura: the profile as JSON, split over lines
+            continue
+        if " = " in text:
+            key, value = text.split(" = ", 1)
+            settings[key.strip()] = value.strip()
+            continue
+        for part in text.split("; "):                                           # (Bambu Studio: '; key: value; key: value')
+            match = commaSettingPattern.match(part) or colonSettingPattern.match(part)
+            if match is not None:
+                settings[match.group(1).strip()] = match.group(2).strip()
+
+
+def read_gcode_metadata(filename, headSize=1 << 16, tailSize=1 << 16):
+    """Read the settings and summaries that slicers write in comments, without parsing the file.
+    
+    Only the first 'headSize' and last 'tailSize' bytes of the file are read 
+    (thumbnails at the start are read to their end), so this takes a few 
+    milliseconds, whatever the size of the file. Compressed files can not 
+    be read from the end: they are decompressed up to the end, which takes 
+    longer, but memory stays bounded.
+    
+    Only the comments before the first layer (or the first move, if there is no
+    layer comment) and after the last move are used, so the comments in 
+    between (';LAYER:12', ';TYPE:WALL-OUTER') are left out.
+    
+    return  :   dict with:
+                slicer          :   the text after 'generated by' or 'generated with', or None
+                settings        :   dict with all key/values (strings), as written by the slicer
+                thumbnails      :   list of dicts with width, height, format ('png', 'jpg', 
+                                    'qoi') and data (bytes, the image file)
+                printTime       :   the estimated print time (s) of the slicer, or None
+                filamentLength  :   the length of filament (mm), or None
+                filamentWeight  :   the weight of filament (g), or None
+                layerHeight     :   the layer height (mm), or None
+                layerCount      :   the amount of layers, or None
+    """
+    with open_gcode(filename) as gcodeFile:
+        head = gcodeFile.read(headSize)
+        while True:                                                             # read on to the end of an unfinished thumbnail
+            markers = thumbnailPattern.findall(head[-4 * headSize:].decode("ascii", "replace"))
+            if not markers or markers[-1][1] != "begin":
+                break
+            block = gcodeFile.read(headSize)
+            if not block:
+                break
+            head += block
+        position = len(head)
+        if detect_compression(filename) is None:
+            tailStart = max(position, gcodeFile.seek(0, os.SEEK_END) - tailSize)
+            gcodeFile.seek(tailStart)
+            tail = gcodeFile.read()
+        else:
+            tail = b""
+            while True:
+                block = gcodeFile.read(1 << 20)
+                if not block:
+                    break
+                position += len(block)
+                tail = (tail + block)[-tailSize:]
+            tailStart = position - len(tail)
+
+    wholeFile = tailStart == len(head)
+    if wholeFile:
+        lines = (head + tail).decode("utf-8", "replace").splitlines()
+        headLines, tailLines = lines, lines
+    else:
+        headLines = head[:head.rfind(b"\n") + 1].decode("utf-8", "replace").splitlines()
+        tailLines = tail[tail.find(b"\n") + 1:].decode("utf-8", "replace").splitlines()
+    headLines = [line.strip() for line in headLines]
+    tailLines = [line.strip() for line in tailLines]
+
+    firstMove = next((lineNr for lineNr, line in enumerate(headLines) if layerStartPattern.match(line)), None)
+    if firstMove is None:
+        firstMove = next((lineNr for lineNr, line in enumerate(headLines) if movePattern.match(line)), len(headLines))
+    lastMove = next((lineNr for lineNr in range(len(tailLines) - 1, -1, -1) if movePattern.match(tailLines[lineNr])), -1)
+    metadata = {"slicer": None, "settings": dict(), "thumbnails": []}
+    parse_metadata_comments(headLines[:firstMove], metadata)
+    if not wholeFile or lastMove >= firstMove:                     # (without moves, the header is the whole file)
+        parse_metadata_comments(tailLines[lastMove + 1:], metadata)
+
+    for name, key, conversion in metadataKeys:
+        if metadata.get(name) is None and key in metadata["settings"]:
+            metadata[name] = convert_metadata_value(metadata["settings"][key], conversion)
+    for name in ("printTime", "filamentLength", "filamentWeight", "layerHeight", "layerCount"):
+        metadata.setdefault(name, None)
+    if metadata["layerCount"] is not None:
+        metadata["layerCount"] = int(metadata["layerCount"])
+    return metadata
+
+
+# the amount of decimals that 'write_gcode' uses per parameter
+exportDecimals = {"X": 3, "Y": 3, "Z": 3, "E": 5, "F": 1, "I": 3, "J": 3, "R": 3, "S": 1, "P": 1}
+
+
+def serialize_command(cmd, formats):
+    """Returns the text of a single Gcode instance, like 'Gcode.__str__' does, but 
+    with the numbers formatted by 'formats' (a dict like {'X': '%.3f', ...})."""
+    command = cmd.command
+    parameters = cmd.parameters
+
+    if command == "comment":
+        if "comment" in parameters:
+            return "(" + parameters["comment"].strip() + ")"
+        return "( *** " + cmd.name + ", without 'comment' parameter *** )"
+    elif command.startswith("T"):
+        return command
+
+    parts = [command]
+    if command.startswith("M") or command in ("G4", "G04"):
+        for parameter in ("S", "P"):
+            if parameter in parameters:
+                value = parameters[parameter]
+                if isinstance(value, (int, float)):
+                    value = formats[parameter] % value
+                parts.append(parameter + str(value))
+    else:
+        for parameter, value in (("X", cmd.X), ("Y", cmd.Y), ("Z", cmd.Z), ("E", cmd.E), ("F", cmd.F)):
+            if value is not None:
+                parts.append(parameter + formats[parameter] % value)
+        if command in ("G2", "G3"):
+            for parameter in ("I", "J", "R"):
+                if parameter in parameters:
+                    parts.append(parameter + formats[parameter] % parameters[parameter])
+
+    if "comment" in parameters:
+        parts.append("(" + str(parameters["comment"]) + ")")
+    return " ".join(parts).strip()
+
+
+def iter_serialize_gcode(standardGcode, decimals=None, blockSize=50000, transform=None):
+    """Yields the text of a list of Gcode instances, in blocks of 'blockSize' lines.
+    
+    Plain moves (G0/G1 with all coordinates known, and without comment) are 
+    the bulk of a file. Their values are collected in one flat list per run
+    of moves, and the whole run is formatted with a single '%' operation. All
+    other commands go through 'serialize_command'. Every number has a fixed
+    amount of decimals, so the output is the same on every run and platform.
+    
+    standardGcode   :   a list of resolved Gcode instances
+    decimals        :   dict with the amount of decimals per parameter 
+                        (default: 'exportDecimals')
+    blockSize       :   the amount of lines per block of text
+    transform       :   an affine transform (see 'compose_transforms') of the 
+                        X/Y coordinates, or None; the moves are not copied for 
+                        it: the X/Y values of each run are transformed at once
+    """
+    if transform == identityTransform:
+        transform = None
+    if decimals is None:
+        decimals = exportDecimals
+    formats = dict((parameter, "%.{0}f".format(decimals[parameter])) for parameter in exportDecimals)
+    moveFormat = "%s X{X} Y{Y} Z{Z} E{E} F{F}\n".format(**formats)
+
+    def format_moves(values):
+        if transform is not None:
+            transform_coordinates(values, transform, 6, 1)                      # (the X/Y of the whole run at once)
+        return moveFormat * (len(values) // 6) % tuple(values)
+
+    for start in range(0, len(standardGcode), blockSize):
+        parts = []
+        values = []                                                             # flat values of the current run of moves
+        block = standardGcode[start:start + blockSize]
+        lastCmd = standardGcode[start - 1] if start > 0 else None
+        for cmd in block:
+            command = cmd.command
+            if ((command == "G1" or command == "G0") and "comment" not in cmd.parameters 
+                    and None not in (cmd.X, cmd.Y, cmd.Z, cmd.E, cmd.F)):
+                values.extend((command, cmd.X, cmd.Y, cmd.Z, cmd.E, cmd.F))
+            else:
+                if values:
+                    parts.append(format_moves(values))
+                    values = []
+                if transform is None:
+                    parts.append(serialize_command(cmd, formats) + "\n")
+                else:
+                    for newCmd in iter_transform_gcode([cmd], transform, lastCmd):
+                        parts.append(serialize_command(newCmd, formats) + "\n")
+            lastCmd = cmd
+        if values:
+            parts.append(format_moves(values))
+        yield "".join(parts)
+
+
+def write_gcode(standardGcode, outFile, decimals=None, blockSize=50000, transform=None):
+    """Write a list of Gcode instances as text, one block of lines at a time.
+    
+    outFile     :   a file name, or an open file object (like sys.stdout, or a pipe)
+    transform   :   an affine transform of the X/Y coordinates, or None
+    
+    return      :   the amount of lines that is written
+    """
+    if hasattr(outFile, "write"):
+        for block in iter_serialize_gcode(standardGcode, decimals, blockSize, transform):
+            outFile.write(block)
+    else:
+        # newline="\n": the same bytes on every platform
+        with open(outFile, mode="w", newline="\n", buffering=1 << 20) as gcodeOutFile:
+            for block in iter_serialize_gcode(standardGcode, decimals, blockSize, transform):
+                gcodeOutFile.write(block)
+    return len(standardGcode)
+
+
+# the binary toolpath format: the columns, in file order, with their array type codes
+toolpathMagic = b"GCTP"
+toolpathVersion = 2                                                             # 2: the 'name' column
+toolpathColumns = (("lineNr", "i"), ("name", "i"), ("command", "I"), 
+                   ("X", "d"), ("Y", "d"), ("Z", "d"), ("E", "d"), ("F", "d"), 
+                   ("T", "H"), ("comment", "i"), ("parameters", "I"), 
+                   ("arcIndex", "I"), ("arcPoints", "d"), 
+                   ("stringIndex", "I"), ("stringData", "B"), ("statistics", "B"))
+toolpathHeader = struct.Struct("<4sHHQ")                                        # magic, version, column count, command count
+toolpathColumnEntry = struct.Struct("<16scxxxxxxxQQ")                           # name, type code, offset, size (bytes)
+
+
+def write_toolpath(columns, filename, statistics=None):
+    """Write columns (see 'Extruder.get_columns') to a binary toolpath file.
+    
+    The file layout (all values little-endian):
+        header          :   magic b'GCTP', version, column count, command count
+        column entries  :   per column: name, array type code, offset and size in bytes
+        column blocks   :   the raw array data of each column, 8-byte aligned
+    
+    The string table is stored in two columns: 'stringData' has all unique
+    strings (utf-8) after each other, and string n is 
+    stringData[stringIndex[n]:stringIndex[n + 1]]. The 'statistics' column
+    has the statistics (see 'Extruder.get_statistics') as JSON (utf-8), 
+    or is empty.
+    
+    Names of commands are kept as int (line numbers) or str; other types
+    of names come back as str. The parameters go through JSON, so tuples 
+    come back as lists, and keys that are not strings come back as str.
+    
+    NOTE: this is a format of our own, to pass parsed toolpaths between tools.
+          It is not the binary G-code format (.bgcode) of current slicers; 
+          a printer cannot read it.
+    """
+    stringIndex = array("I", [0])
+    stringData = bytearray()
+    for text in columns["strings"]:
+        stringData.extend(text.encode("utf-8"))
+        stringIndex.append(len(stringData))
+    blocks = dict(columns)
+    blocks["stringIndex"] = stringIndex
+    blocks["stringData"] = array("B", bytes(stringData))
+    blocks["statistics"] = array("B", json.dumps(statistics).encode("utf-8") if statistics is not None else b"")
+
+    if sys.byteorder != "little":
+        for columnName, typeCode in toolpathColumns:
+            blocks[columnName] = array(typeCode, blocks[columnName])
+            blocks[columnName].byteswap()
+
+    offset = toolpathHeader.size + toolpathColumnEntry.size * len(toolpathColumns)
+    entries = []
+    for columnName, typeCode in toolpathColumns:
+        offset += -offset % 8                                                   # align each block to 8 bytes
+        size = len(blocks[columnName]) * blocks[columnName].itemsize
+        entries.append((columnName, typeCode, offset, size))
+        offset += size
+
+    with open(filename, mode="wb") as toolpathFile:
+        toolpathFile.write(toolpathHeader.pack(toolpathMagic, toolpathVersion, 
+                                               len(toolpathColumns), len(columns["lineNr"])))
+        for columnName, typeCode, offset, size in entries:
+            toolpathFile.write(toolpathColumnEntry.pack(columnName.encode("ascii"), 
+                                                        typeCode.encode("ascii"), offset, size))
+        for columnName, typeCode, offset, size in entries:
+            toolpathFile.write(b"\0" * (offset - toolpathFile.tell()))
+            blocks[columnName].tofile(toolpathFile)
+
+
+class ToolpathFile:
+    """A binary toolpath file (see 'write_toolpath'), opened as memory map.
+    
+    The columns are memoryviews on the mapped file: no data is read or 
+    parsed until it is used. Use it as a context manager, or call 'close'.
+    
+    Variables:
+        filename    :   the name of the toolpath file
+        version     :   the format version of the file
+        count       :   the amount of commands in the file
+        columns     :   dict with a memoryview per column (on big-endian 
+                        machines: a byte-swapped array copy)
+    """
+
+    def __init__(self, filename):
+        """Open and map a toolpath file, and check its header"""
+        self.filename = filename
+        self.columns = dict()
+        self._file = open(filename, mode="rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, self.version, columnCount, self.count = toolpathHeader.unpack_from(self._map, 0)
+        if magic != toolpathMagic:
+            self.close()
+            raise ValueError("'{0}' is not a toolpath file".format(filename))
+        if self.version > toolpathVersion:
+            self.close()
+            raise ValueError("'{0}' has toolpath format version {1}, this reader supports up to {2}".format(
+                                filename, self.version, toolpathVersion))
+
+        for columnNr in range(columnCount):
+            name, typeCode, offset, size = toolpathColumnEntry.unpack_from(
+                        self._map, toolpathHeader.size + columnNr * toolpathColumnEntry.size)
+            name = name.rstrip(b"\0").decode("ascii")
+            typeCode = typeCode.decode("ascii")
+            if sys.byteorder == "little":
+                self.columns[name] = self._view[offset:offset + size].cast(typeCode)
+            else:
+                column = array(typeCode, self._view[offset:offset + size].tobytes())
+                column.byteswap()
+                self.columns[name] = column
+        self._strings = dict()
+
+    def __repr__(self):
+        """returns a representation of a 'ToolpathFile' object"""
+        return "<ToolpathFile: '{0.filename}', version {0.version}, {0.count} commands>".format(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Release the columns and the memory map"""
+        for column in self.columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self.columns = dict()
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+            self._map.close()
+            self._file.close()
+
+    def get_string(self, index):
+        """Returns string 'index' of the string table"""
+        text = self._strings.get(index)
+        if text is None:
+            stringIndex = self.columns["stringIndex"]
+            text = self._strings[index] = bytes(
+                        self.columns["stringData"][stringIndex[index]:stringIndex[index + 1]]).decode("utf-8")
+        return text
+
+    def get_statistics(self):
+        """Returns the statistics that are stored in the file, or None"""
+        column = self.columns.get("statistics")
+        if column is None or len(column) == 0:                                  # (files without statistics)
+            return None
+        statistics = json.loads(bytes(column).decode("utf-8"))
+        statistics["layers"] = dict((float(layerKey), values) for layerKey, values in statistics["layers"].items())
+        statistics["tools"] = dict((int(tool), values) for tool, values in statistics["tools"].items())
+        return statistics
+
+    def create_gcode(self):
+        """Returns a list of Gcode instances, created from the columns"""
+        columns = self.columns
+        X, Y, Z, E, F = columns["X"], columns["Y"], columns["Z"], columns["E"], columns["F"]
+        arcIndex, arcPoints = columns["arcIndex"], columns["arcPoints"]
+        names = columns.get("name")                                             # (not in version 1 files)
+        parameterCache = dict()
+        standardGcode = []
+
+        for indexNr in range(self.count):
+            lineNr = columns["lineNr"][indexNr]
+            if lineNr >= 0:
+                cmd = Gcode(name=lineNr)
+            else:
+                cmd = Gcode(name=self.get_string(names[indexNr]) if names is not None and names[indexNr] >= 0 else "")
+            cmd.command = self.get_string(columns["command"][indexNr])
+            cmd.X = X[indexNr] if X[indexNr] == X[indexNr] else None            # NaN != NaN: unknown coordinate
+            cmd.Y = Y[indexNr] if Y[indexNr] == Y[indexNr] else None
+            cmd.Z = Z[indexNr] if Z[indexNr] == Z[indexNr] else None
+            cmd.E = E[indexNr] if E[indexNr] == E[indexNr] else None
+            cmd.F = F[indexNr] if F[indexNr] == F[indexNr] else None
+            cmd.T = columns["T"][indexNr]
+
+            parameterIndex = columns["parameters"][indexNr]
+            if parameterIndex not in parameterCache:
+                parameterCache[parameterIndex] = json.loads(self.get_string(parameterIndex))
+            cmd.parameters = dict(parameterCache[parameterIndex])
+            if columns["comment"][indexNr] >= 0:
+                cmd.parameters["comment"] = self.get_string(columns["comment"][indexNr])
+
+            if arcIndex[indexNr + 1] > arcIndex[indexNr]:
+                cmd.arcPoints = array("d", arcPoints[arcIndex[indexNr]:arcIndex[indexNr + 1]])
+            standardGcode.append(cmd)
+
+        return standardGcode
+
+
+def fit_circle(p1, p2, p3):
+    """Returns the (centerX, centerY, radius) of the circle through three (x, y) points,
+    or None if the points are (nearly) on one line."""
+    ax, ay = p1
+    bx, by = p2[0] - ax, p2[1] - ay
+    cx, cy = p3[0] - ax, p3[1] - ay
+    d = 2.0 * (bx * cy - by * cx)
+    if abs(d) < 1e-12:
+        return None
+    bb = bx * bx + by * by
+    cc = cx * cx + cy * cy
+    ux = (cy * bb - by * cc) / d
+    uy = (bx * cc - cx * bb) / d
+    return ax + ux, ay + uy, math.hypot(ux, uy)
+
+
+def arc_fits_points(circle, points, tolerance, maxStepAngle=math.radians(20)):
+    """Check if the points lie on the circle, and follow it in one direction.
+    
+    circle          :   (centerX, centerY, radius)
+    points          :   list of (x, y) points, in the order they are visited
+    tolerance       :   the maximum distance (mm) between the points and the circle
+    maxStepAngle    :   the maximum angle (radians) between two points; this 
+                        keeps polygons like squares and hexagons, of which the 
+                        corners are on a circle too, from becoming arcs
+    
+    return      :   the direction (+1: counter-clockwise, -1: clockwise), or 
+                    0 if the points do not fit
+    """
+    centerX, centerY, radius = circle
+    direction = 0
+    totalAngle = 0.0
+    lastAngle = math.atan2(points[0][1] - centerY, points[0][0] - centerX)
+
+    for indexNr, (x, y) in enumerate(points):
+        if abs(math.hypot(x - centerX, y - centerY) - radius) > tolerance:
+            return 0
+        if indexNr == 0:
+            continue
+
+        angle = math.atan2(y - centerY, x - centerX)
+        delta = angle - lastAngle
+        if delta > math.pi:
+            delta -= 2.0 * math.pi
+        elif delta < -math.pi:
+            delta += 2.0 * math.pi
+        if abs(delta) > maxStepAngle:
+            return 0
+        stepDirection = 1 if delta > 0.0 else -1
+        if direction == 0:
+            direction = stepDirection
+        elif stepDirection != direction:
+            return 0
+        totalAngle += abs(delta)
+        lastAngle = angle
+
+    if totalAngle >= 2.0 * math.pi - 1e-6:                                      # no full circles, or more
+        return 0
+    return direction
+
+
+def arc_can_end(sweep, points, tolerance):
+    """Check if an arc can end at the last of its points: it sweeps less than
+    a full circle, and (after half a circle) does not come back to its start,
+    where the arc move would be read as a full circle (see 'tessellate_arcs')."""
+    if sweep >= 2.0 * math.pi - 1e-6:
+        return False
+    if sweep > math.pi:
+        return math.hypot(points[-1][0] - points[0][0], points[-1][1] - points[0][1]) > 2.0 * tolerance
+    return True
+
+
+def arc_sweep(circle, points):
+    """Returns the angle (radians) that the points sweep around the circle's center;
+    positive for counter-clockwise. Every step between two points is taken as
+    the shortest turn (less than half a circle)."""
+    centerX, centerY, radius = circle
+    sweep = 0.0
+    lastAngle = math.atan2(points[0][1] - centerY, points[0][0] - centerX)
+    for x, y in points[1:]:
+        angle = math.atan2(y - centerY, x - centerX)
+        delta = angle - lastAngle
+        if delta > math.pi:
+            delta -= 2.0 * math.pi
+        elif delta < -math.pi:
+            delta += 2.0 * math.pi
+        sweep += delta
+        lastAngle = angle
+    return sweep
+
+
+def fit_arcs(standardGcode, tolerance=0.01, minimumMoves=3, rateTolerance=0.05, maxRadius=1000.0):
+    """Replace runs of G1 moves that lie on a circular arc by G2/G3 arc moves.
+    
+    The list is processed in two steps:
+    1. Find the runs of consecutive G1 moves that could be joined: moves in 
+       the X/Y plane at the same Z, F and tool, without comments, and with the 
+       same amount of extrusion per mm (within 'rateTolerance'), or no 
+       extrusion at all. 
+    2. Within a run, grow an arc from its first point, move by move. A new 
+       point that fits the current circle is accepted directly; otherwise a 
+       new circle is fitted through the first, middle and last point, and 
+       all points are checked again. When the arc cannot grow any further 
+       and it covers at least 'minimumMoves' moves, these moves are replaced
+       by one arc move.
+       An arc stops before it sweeps a full circle, or when it comes back to
+       within 2 x 'tolerance' of its start: an arc move that ends at its 
+       start is a full circle, so a loop of more than 360 degrees is written
+       as several arcs.
+    
+    The end points of all replaced moves are within 'tolerance' of the arc, 
+    so parsing the output again (see 'tessellate_arcs') gives the same path,
+    but with the straight moves of the slicer replaced by the real circle.
+    Almost straight runs (a radius above 'maxRadius') are left alone.
+    
+    standardGcode   :   a list of resolved Gcode instances
+    tolerance       :   the maximum deviation (mm) of the arc from the moves
+    
+    return          :   a new list of Gcode instances; the input is not changed
+    """
+    fitted = list()
+    indexNr = 0
+    while indexNr < len(standardGcode):
+        # 1. find a run of moves that could be joined; runStart is the start point
+        runStart = standardGcode[indexNr - 1] if indexNr > 0 else None
+        run = []
+        rate = None
+        while runStart is not None and indexNr + len(run) < len(standardGcode):
+            cmd = standardGcode[indexNr + len(run)]
+            last = run[-1] if run else runStart
+            if (cmd.command != "G1" or "comment" in cmd.parameters or cmd.Z != last.Z 
+                    or cmd.F != last.F or cmd.T != last.T or cmd.arcPoints is not None
+                    or None in (cmd.X, cmd.Y, cmd.E, last.X, last.Y, last.E)):
+                break
+            length = math.hypot(cmd.X - last.X, cmd.Y - last.Y)
+            if length == 0.0 or cmd.E < last.E:
+                break
+            cmdRate = (cmd.E - last.E) / length
+            if rate is None:
+                rate = cmdRate
+            elif abs(cmdRate - rate) > rateTolerance * max(abs(rate), 1e-9) and not (rate == 0.0 and cmdRate == 0.0):
+                break
+            run.append(cmd)
+
+        if len(run) < minimumMoves:
+            fitted.append(standardGcode[indexNr])
+            indexNr += 1
+            continue
+
+        # 2. grow arcs within the run
+        points = [(runStart.X, runStart.Y)] + [(cmd.X, cmd.Y) for cmd in run]
+        first = 0
+        while first < len(run):
+            circle = None
+            direction = 0
+            sweep = 0.0                                                         # the angle (radians) the arc covers so far
+            last = first + 1
+            while last < len(points):
+                candidate = points[first:last + 1]
+                if circle is not None and arc_fits_points(circle, candidate[-2:], tolerance) == direction:
+                    sweep += abs(arc_sweep(circle, candidate[-2:]))             # fits the current circle
+                    if not arc_can_end(sweep, candidate, tolerance):
+                        break
+                    last += 1
+                    continue
+                if len(candidate) < 3:
+                    last += 1
+                    continue
+                newCircle = fit_circle(candidate[0], candidate[len(candidate) // 2], candidate[-1])
+                newDirection = 0
+                if newCircle is not None and newCircle[2] <= maxRadius:
+                    newDirection = arc_fits_points(newCircle, candidate, tolerance)
+                if newDirection == 0:
+                    break
+                newSweep = abs(arc_sweep(newCircle, candidate))
+                if not arc_can_end(newSweep, candidate, tolerance):
+                    break
+                circle, direction, sweep = newCircle, newDirection, newSweep
+                last += 1
+
+            moveCount = last - 1 - first                                        # moves covered by the arc
+            if circle is not None and moveCount >= minimumMoves:
+                endCmd = run[first + moveCount - 1]
+                arc = Gcode(name=endCmd.name)
+                arc.command = "G3" if direction > 0 else "G2"
+                arc.X, arc.Y, arc.Z, arc.E, arc.F, arc.T = endCmd.X, endCmd.Y, endCmd.Z, endCmd.E, endCmd.F, endCmd.T
+                arc.parameters = dict(endCmd.parameters)
+                arc.parameters.pop("R", None)
+                arc.parameters["I"] = circle[0] - points[first][0]
+                arc.parameters["J"] = circle[1] - points[first][1]
+                fitted.append(arc)
+                first += moveCount
+            else:
+                fitted.append(run[first])
+                first += 1
+
+        indexNr += len(run)
+
+    return fitted
+
+
+def simplify_spline(coordinates, tolerance):
+    """Simplify a spline with the Ramer-Douglas-Peucker algorithm.
+    
+    Slicers write curved perimeters as many short, nearly collinear line 
+    segments. Points that lie within 'tolerance' (mm) of the line between 
+    the points that are kept, are removed. The first and the last point are 
+    always kept.
+    
+    coordinates :   flat array with the spline points: x0, y0, z0, x1, ...
+    tolerance   :   the maximum deviation in mm
+    
+    return      :   a flat array('d') with the remaining points
+    """
+    pointCount = len(coordinates) // 3
+    if pointCount < 3 or tolerance <= 0.0:
+        return array('d', coordinates)
+
+    keep = bytearray(pointCount)
+    keep[0] = keep[-1] = 1
+    toleranceSquared = tolerance * tolerance
+
+    # Process the (first, last) ranges from a stack instead of by recursion,
+    # so long splines do not hit the recursion limit.
+    stack = [(0, pointCount - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay, az = coordinates[3*first], coordinates[3*first + 1], coordinates[3*first + 2]
+        dx = coordinates[3*last] - ax
+        dy = coordinates[3*last + 1] - ay
+        dz = coordinates[3*last + 2] - az
+        lengthSquared = dx*dx + dy*dy + dz*dz
+
+        maxDistSquared = -1.0
+        maxIndex = first
+        for indexNr in range(first + 1, last):
+            px = coordinates[3*indexNr] - ax
+            py = coordinates[3*indexNr + 1] - ay
+            pz = coordinates[3*indexNr + 2] - az
+            # distance to the line segment (a closed loop has first == last point)
+            if lengthSquared > 0.0:
+                t = (px*dx + py*dy + pz*dz) / lengthSquared
+                t = min(1.0, max(0.0, t))
+                px -= t * dx
+                py -= t * dy
+                pz -= t * dz
+            distSquared = px*px + py*py + pz*pz
+            if distSquared > maxDistSquared:
+                maxDistSquared = distSquared
+                maxIndex = indexNr
+
+        if maxDistSquared > toleranceSquared:
+            keep[maxIndex] = 1
+            stack.append((first, maxIndex))
+            stack.append((maxIndex, last))
+
+    simplified = array('d')
+    for indexNr in range(pointCount):
+        if keep[indexNr]:
+            simplified.extend(coordinates[3*indexNr:3*indexNr + 3])
+    return simplified
+
+
+def simplify_splines_numpy(coordinates, splineLengths, tolerance):
+    """The same as 'simplify_spline', for all splines of a layer at once, with numpy arrays.
+    
+    The (first, last) ranges of all splines are processed together: every
+    round computes the distance of all points in the open ranges to the 
+    line of their range in one pass, and splits each range at its furthest
+    point if that is further than 'tolerance'. The same points are kept as
+    with 'simplify_spline'.
+    
+    coordinates     :   flat array with the points of all splines: x0, y0, z0, x1, ...
+    splineLengths   :   array with the amount of points of each spline
+    
+    return          :   (coordinates, splineLengths): a flat array('d') with 
+                        the remaining points, and array('L') with the amount
+                        of remaining points of each spline
+    """
+    if tolerance <= 0.0:
+        return array('d', coordinates), array('L', splineLengths)
+    points = numpy.asarray(coordinates, dtype=numpy.float64).reshape(-1, 3)
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    lengths = numpy.asarray(splineLengths, dtype=numpy.int64)
+    ends = numpy.cumsum(lengths)
+    starts = ends - lengths
+    nonEmpty = lengths > 0
+    keep = numpy.zeros(len(points), dtype=bool)
+    keep[starts[nonEmpty]] = True
+    keep[ends[nonEmpty] - 1] = True
+    toleranceSquared = tolerance * tolerance
+
+    first, last = starts[lengths >= 3], ends[lengths >= 3] - 1
+    while len(first):
+        # the (range, inner point) pairs of all open ranges
+        counts = last - first - 1
+        pairStarts = numpy.cumsum(counts) - counts
+        rangeNrs = numpy.repeat(numpy.arange(len(first)), counts)
+        indices = numpy.arange(len(rangeNrs)) - pairStarts[rangeNrs] + first[rangeNrs] + 1
+        firstNrs, lastNrs = first[rangeNrs], last[rangeNrs]
+        ax, ay, az = x[firstNrs], y[firstNrs], z[firstNrs]
+        dx, dy, dz = x[lastNrs] - ax, y[lastNrs] - ay, z[lastNrs] - az
+        lengthSquared = dx*dx + dy*dy + dz*dz
+        px, py, pz = x[indices] - ax, y[indices] - ay, z[indices] - az
+        # distance to the line segment (a closed loop has first == last point)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            t = numpy.where(lengthSquared > 0.0, (px*dx + py*dy + pz*dz) / lengthSquared, 0.0)
+        t = numpy.minimum(1.0, numpy.maximum(0.0, t))
+        px, py, pz = px - t * dx, py - t * dy, pz - t * dz
+        distSquared = px*px + py*py + pz*pz
+
+        # the furthest point of every range; the first one if there are more
+        maxDistSquared = numpy.maximum.reduceat(distSquared, pairStarts)
+        pairNrs = numpy.where(distSquared == maxDistSquared[rangeNrs], numpy.arange(len(rangeNrs)), len(rangeNrs))
+        maxIndices = indices[numpy.minimum.reduceat(pairNrs, pairStarts)]
+
+        split = maxDistSquared > toleranceSquared
+        keep[maxIndices[split]] = True
+        first = numpy.concatenate((first[split], maxIndices[split]))
+        last = numpy.concatenate((maxIndices[split], last[split]))
+        unfinished = last - first >= 2
+        first, last = first[unfinished], last[unfinished]
+
+    splineNrs = numpy.repeat(numpy.arange(len(lengths)), lengths)
+    simplifiedLengths = numpy.bincount(splineNrs[keep], minlength=len(lengths))
+    return array('d', points[keep].ravel().tolist()), array('L', simplifiedLengths.tolist())
+
+
+def decimate_spline(coordinates, factor):
+    """Keep 1 in 'factor' points of a spline; the first and last point are always kept.
+    
+    coordinates :   flat array with the spline points: x0, y0, z0, x1, ...
+    
+    return      :   a flat array('d') with the remaining points
+    """
+    pointCount = len(coordinates) // 3
+    decimated = array('d')
+    for indexNr in range(0, pointCount - 1, factor):
+        decimated.extend(coordinates[3*indexNr:3*indexNr + 3])
+    decimated.extend(coordinates[3*(pointCount - 1):3*pointCount])              # last point
+    return decimated
+
+
+def parse_gcode_layers(gcodeFile, chunkSize=2000, simplifyTolerance=0.0, transform=None, maxFlow=None):
+    """Parse a .gcode file, and return the geometry of its layers.
+    
+    This function does not use Blender, and only returns plain 'LayerGeometry'
+    instances. It can therefore run in a separate process (for example, to
+    parse multiple files at the same time).
+    
+    simplifyTolerance   :   if larger than 0.0, the splines are simplified
+                            with this tolerance (mm), see 'simplify_spline'
+    transform           :   an affine transform for the layers, or None
+    maxFlow             :   if given, the splines get the material index of their 
+                            flow (see 'LayerGeometry.from_commands')
+    
+    return  :   a list of 'LayerGeometry' instances, sorted from low to high Z
+    """
+    layers = dict()
+    myMachine = Machine()
+    for progress, finished in myMachine.iter_add_extruder_layers(gcodeFile, chunkSize, simplifyTolerance, 
+                                                                 transform, maxFlow, keepCommands=False):
+        for geometry in finished:
+            if geometry.name in layers:                                         # the print returned to a finished layer
+                layers[geometry.name].extend(geometry)
+            else:
+                layers[geometry.name] = geometry
+    return [layers[zValue] for zValue in sorted(layers)]
+
+
 class Machine:
     """'Machine' instances hold information about a 3D printer machine.
     
@@ -692,195 +2799,568 @@ class Machine:
             (2) transform the raw gcode to standardized Gcode instances 
         """
 
+        for progress in self.iter_add_extruder(gcodeFile):
+            pass
+
+
+    def iter_add_extruder(self, gcodeFile, chunkSize=2000):
+        """Attach an extruder head to the current machine, in chunks.
+        
+        This generator does the same as 'add_extruder', but yields the fraction
+        (0.0 - 1.0) of the Gcode lines that are parsed after every 'chunkSize' 
+        lines. The new extruder is available as self.extruders[-1] as soon as
+        the first value is yielded.
+        """
+
         extruderName = "extruder_" + str(len(self.extruders) + 1)
         self.extruders.append(Extruder(name = extruderName))
         
-        # (1) load the gcode data from file
+        # load the gcode data from file, and parse the raw gcode commands into 
+        # 'Gcode' instances while the file is read
         try:
-            self.extruders[-1].import_rawGcode(gcodeFile)        
+            for progress in self.extruders[-1].iter_import_rawGcode(gcodeFile, chunkSize):
+                yield progress
         except IOError:
             print("ERROR: the file '{0}' is not found. Is this a valid .gcode file?".format(gcodeFile))
+            yield 1.0
 
-        #(2) parse the raw gcode commands, and turn them into 'Gcode' instances 
-        self.extruders[-1].convert_rawGcode_to_standardGcode()
+
+    def iter_add_extruder_layer_commands(self, gcodeFile, chunkSize=2000, keepCommands=True):
+        """Attach an extruder head, and sort the commands into layers while parsing.
+        
+        This generator parses 'gcodeFile' in chunks (see 'iter_add_extruder'), 
+        and sorts the parsed commands into layers (see 'LayerSorter'). 
+        If 'keepCommands' is False, the raw and resolved Gcode of every chunk 
+        is removed from the new extruder as soon as it is sorted: the commands
+        are then only kept by the layers that are not finished yet, and the 
+        memory use does not grow with the size of the file. The extruder has
+        no commands left afterwards.
+        
+        yield   :   (progress, layers) tuples, where 'progress' is the fraction 
+                    of the Gcode lines parsed, and 'layers' a list of 
+                    (Z-value, commands) tuples of the layers finished in this chunk.
+                    A Z-value can occur more than once, if the print returns to
+                    a layer that was already finished.
+        """
+        sorter = LayerSorter()
+        doneCount = 0
+
+        for progress in self.iter_add_extruder(gcodeFile, chunkSize):
+            extruder = self.extruders[-1]
+            finished = []
+            for cmd in extruder.standardGcode[doneCount:]:
+                finished.extend(sorter.add_gcode(cmd))
+            if keepCommands:
+                doneCount = len(extruder.standardGcode)
+            else:
+                del extruder.standardGcode[:]                                   # (the sorter keeps the open layers)
+                del extruder.rawGcode[:]
+            yield progress, finished
+        yield 1.0, sorter.finish()                                              # (progress is 1.0 as soon as the file is read)
 
 
-    def merge_extruders(self, line1, line2):
-        """Merge the gcode commands of two extruder heads.
+    def iter_add_extruder_layers(self, gcodeFile, chunkSize=2000, simplifyTolerance=0.0, transform=None, maxFlow=None,
+                                 keepCommands=True):
+        """Attach an extruder head, and create the layer geometry while parsing.
+        
+        This generator parses 'gcodeFile' in chunks, sorts the parsed commands
+        into layers (see 'iter_add_extruder_layer_commands'), and splits every
+        finished layer in splines. No Blender code is used, so this can run in
+        a worker thread.
+        If 'simplifyTolerance' is larger than 0.0, the splines of every layer
+        are simplified with this tolerance (mm). The levels of detail of every
+        layer are created as well (see 'LayerGeometry.create_levels').
+        If a 'transform' is given, it becomes the transform of the new extruder,
+        and is applied to the layers (see 'LayerGeometry.transform'). If a
+        'maxFlow' (mm3/s) is given, the splines get the material index of 
+        their volumetric flow (see 'LayerGeometry.from_commands').
+        If 'keepCommands' is False, the Gcode commands are dropped once their
+        layers are yielded, and the new extruder has no commands afterwards.
+        
+        yield   :   (progress, layers) tuples, where 'progress' is the fraction 
+                    of the Gcode lines parsed, and 'layers' a list of 
+                    'LayerGeometry' instances of the layers finished in this chunk.
+                    A Z-value can occur more than once, if the print returns to
+                    a layer that was already finished.
+        """
+        for progress, finished in self.iter_add_extruder_layer_commands(gcodeFile, chunkSize, keepCommands):
+            if transform is not None:
+                self.extruders[-1].transform = transform
+
+            layers = []
+            for zValue, commands in finished:
+                geometry = LayerGeometry.from_commands(zValue, commands, maxFlow)
+                if geometry.count_splines() > 0:                                # layers without splines are of no use
+                    if simplifyTolerance > 0.0:
+                        geometry.simplify(simplifyTolerance)
+                    geometry.create_levels()
+                    if transform is not None and transform != identityTransform:
+                        geometry.transform(transform)
+                    layers.append(geometry)
+            yield progress, layers
+
+
+    def merge_extruders(self, extruders=None, optimize=False, toolChangeTime=10.0):
+        """Merge the gcode commands of any number of extruder heads.
+        
+        Each extruder is a separate tool in the merged output: the commands of
+        extruders[n] are printed with tool 'Tn'. The commands are merged as 
+        streams (see 'iter_layer_keys'): a heap holds the next command of every
+        extruder, ordered by (layer key, tool number). This way:
+        
+        1. The 'initialization' commands (like 'G28', 'G92', 'G21') of all 
+           extruders come first; these are the commands before an extruder 
+           starts to extrude plastic. No line numbers need to be given.
+        2. Then, layer by layer, every extruder prints its part of the layer,
+           in order of tool number.
+        3. The commands after the last extrusion (the 'end' code) come last.
         
-        Gcode commands are added in two steps. 
+        A tool change ('Tn') is only added when the tool really changes. It is
+        followed by a 'G92' that sets E to the last E value of the new tool, 
+        since every file counts its own (absolute) E values. The 'Tn' commands
+        of the files themselves are left out: each file is printed with the 
+        tool of its extruder.
         
-        The first step aims to capture all the 'initialization' commands for
-        both files. That is, the repositioning of the location ('G92', 'G28'), 
-        information on the units ('G21') etc. This 'initialization' process 
-        must be given as a line number. For example, if the initialization commands
-        are from lines 1 to 13 of a .gcode file, enter the last line (13) here.
+        The merge takes O(total commands * log N) time for N extruders. The
+        merged commands are (shallow) copies with their 'T' value set to the
+        tool number, so the commands of the extruders are not changed.
         
-        The second step assumes that these are the actual commands where the 
-        printing takes place, and that for these, Z-values go up (i.e., from 0 
-        to more positive values).    
+        With 'optimize', two things change:
+        - every layer starts with the tool that the previous layer ended with
+          (for two extruders: T0 T1, T1 T0, T0 T1, ...), which halves the 
+          amount of tool changes;
+        - the islands of every layer of every tool are printed in a shorter 
+          order (see 'optimize_island_order'). For this, the commands of one
+          layer of one tool are held in memory.
+        The estimated time saved is printed.
     
         Variables:
-        line1, line2          :   the last line of the 'initialization' phase for each file
+        extruders       :   the list of extruders to merge (default: all extruders
+                            of this machine)
+        optimize        :   if True, optimize the tool order and the island order
+        toolChangeTime  :   the time (s) one tool change takes, to estimate the time saved
         
         return      :   a new 'extruder' instance
-                        ... that stores the Gcode instances of both extruders
+                        ... that stores the Gcode instances of all extruders
         """
-        print("TODO: entering the 'merge_extruders' function")
-        # assume that it's the first and second extruders that will be merged
-        extruder1 = self.extruders[0]
-        extruder2 = self.extruders[1]
- 
+        if extruders is None:
+            extruders = list(self.extruders)
+
         # add a new extruder in which the merged commands will be stored
         self.extruders.append(Extruder(name = "merged"))
         newExtruder = self.extruders[-1]
-        countX = 1              # bookkeeping for convenient line numbering
-
-        # Step 1. Add initialization state commands for both extruders
-        #       1a. add a T0 command 
-        newExtruder.standardGcode.append(Gcode(name="x_" + str(countX)))
-        countX += 1
-        newExtruder.standardGcode[-1].command = "T0"
-        newExtruder.standardGcode[-1].parameters["comment"] = "** extruder 1 Initialization start **"
-        newExtruder.standardGcode[-1].T = 0
-        
-        #       1b. add the other initialization commands for extruder 1
-        for index in range(0, line1):
-            newExtruder.standardGcode.append(extruder1.standardGcode[index])
-            newExtruder.standardGcode[-1].name = "a_" + str(extruder1.standardGcode[index].name)
-            newExtruder.standardGcode[-1].T = 0        # we are extruder 1, now
-        
-        #       1c. add a closing comment for extruder 1
-        newExtruder.standardGcode.append(Gcode(name="x_" + str(countX)))
-        countX += 1
-        newExtruder.standardGcode[-1].command = "comment"
-        newExtruder.standardGcode[-1].parameters["comment"] = "** extruder 1 Initialization end **"
-        newExtruder.standardGcode[-1].T = 0
-        
-        #       1c. add a T1 command for extruder 2
-        newExtruder.standardGcode.append(Gcode(name="x_" + str(countX)))
-        countX += 1
-        newExtruder.standardGcode[-1].command = "T1"
-        newExtruder.standardGcode[-1].parameters["comment"] = "** extruder 2 Initialization start **"
-        newExtruder.standardGcode[-1].T = 1
-
-        #       1d. add the other initialization commands for extruder 2
-        for index in range(0, line2):
-            newExtruder.standardGcode.append(extruder2.standardGcode[index])
-            newExtruder.standardGcode[-1].name = "b_" + str(extruder2.standardGcode[index].name)
-            newExtruder.standardGcode[-1].T = 1        # we are extruder 2, now
-
-        #       1e. add the closing comment for extruder 2
-        newExtruder.standardGcode.append(Gcode(name="x_" + str(countX)))
-        countX += 1
-        newExtruder.standardGcode[-1].command = "comment"
-        newExtruder.standardGcode[-1].parameters["comment"] = "** extruder 2 Initialization end **"
-        newExtruder.standardGcode[-1].T = 1
-    
-
-        # Step 2: merge the remainder of the code
-        #   first, find the Z values of extruder1 and extruder2 
-        Zvalues = set()
-        for indexNr in range(line1 - 1, len(extruder1.standardGcode)):
-            Zvalues.add(extruder1.standardGcode[indexNr].Z)
-        for indexNr in range(line2 - 1, len(extruder2.standardGcode)):
-            Zvalues.add(extruder2.standardGcode[indexNr].Z)
-        Zvalues.discard(None)                                                   # Remove any 'None' type, if present
-        Zvalues = sorted(list(Zvalues))                                         # ... and sort the Z-values in a list
-        print("Z-values: ", Zvalues)
-
-        lastStateExtruder1 = extruder1.standardGcode[line1]
-        lastStateExtruder2 = extruder2.standardGcode[line2]
-
-        print("laststate 1", lastStateExtruder1, "line1:", line1)
-
-        for Zval in Zvalues:
-            # assumption: the gcode commands are from lowest to highest Z-value
-            if extruder1.standardGcode[line1].Z == Zval:
-                print(">> Now processing Zval:", Zval)
-                
-                # add a T0 command, then the other commands until no more Zval
-                newExtruder.standardGcode.append(Gcode(name="x_" + str(countX)))
-                countX += 1
-                newExtruder.standardGcode[-1].command = "T0"
-                newExtruder.standardGcode[-1].parameters["comment"] = "** switch to T0 **"
-
-                while extruder1.standardGcode[line1].Z == Zval:
-#                    print("line1", line1, extruder1.commands[line1])
-                    newExtruder.standardGcode.append(extruder1.standardGcode[line1])
-                    newExtruder.standardGcode[-1].T = 0
-                    newExtruder.standardGcode[-1].name = "a_" + str(newExtruder.standardGcode[-1].name)
-
-                    # add here code to update lastStateExtruder1
-
-                    if line1 == len(extruder1.standardGcode) - 1:
-                        break
-                    else:
-                        line1 += 1
-            
-            if extruder2.standardGcode[line2].Z == Zval:
-                print(">> Now processing Zval for extr.2", Zval)
-
-                # add a T1 command, then the other commands until no more Zval
-                newExtruder.standardGcode.append(Gcode(name="x_" + str(countX)))
-                countX += 1
-                newExtruder.standardGcode[-1].command = "T1"
-                newExtruder.standardGcode[-1].parameters["comment"] = "** switch to T1 **"
-                
-                while extruder2.standardGcode[line2].Z == Zval:
-                    newExtruder.standardGcode.append(extruder2.standardGcode[line2])
-                    newExtruder.standardGcode[-1].T = 1
-                    newExtruder.standardGcode[-1].name = "b_" + str(newExtruder.standardGcode[-1].name)
-                    if line2 == len(extruder2.standardGcode) - 1:
-                        break
-                    else:
-                        line2 += 1
+        merged = newExtruder.standardGcode
+        countX = [1]            # bookkeeping for convenient line numbering
+        toolChanges = 0
+        plainToolChanges = 0                                                    # the tool changes without 'optimize'
+        travelBefore = travelAfter = travelTimeSaved = 0.0
+
+        streams = [iter_layer_keys(extruder.get_transformed_gcode()) for extruder in extruders]
+        lastE = [0.0] * len(extruders)                                          # the last E value of every tool
+        heap = []
+        for toolNr, stream in enumerate(streams):
+            for layerKey, cmd in stream:
+                heap.append((layerKey, toolNr, cmd))
+                break
+        heapq.heapify(heap)
+
+        def new_name():
+            countX[0] += 1
+            return "x_" + str(countX[0] - 1)
+
+        currentTool = None
+        plainTool = None
+        while heap:
+            # all tools that have commands at the lowest layer key
+            layerKey = heap[0][0]
+            group = []
+            while heap and heap[0][0] == layerKey:
+                group.append(heapq.heappop(heap)[1:])
+            group.sort(key=lambda item: item[0])
+            for toolNr, cmd in group:
+                if plainTool is not None and toolNr != plainTool:
+                    plainToolChanges += 1
+                plainTool = toolNr
+            if optimize and currentTool is not None:                            # start with the current tool
+                group.sort(key=lambda item: (item[0] - currentTool) % len(extruders))
+
+            for toolNr, firstCmd in group:
+                if toolNr != currentTool:
+                    toolCommand = Gcode(name=new_name())
+                    toolCommand.command = "T" + str(toolNr)
+                    toolCommand.T = toolNr
+                    merged.append(toolCommand)
+                    if currentTool is not None:
+                        # the machine is where the last tool stopped; only E is changed
+                        merged.append(create_E_reset(new_name(), merged[-2], lastE[toolNr], toolNr, 
+                                                     "** continue E of T{0} **".format(toolNr)))
+                        toolChanges += 1
+                    currentTool = toolNr
+
+                # the commands of this tool at this layer key; the next command goes back in the heap
+                block = self.iter_layer_block(streams[toolNr], layerKey, firstCmd, toolNr, heap)
+                if optimize and -float("inf") < layerKey < float("inf"):
+                    block, before, after, saved = optimize_island_order(list(block), merged[-1], toolNr, new_name)
+                    travelBefore += before
+                    travelAfter += after
+                    travelTimeSaved += saved
+
+                for cmd in block:
+                    merged.append(cmd)
+                    if cmd.E is not None:
+                        lastE[toolNr] = cmd.E
+
+        print("OK: merged {0} extruders: {1} commands, {2} tool changes".format(len(extruders), 
+                    len(merged), toolChanges))
+        if optimize:
+            timeSaved = travelTimeSaved + (plainToolChanges - toolChanges) * toolChangeTime
+            print("OK: optimized: tool changes {0} -> {1}, travel between islands {2:.0f} -> {3:.0f} mm, "
+                  "estimated time saved {4:.0f} s".format(plainToolChanges, toolChanges, 
+                                                          travelBefore, travelAfter, timeSaved))
+        return newExtruder
+
+
+    @staticmethod
+    def iter_layer_block(stream, layerKey, firstCmd, toolNr, heap):
+        """Yield 'firstCmd', and the next commands of 'stream' with the same layer key.
+        
+        The commands are yielded as copies with 'T' set to 'toolNr'; tool 
+        changes ('Tn') of the stream are left out, since the merge selects 
+        the tools. The first command with another key is pushed on the merge 
+        'heap', as (layer key, tool number, command).
+        """
+        for nextKey, nextCmd in itertools.chain([(layerKey, firstCmd)], stream):
+            if nextKey != layerKey:
+                heapq.heappush(heap, (nextKey, toolNr, nextCmd))
+                return
+            if not nextCmd.command.startswith("T"):
+                cmd = copy.copy(nextCmd)
+                cmd.T = toolNr
+                yield cmd
 
-        print("OK: merge code processed successfully")
 
+# ----- batch processing -----
+# the files that 'find_gcode_files' picks up in a directory
+gcodeSuffixes = (".gcode", ".gco", ".g")
 
-# ----- the body of the program -----
-def main():
-    """Main code of the Gcode reader. 
+
+def find_gcode_files(paths, recursive=False):
+    """Returns the .gcode files in a list of files and directories.
     
-    This code will only execute if the script is executed directly. Otherwise,
-    this code is ignored (e.g., to facilitate import as a module)
+    Files are returned as given; directories are searched for files that end
+    with one of 'gcodeSuffixes', optionally followed by a compression suffix
+    (like 'model.gcode.gz'). 
     """
+    gcodeFiles = []
+    for path in paths:
+        if not os.path.isdir(path):
+            gcodeFiles.append(path)
+            continue
+        for directory, subDirectories, fileNames in os.walk(path):
+            for fileName in sorted(fileNames):
+                baseName, suffix = os.path.splitext(fileName.lower())
+                if suffix in compressionSuffixes:
+                    suffix = os.path.splitext(baseName)[1]
+                if suffix in gcodeSuffixes:
+                    gcodeFiles.append(os.path.join(directory, fileName))
+            if not recursive:
+                break
+            subDirectories.sort()
+    return gcodeFiles
+
+
+def gcode_base_name(filename, keepCompression=False):
+    """Returns the name of a .gcode file without directory, compression suffix and 
+    extension: 'models/cube.gcode.gz' -> 'cube'. With 'keepCompression', the 
+    compression suffix stays: 'cube.gz'. The output files are named after it.
+    """
+    baseName = os.path.basename(filename)
+    compressionSuffix = ""
+    for suffix in compressionSuffixes:
+        if baseName.lower().endswith(suffix):
+            baseName, compressionSuffix = baseName[:-len(suffix)], baseName[-len(suffix):]
+            break
+    baseName = os.path.splitext(baseName)[0]
+    return baseName + compressionSuffix if keepCompression else baseName
+
+
+def unique_base_names(gcodeFiles):
+    """Returns a base name (see 'gcode_base_name') for every file, so the output 
+    files of a batch do not overwrite each other.
+    
+    Files with the same base name (like 'cube.gcode' and 'cube.gcode.gz') keep
+    their compression suffix; names that are still the same (files in other
+    directories) get a number: 'cube_2', 'cube_3', ... The names are compared 
+    without case, for file systems that ignore it.
+    """
+    counts = dict()
+    for gcodeFile in gcodeFiles:
+        key = gcode_base_name(gcodeFile).lower()
+        counts[key] = counts.get(key, 0) + 1
+
+    baseNames = []
+    used = set()
+    for gcodeFile in gcodeFiles:
+        baseName = gcode_base_name(gcodeFile, keepCompression=counts[gcode_base_name(gcodeFile).lower()] > 1)
+        uniqueName, number = baseName, 1
+        while uniqueName.lower() in used:
+            number += 1
+            uniqueName = "{0}_{1}".format(baseName, number)
+        used.add(uniqueName.lower())
+        baseNames.append(uniqueName)
+    return baseNames
+
+
+def summarize_gcode(standardGcode):
+    """Returns a summary (dict) of a list of standardized Gcode instances.
+    
+    commands        :   the amount of commands
+    moves           :   the amount of moves (G0, G1, G2, G3)
+    extrudingMoves  :   the amount of moves that extrude plastic
+    extrusionLength :   the length of filament (mm) that is used: the extrusion minus
+                        the retractions, like 'filamentLength' of 'Gcode_analysis.compute_statistics'
+    layers          :   the amount of different Z-values at which plastic is extruded
+    boundingBox     :   [minX, minY, minZ, maxX, maxY, maxZ] of the extruding moves,
+                        or None if nothing is extruded
+    """
+    moveCount = 0
+    extrudingCount = 0
+    extrusionLength = 0.0
+    layers = set()
+    bounds = [float("inf")] * 3 + [float("-inf")] * 3
+    lastE = None
+
+    for cmd in standardGcode:
+        if cmd.command in ("G0", "G1", "G2", "G3"):
+            moveCount += 1
+            if lastE is not None and cmd.E is not None:
+                extrusionLength += cmd.E - lastE                                # (a G92 only sets lastE, so this is the net E per segment)
+            if lastE is not None and cmd.E is not None and cmd.E > lastE:
+                extrudingCount += 1
+                layers.add(cmd.Z)
+                points = [(cmd.X, cmd.Y, cmd.Z)]
+                if cmd.arcPoints is not None:
+                    points.extend(iter_spline_points([cmd]))
+                for point in points:
+                    for axisNr in range(3):
+                        bounds[axisNr] = min(bounds[axisNr], point[axisNr])
+                        bounds[axisNr + 3] = max(bounds[axisNr + 3], point[axisNr])
+        lastE = cmd.E                                                           # (every command has the last known E, also G92)
+
+    return {"commands": len(standardGcode), 
+            "moves": moveCount, 
+            "extrudingMoves": extrudingCount,
+            "extrusionLength": round(extrusionLength, 5),
+            "layers": len(layers),
+            "boundingBox": [round(value, 5) for value in bounds] if extrudingCount > 0 else None}
+
+
+def process_gcode_file(gcodeFile, options, baseName=None):
+    """Parse one .gcode file, and return its summary (see 'summarize_gcode').
+    
+    This function is run in a worker process by 'main'. Any error is not 
+    raised, but returned in the summary ('error'), so one bad file does not
+    stop a batch. 
+    
+    options     :   dict with the settings:
+                    cacheDir    :   save a binary toolpath (.gctp) here (see 'save_toolpath')
+                    gcodeDir    :   export the standardized gcode here
+                    fitArcs     :   fit arcs in the exported gcode (see 'fit_arcs')
+                    meshDir     :   export a mesh here (see 'Gcode_mesh_export')
+                    meshFormat  :   'ply' or 'glb'
+                    meshStyle   :   'lines' or 'tubes'
+                    voxelDir    :   export a voxel grid (.npy) here (see 'Gcode_voxels')
+                    voxelSize   :   the size of a voxel (mm)
+                    previewDir  :   render a top view (.png) here (see 'Gcode_preview')
+                    previewSize :   the width and height of the top view (pixels)
+                    printTime   :   estimate the print time (see 'Gcode_analysis.estimate_print_time')
+                    maxFlow     :   report the moves above this volumetric flow (mm3/s), 
+                                    see 'Gcode_analysis.find_flow_hotspots'
+                    metadata    :   add the metadata of the slicer (see 'read_gcode_metadata')
+                    metadataOnly:   only read the metadata of the slicer; do not parse the file
+                    quiet       :   hide the progress messages of the parser
+    baseName    :   the name of the output files (default: 'gcode_base_name'); 
+                    'main' gives every file of a batch its own (see 'unique_base_names')
+    
+    return      :   the summary, with the file name, timings and written files added
+    """
+    summary = {"file": gcodeFile}
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, mode="w") if options.get("quiet") else sys.stderr   # keep stdout for the summaries
+    try:
+        startTime = time.time()
+        if options.get("metadata") or options.get("metadataOnly"):
+            metadata = read_gcode_metadata(gcodeFile)
+            metadata["thumbnails"] = [[thumbnail["width"], thumbnail["height"], thumbnail["format"]] 
+                                      for thumbnail in metadata["thumbnails"]]
+            summary["metadata"] = metadata
+            if options.get("metadataOnly"):
+                summary["timings"] = {"total": round(time.time() - startTime, 4)}
+                return summary
+        myMachine = Machine()
+        myMachine.add_extruder(gcodeFile)
+        extruder = myMachine.extruders[-1]
+        if len(extruder.rawGcode) == 0:
+            raise IOError("no gcode was read from '{0}'".format(gcodeFile))
+        summary.update(summarize_gcode(extruder.standardGcode))
+        summary["timings"] = {"decode": round(extruder.timings["decode"], 4), 
+                              "parse": round(extruder.timings["parse"], 4)}
+
+        if options.get("printTime") or options.get("maxFlow"):
+            try:
+                from . import Gcode_analysis
+            except (ImportError, SystemError, ValueError):
+                import Gcode_analysis
+        if options.get("printTime"):
+            estimate = Gcode_analysis.estimate_print_time(extruder.standardGcode)
+            summary["printTime"] = {"total": round(estimate["total"], 1), 
+                                    "extruding": round(estimate["extruding"], 1),
+                                    "travel": round(estimate["travel"], 1),
+                                    "tools": dict((str(tool), round(seconds, 1)) for tool, seconds in estimate["tools"].items())}
+        if options.get("maxFlow"):
+            report = Gcode_analysis.find_flow_hotspots(extruder.standardGcode, options["maxFlow"])
+            summary["flow"] = {"peak": round(report["peakFlow"], 2), 
+                               "max": report["maxFlow"],
+                               "moves": len(report["hotspots"]),
+                               "layers": sorted(report["layers"]),
+                               "lines": [lineNr for layerKey, lineNr, flow in report["hotspots"][:100]]}
+
+        if baseName is None:
+            baseName = gcode_base_name(gcodeFile)
+        outputs = dict()
+
+        if options.get("cacheDir"):
+            outputs["cache"] = os.path.join(options["cacheDir"], baseName + ".gctp")
+            extruder.save_toolpath(outputs["cache"])
+        if options.get("gcodeDir"):
+            outputs["gcode"] = os.path.join(options["gcodeDir"], baseName + ".gcode")
+            extruder.export_standardGcode(outputs["gcode"], fitArcs=options.get("fitArcs", False))
+        if options.get("meshDir"):
+            try:
+                from . import Gcode_mesh_export
+            except (ImportError, SystemError, ValueError):
+                import Gcode_mesh_export
+            outputs["mesh"] = os.path.join(options["meshDir"], baseName + "." + options.get("meshFormat", "glb"))
+            with Gcode_mesh_export.MeshExport(outputs["mesh"], style=options.get("meshStyle", "lines")) as export:
+                for zValue, commands in iter_sort_layers(extruder.standardGcode):
+                    export.add_layer(LayerGeometry.from_splines(zValue, split_splines(commands)))
+        if options.get("voxelDir"):
+            try:
+                from . import Gcode_voxels
+            except (ImportError, SystemError, ValueError):
+                import Gcode_voxels
+            outputs["voxels"] = os.path.join(options["voxelDir"], baseName + ".npy")
+            grid = Gcode_voxels.voxelize(iter_sort_layers(extruder.standardGcode), outputs["voxels"], 
+                                         options.get("voxelSize", 0.1))
+            summary["voxels"] = {"shape": grid["shape"], "origin": [round(value, 4) for value in grid["origin"]],
+                                 "occupied": grid["occupied"]}
+        if options.get("previewDir"):
+            try:
+                from . import Gcode_preview
+            except (ImportError, SystemError, ValueError):
+                import Gcode_preview
+            outputs["preview"] = Gcode_preview.render_previews(extruder.standardGcode, options["previewDir"], baseName, 
+                                                               size=options.get("previewSize", 512))[0]
+
+        if outputs:
+            summary["outputs"] = outputs
+        summary["timings"]["total"] = round(time.time() - startTime, 4)
+    except Exception as error:
+        summary["error"] = "{0}: {1}".format(type(error).__name__, error)
+    finally:
+        if sys.stdout is not sys.stderr:
+            sys.stdout.close()
+        sys.stdout = stdout
+    return summary
 
-    # create a extruder (stores commands)
-    inFile1 = '/home/douwe/compile/github/blender-gcode-reader/testFiles/line_L_large.gcode'
-    inFile2 = '/home/douwe/compile/github/blender-gcode-reader/testFiles/line_R_large.gcode'
-
-#    inFile1 = '/home/douwe/Desktop/PS-logo.gcode'
-#    inFile2 = '/home/douwe/Desktop/PS-logo-inset.gcode'
-
-    Ultimaker = Machine()
-    Ultimaker.add_extruder(inFile1)        # add extruder 1
-    Ultimaker.add_extruder(inFile2)        # add extruder 2
-#    print(Ultimaker)
-
-    # correct for the gcode centering
-    Ultimaker.extruders[1].add_offset(offsetX = 10, offsetY = 10)
-    Ultimaker.extruders[1].add_offset(offsetX = 0, offsetY = 22)
-
-#    Ultimaker.extruders[-1].debug_extruder()
-#    for i in Ultimaker.extruders[0].commands:
-#        print(repr(i))
-
-
-    Ultimaker.merge_extruders(21, 21)
-    Ultimaker.extruders[-1].debug_extruder()
-
-#    Ultimaker.extruders[-1].debug_extruder()
 
-    Ultimaker.extruders[-1].export_standardGcode()
+# ----- the body of the program -----
+def main(argv=None):
+    """Main code of the Gcode reader: a command line tool to process many .gcode files.
     
-#    Ultimaker.extruders[1].add_offset()
+    This code will only execute if the script is executed directly. Otherwise,
+    this code is ignored (e.g., to facilitate import as a module).
     
-#    for i in Ultimaker.extruders[2].commands:
-#        print(repr(i))
+    Every file is parsed in a worker process (see 'process_gcode_file'); a
+    summary of every file is written as one line of JSON, in the order in 
+    which the files are finished. Example:
+    
+        python3 Gcode_parser.py --recursive --jobs 8 --cache ./cache /data/gcode > summaries.jsonl
+    
+    return  :   0 if all files are processed, 1 if any file gave an error
+    """
+    import argparse
+    import concurrent.futures
+
+    parser = argparse.ArgumentParser(description="Parse .gcode files, and write a summary of each file as JSON lines.")
+    parser.add_argument("paths", nargs="+", help=".gcode files, or directories with .gcode files")
+    parser.add_argument("-r", "--recursive", action="store_true", help="also search the subdirectories")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() if hasattr(os, "cpu_count") else 1,
+                        help="the amount of worker processes (default: the amount of CPUs)")
+    parser.add_argument("-o", "--output", help="write the summaries to this file (default: stdout)")
+    parser.add_argument("--cache", metavar="DIR", help="save a binary toolpath (.gctp) of every file in DIR")
+    parser.add_argument("--export-gcode", metavar="DIR", help="export the standardized gcode of every file to DIR")
+    parser.add_argument("--fit-arcs", action="store_true", help="fit G2/G3 arcs in the exported gcode")
+    parser.add_argument("--export-mesh", metavar="DIR", help="export a mesh of every file to DIR")
+    parser.add_argument("--mesh-format", choices=("glb", "ply"), default="glb", help="the mesh format (default: glb)")
+    parser.add_argument("--mesh-style", choices=("lines", "tubes"), default="lines", help="the mesh style (default: lines)")
+    parser.add_argument("--export-voxels", metavar="DIR", help="export a voxel grid (.npy) of every file to DIR")
+    parser.add_argument("--voxel-size", type=float, default=0.1, metavar="MM", 
+                        help="the size of a voxel in mm (default: 0.1)")
+    parser.add_argument("--export-previews", metavar="DIR", help="render a top view (.png) of every file to DIR")
+    parser.add_argument("--preview-size", type=int, default=512, metavar="PIXELS", 
+                        help="the width and height of the top view (default: 512)")
+    parser.add_argument("--print-time", action="store_true", help="estimate the print time of every file")
+    parser.add_argument("--max-flow", type=float, metavar="MM3S", 
+                        help="report the layers and lines (first 100) that need more volumetric flow than this")
+    parser.add_argument("--metadata", action="store_true", 
+                        help="add the settings, estimates and thumbnail sizes that the slicer wrote in comments")
+    parser.add_argument("--metadata-only", action="store_true", 
+                        help="only read the metadata of the slicer (from the start and end of every file)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="hide the progress messages of the parser")
+    args = parser.parse_args(argv)
+
+    options = {"cacheDir": args.cache, "gcodeDir": args.export_gcode, "fitArcs": args.fit_arcs, 
+               "meshDir": args.export_mesh, "meshFormat": args.mesh_format, "meshStyle": args.mesh_style,
+               "voxelDir": args.export_voxels, "voxelSize": args.voxel_size,
+               "previewDir": args.export_previews, "previewSize": args.preview_size,
+               "printTime": args.print_time, "maxFlow": args.max_flow, 
+               "metadata": args.metadata, "metadataOnly": args.metadata_only, "quiet": args.quiet}
+    for directory in (args.cache, args.export_gcode, args.export_mesh, args.export_voxels, 
+                      args.export_previews):
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    gcodeFiles = find_gcode_files(args.paths, args.recursive)
+    baseNames = unique_base_names(gcodeFiles)
+    outFile = open(args.output, mode="w") if args.output else sys.stdout
+    errorCount = 0
+
+    def write_summary(summary):
+        outFile.write(json.dumps(summary, sort_keys=True) + "\n")
+        outFile.flush()
+
+    try:
+        if args.jobs <= 1 or len(gcodeFiles) <= 1:
+            results = (process_gcode_file(gcodeFile, options, baseName) 
+                       for gcodeFile, baseName in zip(gcodeFiles, baseNames))
+            for summary in results:
+                errorCount += "error" in summary
+                write_summary(summary)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+                futures = [executor.submit(process_gcode_file, gcodeFile, options, baseName) 
+                           for gcodeFile, baseName in zip(gcodeFiles, baseNames)]
+                for future in concurrent.futures.as_completed(futures):
+                    summary = future.result()
+                    errorCount += "error" in summary
+                    write_summary(summary)
+    finally:
+        if outFile is not sys.stdout:
+            outFile.close()
 
+    return 1 if errorCount > 0 else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
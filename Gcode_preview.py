@@ -0,0 +1,295 @@
+#! /usr/bin/env python3
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+"""
+Render top-down preview images (PNG) of a .gcode file, without Blender.
+
+The extruding moves are drawn as 1 pixel lines (Bresenham) in a grayscale
+image: dark lines on a white background. Two kinds of images are made:
+
+    layers      :   one image per layer, with the lines of that layer; all
+                    images have the same frame, so they can be flipped
+                    through as an animation
+    top view    :   all layers on top of each other, from the bottom up;
+                    higher layers are darker, so the shape of the top
+                    surfaces is visible (a thumbnail of the print)
+
+The images of the layers are drawn and compressed in worker processes. With
+NumPy (if it is installed), all lines of a layer are drawn at once. The PNG 
+files are written by a minimal encoder (zlib, from the standard library).
+
+Use from the command line:
+    python3 Gcode_preview.py model.gcode ./previews --size 512 --layers --jobs 4
+"""
+
+# ----- imports -----
+import argparse
+import concurrent.futures
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+try:
+    from . import Gcode_parser
+    from . import Gcode_analysis
+except (ImportError, SystemError, ValueError):
+    # not loaded as part of the Blender add-on, but as a script
+    import Gcode_parser
+    import Gcode_analysis
+
+try:
+    import numpy                                                                # optional: 'draw_lines_numpy'
+except ImportError:
+    numpy = None
+
+
+# ----- PNG -----
+def write_png_chunk(pngFile, chunkType, data):
+    """Write one chunk (length, type, data, CRC) of a PNG file"""
+    pngFile.write(struct.pack(">I", len(data)))
+    pngFile.write(chunkType)
+    pngFile.write(data)
+    pngFile.write(struct.pack(">I", zlib.crc32(chunkType + data) & 0xffffffff))
+
+
+def write_png(filename, pixels, width, height, compression=6):
+    """Write an 8 bit grayscale image as a PNG file.
+
+    pixels  :   bytes or bytearray with 'height' rows of 'width' pixels,
+                from the top row down
+    """
+    rows = bytearray()
+    for start in range(0, width * height, width):                             # every row starts with its filter type (0: none)
+        rows.append(0)
+        rows.extend(pixels[start:start + width])
+    with open(filename, mode="wb") as pngFile:
+        pngFile.write(b"\x89PNG\r\n\x1a\n")
+        write_png_chunk(pngFile, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        write_png_chunk(pngFile, b"IDAT", zlib.compress(bytes(rows), compression))
+        write_png_chunk(pngFile, b"IEND", b"")
+
+
+# ----- drawing -----
+def draw_lines(pixels, width, height, lines, originX, originY, scale, value):
+    """Draw lines into an image, with Bresenham's algorithm.
+
+    pixels      :   bytearray with 'height' rows of 'width' pixels (top row first)
+    lines       :   flat array with x0, y0, x1, y1 (mm) of every line
+    originX, originY    :   the point (mm) at the bottom left corner of the image
+    scale       :   pixels per mm
+    value       :   the gray value of the lines (0: black)
+    """
+    for lineNr in range(0, len(lines), 4):
+        x0, y0, x1, y1 = lines[lineNr:lineNr + 4]
+        column0, column1 = int((x0 - originX) * scale), int((x1 - originX) * scale)
+        row0, row1 = height - 1 - int((y0 - originY) * scale), height - 1 - int((y1 - originY) * scale)
+        stepX = 1 if column1 >= column0 else -1
+        stepY = 1 if row1 >= row0 else -1
+        deltaX, deltaY = abs(column1 - column0), -abs(row1 - row0)
+        error = deltaX + deltaY
+        while True:
+            if 0 <= column0 < width and 0 <= row0 < height:
+                pixels[row0 * width + column0] = value
+            if column0 == column1 and row0 == row1:
+                break
+            doubleError = 2 * error
+            if doubleError >= deltaY:
+                error += deltaY
+                column0 += stepX
+            if doubleError <= deltaX:
+                error += deltaX
+                row0 += stepY
+
+
+def draw_lines_numpy(pixels, width, height, lines, originX, originY, scale, value, blockSize=10000):
+    """The same as 'draw_lines', with numpy arrays: the pixels of all lines are set at once.
+
+    Bresenham's line has one pixel per step along its major axis (the axis
+    with the most pixels); at step i, the other coordinate moves
+    floor((2 * i * minor + major) / (2 * major)) pixels, where 'major' and 
+    'minor' are the pixel distances along the two axes. In integers, this 
+    gives exactly the pixels of 'draw_lines'. The lines are done in blocks 
+    of 'blockSize', to limit the size of the arrays.
+    """
+    if len(lines) == 0:
+        return
+    view = numpy.frombuffer(pixels, dtype=numpy.uint8)                         # (writes go to 'pixels')
+    lines = numpy.frombuffer(lines, dtype=numpy.float64).reshape(-1, 4)
+    for blockStart in range(0, len(lines), blockSize):
+        x0, y0, x1, y1 = lines[blockStart:blockStart + blockSize].T
+        column0, column1 = ((x0 - originX) * scale).astype(numpy.int64), ((x1 - originX) * scale).astype(numpy.int64)
+        row0 = height - 1 - ((y0 - originY) * scale).astype(numpy.int64)
+        row1 = height - 1 - ((y1 - originY) * scale).astype(numpy.int64)
+        stepX = numpy.where(column1 >= column0, 1, -1)
+        stepY = numpy.where(row1 >= row0, 1, -1)
+        deltaX, deltaY = numpy.abs(column1 - column0), numpy.abs(row1 - row0)
+        alongX = deltaX >= deltaY
+        major = numpy.maximum(deltaX, deltaY)
+        minor = numpy.minimum(deltaX, deltaY)
+
+        # one element per pixel: (line, step along the major axis)
+        counts = major + 1
+        pixelLines = numpy.repeat(numpy.arange(len(x0)), counts)
+        steps = numpy.arange(len(pixelLines)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        minorSteps = (2 * steps * minor[pixelLines] + major[pixelLines]) // numpy.maximum(2 * major[pixelLines], 1)
+        alongX = alongX[pixelLines]
+        columns = column0[pixelLines] + stepX[pixelLines] * numpy.where(alongX, steps, minorSteps)
+        rows = row0[pixelLines] + stepY[pixelLines] * numpy.where(alongX, minorSteps, steps)
+        inside = (columns >= 0) & (columns < width) & (rows >= 0) & (rows < height)
+        view[rows[inside] * width + columns[inside]] = value
+
+
+def render_layer(lines, filename, originX, originY, scale, width, height):
+    """Draw the lines of one layer, and write the image as a PNG file.
+
+    This is a module-level function, so it can run in a worker process.
+
+    return  :   the file name
+    """
+    pixels = bytearray(b"\xff" * (width * height))
+    draw = draw_lines_numpy if numpy is not None else draw_lines
+    draw(pixels, width, height, lines, originX, originY, scale, 0)
+    write_png(filename, pixels, width, height)
+    return filename
+
+
+def collect_layer_lines(standardGcode):
+    """Collect the extruding moves of every layer.
+
+    return  :   (layers, bounds); 'layers' is a list of (layer key, lines) tuples,
+                sorted by the layer key (see 'Gcode_parser.iter_layer_keys'),
+                where 'lines' is a flat array('d') with x0, y0, x1, y1 of every
+                move. 'bounds' is [minX, minY, maxX, maxY] of the moves, or None.
+    """
+    columns = Gcode_analysis.get_move_columns(standardGcode)
+    perLayer = dict()
+    for x, y, e, endX, endY, layerKey in zip(columns["dX"], columns["dY"], columns["dE"],
+                                              columns["X"], columns["Y"], columns["layer"]):
+        if e > 0.0 and (x != 0.0 or y != 0.0):
+            if layerKey not in perLayer:
+                perLayer[layerKey] = array('d')
+            perLayer[layerKey].extend((endX - x, endY - y, endX, endY))
+
+    if not perLayer:
+        return [], None
+    bounds = [float("inf"), float("inf"), float("-inf"), float("-inf")]
+    for lines in perLayer.values():
+        xValues, yValues = lines[0::2], lines[1::2]
+        bounds = [min(bounds[0], min(xValues)), min(bounds[1], min(yValues)),
+                  max(bounds[2], max(xValues)), max(bounds[3], max(yValues))]
+    return sorted(perLayer.items()), bounds
+
+
+def render_previews(standardGcode, outputDir, baseName="preview", size=512, margin=8,
+                    layerImages=False, topView=True, jobs=1):
+    """Render preview images of a list of resolved Gcode instances.
+
+    The images are square, 'size' pixels wide; the print fills the image,
+    apart from a 'margin' (pixels), with the same scale along X and Y.
+
+    standardGcode   :   list (or iterator) of resolved Gcode instances
+    outputDir       :   the directory for the images
+    baseName        :   the images are named '<baseName>_top.png' and
+                        '<baseName>_<layer number>.png' (layer number from 0)
+    layerImages     :   write an image of every layer
+    topView         :   write an image of all layers
+    jobs            :   the amount of worker processes for the layer images
+
+    return          :   list with the file names of the images; the top view first
+    """
+    startTime = time.time()
+    layers, bounds = collect_layer_lines(standardGcode)
+    if bounds is None:
+        bounds = [0.0, 0.0, 0.0, 0.0]
+    width = height = max(size, 2 * margin + 1)
+    span = max(bounds[2] - bounds[0], bounds[3] - bounds[1], 1e-6)
+    scale = (size - 2 * margin - 1) / span                                      # pixels per mm
+    originX = (bounds[0] + bounds[2]) / 2.0 - (width / 2.0) / scale            # (the print in the centre)
+    originY = (bounds[1] + bounds[3]) / 2.0 - (height / 2.0) / scale
+    filenames = []
+
+    if topView:
+        pixels = bytearray(b"\xff" * (width * height))
+        draw = draw_lines_numpy if numpy is not None else draw_lines
+        for layerNr, (layerKey, lines) in enumerate(layers):                     # from light gray (bottom) to black (top)
+            value = int(round(200 * (1.0 - (layerNr + 1.0) / len(layers))))
+            draw(pixels, width, height, lines, originX, originY, scale, value)
+        filenames.append(os.path.join(outputDir, baseName + "_top.png"))
+        write_png(filenames[-1], pixels, width, height)
+
+    if layerImages:
+        digits = max(4, len(str(len(layers) - 1)))
+        tasks = [(lines, os.path.join(outputDir, "{0}_{1:0{2}d}.png".format(baseName, layerNr, digits)),
+                  originX, originY, scale, width, height) for layerNr, (layerKey, lines) in enumerate(layers)]
+        if jobs <= 1 or len(tasks) <= 1:
+            filenames.extend(render_layer(*task) for task in tasks)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                filenames.extend(executor.map(render_layer, *zip(*tasks), chunksize=max(1, len(tasks) // (4 * jobs))))
+
+    print("OK: {0} preview images of {1} layers written to '{2}' ({3:.2f} s)".format(len(filenames),
+          len(layers), outputDir, time.time() - startTime))
+    return filenames
+
+
+def export_previews(gcodeFile, outputDir, size=512, layerImages=False, topView=True, jobs=1):
+    """Parse a .gcode file, and render its preview images (see 'render_previews').
+
+    The images are named after the .gcode file.
+
+    return  :   list with the file names of the images
+    """
+    myMachine = Gcode_parser.Machine()
+    myMachine.add_extruder(gcodeFile)
+    extruder = myMachine.extruders[-1]
+    if len(extruder.rawGcode) == 0:
+        raise IOError("no gcode was read from '{0}'".format(gcodeFile))
+    return render_previews(extruder.get_transformed_gcode(), outputDir, Gcode_parser.gcode_base_name(gcodeFile), size=size,
+                           layerImages=layerImages, topView=topView, jobs=jobs)
+
+
+def main(argv=None):
+    """The command line entry point"""
+    parser = argparse.ArgumentParser(description="Render top-down PNG previews of a .gcode file.")
+    parser.add_argument("gcode", help="the .gcode file (may be compressed: .gz, .xz, .bz2)")
+    parser.add_argument("directory", help="the directory for the images")
+    parser.add_argument("--size", type=int, default=512, help="the width and height of the images in pixels (default: 512)")
+    parser.add_argument("--layers", action="store_true", help="also write an image of every layer")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="draw the layers in this many processes (default: 1, 0 for every CPU)")
+    args = parser.parse_args(argv)
+    if args.size < 16:
+        parser.error("the size must be at least 16 pixels")
+    if not os.path.isdir(args.directory):
+        os.makedirs(args.directory)
+
+    export_previews(args.gcode, args.directory, size=args.size, layerImages=args.layers,
+                    jobs=args.jobs or os.cpu_count() or 1)
+    return 0
+
+
+# ----- the body of the program -----
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,508 @@
+#! /usr/bin/env python3
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+"""
+Rasterize the deposited material of a .gcode file into a voxel grid, without Blender.
+
+Every extruding move is a line of plastic: a rounded rectangle in the X/Y
+plane (a 'capsule' around the move), as wide as the volume of its filament
+allows for its length and the layer height. The voxel columns whose centre
+lies inside a capsule are occupied; a layer fills the voxel slices between
+the Z-value of the layer below and its own Z-value.
+
+The grid is built layer by layer, while the file is parsed: the commands of
+a layer are dropped once it is rasterized, and its occupancy mask (of the 
+area of the layer only) is written to a temporary file right away. The voxel
+columns lie on a fixed lattice (column i spans i * resolution to 
+(i + 1) * resolution), so the masks fit in the grid without knowing its 
+size beforehand. When all layers are done, the masks are placed in the grid,
+one slice at a time. The layers can be rasterized in parallel, in worker 
+processes, and with NumPy (if it is installed). The grid is written as:
+
+    .npy    :   a NumPy array of uint8 (0 or 1) with shape (Z, Y, X); the
+                header is written here, so NumPy is not needed to export
+    .bvox   :   the 'Blender Voxel' format (float32), for a voxel data
+                texture in Blender
+
+Use from the command line:
+    python3 Gcode_voxels.py model.gcode model.npy --resolution 0.1 --jobs 4
+"""
+
+# ----- imports -----
+import argparse
+import bisect
+import concurrent.futures
+import math
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+try:
+    from . import Gcode_parser
+    from . import Gcode_analysis
+except (ImportError, SystemError, ValueError):
+    # not loaded as part of the Blender add-on, but as a script
+    import Gcode_parser
+    import Gcode_analysis
+
+try:
+    import numpy                                                                # optional: 'rasterize_layer_numpy'
+except ImportError:
+    numpy = None
+
+
+# ----- layer segments -----
+def iter_layer_segments(layers, lineWidth=None, maxLineWidth=2.0, settings=None):
+    """Yield the extruding segments of every layer, with their line width.
+
+    The width of a line is the volume of its filament, divided by its length
+    and the layer height (the distance to the highest layer below it, of the
+    layers so far). The feedrate does not change the amount of plastic per mm, 
+    and is not needed.
+
+    layers          :   iterable of (Z-value, commands) tuples, in print order,
+                        such as those of 'Machine.iter_add_extruder_layer_commands'.
+                        The last command of a layer is the start of the first 
+                        move of the next layer.
+    lineWidth       :   if given, the width (mm) of all lines, instead of the
+                        width from the extrusion
+    maxLineWidth    :   the widest line (mm); limits the width of very short
+                        moves, where the E-values are rounded the most
+    settings        :   dict with the settings to use instead of those in
+                        'Gcode_analysis.printerSettings' (for the filament diameter)
+
+    yield           :   (Z-value, layer height, segments, bounds) tuples of the layers 
+                        with extruding segments; 'segments' is a flat array('d') with 
+                        x0, y0, x1, y1, half width of every segment, and 'bounds' 
+                        is [minX, minY, maxX, maxY] of the lines.
+    """
+    area = Gcode_analysis.get_filament_area(settings)
+    lowerZ = []                                                                 # the sorted Z-values of the layers so far
+    layerHeight = None
+    lastCmd = None
+    for zValue, commands in layers:
+        columns = Gcode_analysis.get_move_columns(([lastCmd] if lastCmd is not None else []) + list(commands))
+        if commands:
+            lastCmd = commands[-1]
+
+        below = bisect.bisect_left(lowerZ, zValue)
+        lastZ = lowerZ[below - 1] if below > 0 else 0.0
+        segments = array('d')
+        bounds = [float("inf"), float("inf"), float("-inf"), float("-inf")]
+        for x, y, e, endX, endY in zip(columns["dX"], columns["dY"], columns["dE"], columns["X"], columns["Y"]):
+            if e <= 0.0 or (x == 0.0 and y == 0.0):
+                continue
+            if not segments:
+                layerHeight = zValue - lastZ if zValue - lastZ > 1e-6 else (layerHeight or 0.2)   # (a first layer at Z <= 0)
+            x0, y0 = endX - x, endY - y
+            if lineWidth is None:
+                width = min(e * area / (math.hypot(x, y) * layerHeight), maxLineWidth)
+            else:
+                width = lineWidth
+            segments.extend((x0, y0, endX, endY, width / 2.0))
+            bounds[0] = min(bounds[0], x0 - width / 2.0, endX - width / 2.0)
+            bounds[1] = min(bounds[1], y0 - width / 2.0, endY - width / 2.0)
+            bounds[2] = max(bounds[2], x0 + width / 2.0, endX + width / 2.0)
+            bounds[3] = max(bounds[3], y0 + width / 2.0, endY + width / 2.0)
+
+        if segments:
+            if below == len(lowerZ) or lowerZ[below] != zValue:
+                lowerZ.insert(below, zValue)
+            yield zValue, layerHeight, segments, bounds
+
+
+# ----- rasterization -----
+def capsule_row_interval(ax, ay, bx, by, radius, y):
+    """Returns the (left, right) X-values where the line at height 'y' crosses
+    the capsule of 'radius' around the segment (ax, ay)-(bx, by), or None.
+
+    The capsule is the union of two discs (at the ends) and a rectangle; it
+    is convex, so the union of the three crossings is a single interval.
+    """
+    left, right = float("inf"), float("-inf")
+    for px, py in ((ax, ay), (bx, by)):                                         # the discs at the ends
+        dy = y - py
+        if -radius <= dy <= radius:
+            half = math.sqrt(radius * radius - dy * dy)
+            left, right = min(left, px - half), max(right, px + half)
+
+    length = math.hypot(bx - ax, by - ay)
+    if length > 0.0:                                                            # the rectangle: 0 <= along <= length, |across| <= radius
+        ux, uy = (bx - ax) / length, (by - ay) / length
+        low, high = float("-inf"), float("inf")
+        for factor, offset, minimum, maximum in ((ux, (y - ay) * uy, 0.0, length),
+                                                 (-uy, (y - ay) * ux, -radius, radius)):
+            if abs(factor) < 1e-12:                                             # (factor * x + offset does not depend on x)
+                if not minimum <= offset <= maximum:
+                    low, high = 1.0, -1.0
+                continue
+            x0, x1 = (minimum - offset) / factor + ax, (maximum - offset) / factor + ax
+            low, high = max(low, min(x0, x1)), min(high, max(x0, x1))
+        if low <= high:
+            left, right = min(left, low), max(right, high)
+
+    return (left, right) if left <= right else None
+
+
+def rasterize_layer(segments, originX, originY, sizeX, sizeY, resolution):
+    """Returns the occupancy mask of one layer: a bytearray of sizeY rows of sizeX
+    bytes, with 1 for every voxel column whose centre is inside a line.
+
+    segments    :   flat array with x0, y0, x1, y1, half width of every segment
+                    (see 'iter_layer_segments')
+    originX, originY    :   the corner of the grid (mm)
+    sizeX, sizeY        :   the amount of voxels along X and Y
+    resolution          :   the size of a voxel (mm)
+
+    This is a module-level function, so it can run in a worker process.
+    """
+    mask = bytearray(sizeX * sizeY)
+    ones = b"\x01" * sizeX
+    for segmentNr in range(0, len(segments), 5):
+        x0, y0, x1, y1, radius = segments[segmentNr:segmentNr + 5]
+        firstRow = max(0, int(math.ceil((min(y0, y1) - radius - originY) / resolution - 0.5)))
+        lastRow = min(sizeY - 1, int(math.floor((max(y0, y1) + radius - originY) / resolution - 0.5)))
+        for row in range(firstRow, lastRow + 1):
+            interval = capsule_row_interval(x0, y0, x1, y1, radius, originY + (row + 0.5) * resolution)
+            if interval is None:
+                continue
+            first = max(0, int(math.ceil((interval[0] - originX) / resolution - 0.5)))
+            last = min(sizeX - 1, int(math.floor((interval[1] - originX) / resolution - 0.5)))
+            if first <= last:
+                start = row * sizeX
+                mask[start + first:start + last + 1] = ones[:last - first + 1]
+    return mask
+
+
+def rasterize_layer_numpy(segments, originX, originY, sizeX, sizeY, resolution, blockSize=20000):
+    """The same as 'rasterize_layer', with numpy arrays.
+
+    Every (segment, row) pair that the segment can cross is one element of 
+    the arrays; its interval is found as in 'capsule_row_interval'. The 
+    intervals are filled in at once: +1 at their first and -1 after their
+    last voxel, and the running sum is the occupancy. The segments are done
+    in blocks of 'blockSize', to limit the size of the arrays.
+    """
+    segments = numpy.frombuffer(segments, dtype=numpy.float64).reshape(-1, 5) if len(segments) else \
+               numpy.zeros((0, 5))
+    changes = numpy.zeros(sizeX * sizeY + 1, dtype=numpy.int64)
+    for blockStart in range(0, len(segments), blockSize):
+        ax, ay, bx, by, radius = segments[blockStart:blockStart + blockSize].T
+        firstRow = numpy.maximum(0, numpy.ceil((numpy.minimum(ay, by) - radius - originY) / resolution - 0.5))
+        lastRow = numpy.minimum(sizeY - 1, numpy.floor((numpy.maximum(ay, by) + radius - originY) / resolution - 0.5))
+        rowCounts = numpy.maximum(lastRow - firstRow + 1, 0).astype(numpy.int64)
+        if rowCounts.sum() == 0:
+            continue
+
+        # one element per (segment, row) pair
+        pairs = numpy.repeat(numpy.arange(len(ax)), rowCounts)
+        rows = firstRow[pairs] + (numpy.arange(len(pairs)) - numpy.repeat(numpy.cumsum(rowCounts) - rowCounts, rowCounts))
+        ax, ay, bx, by, radius = ax[pairs], ay[pairs], bx[pairs], by[pairs], radius[pairs]
+        y = originY + (rows + 0.5) * resolution
+
+        left = numpy.full(len(pairs), numpy.inf)
+        right = numpy.full(len(pairs), -numpy.inf)
+        for px, py in ((ax, ay), (bx, by)):                                     # the discs at the ends
+            dy = y - py
+            inside = (-radius <= dy) & (dy <= radius)
+            half = numpy.sqrt(numpy.maximum(radius * radius - dy * dy, 0.0))
+            left = numpy.where(inside, numpy.minimum(left, px - half), left)
+            right = numpy.where(inside, numpy.maximum(right, px + half), right)
+
+        length = numpy.hypot(bx - ax, by - ay)                                  # the rectangle
+        safeLength = numpy.where(length > 0.0, length, 1.0)
+        ux, uy = (bx - ax) / safeLength, (by - ay) / safeLength
+        low = numpy.full(len(pairs), -numpy.inf)
+        high = numpy.full(len(pairs), numpy.inf)
+        crossed = length > 0.0
+        for factor, offset, minimum, maximum in ((ux, (y - ay) * uy, 0.0, length),
+                                                 (-uy, (y - ay) * ux, -radius, radius)):
+            flat = numpy.abs(factor) < 1e-12
+            crossed &= ~flat | ((minimum <= offset) & (offset <= maximum))
+            safeFactor = numpy.where(flat, 1.0, factor)
+            x0, x1 = (minimum - offset) / safeFactor + ax, (maximum - offset) / safeFactor + ax
+            low = numpy.where(flat, low, numpy.maximum(low, numpy.minimum(x0, x1)))
+            high = numpy.where(flat, high, numpy.minimum(high, numpy.maximum(x0, x1)))
+        crossed &= low <= high
+        left = numpy.where(crossed, numpy.minimum(left, low), left)
+        right = numpy.where(crossed, numpy.maximum(right, high), right)
+
+        first = numpy.maximum(0, numpy.ceil((left - originX) / resolution - 0.5))
+        last = numpy.minimum(sizeX - 1, numpy.floor((right - originX) / resolution - 0.5))
+        filled = (left <= right) & (first <= last)
+        starts = (rows * sizeX + first)[filled].astype(numpy.int64)
+        ends = (rows * sizeX + last + 1)[filled].astype(numpy.int64)
+        changes += numpy.bincount(starts, minlength=len(changes))
+        changes -= numpy.bincount(ends, minlength=len(changes))
+
+    return bytearray((numpy.cumsum(changes[:-1]) > 0).astype(numpy.uint8).tobytes())
+
+
+# ----- the voxel file -----
+class VoxelExport:
+    """Write a voxel grid to a .npy or .bvox file, slice by slice (from low to high Z).
+
+    Add the slices with 'add_slices'; they are written to a temporary file
+    right away. 'close' writes the output file, which needs the amount of
+    slices in its header. Use it as a context manager to close it automatically.
+
+    Variables:
+        filename        :   the output file
+        fileFormat      :   'npy' or 'bvox'
+        sizeX, sizeY    :   the amount of voxels along X and Y
+        sliceCount      :   the amount of slices (along Z) written so far
+    """
+
+    def __init__(self, filename, sizeX, sizeY, fileFormat=None):
+        """Prepare the export; 'fileFormat' is taken from the file name if not given"""
+        if fileFormat is None:
+            fileFormat = os.path.splitext(filename)[1].lower().lstrip(".")
+        if fileFormat not in ("npy", "bvox"):
+            raise ValueError("unknown voxel format '{0}', use 'npy' or 'bvox'".format(fileFormat))
+
+        self.filename = filename
+        self.fileFormat = fileFormat
+        self.sizeX = sizeX
+        self.sizeY = sizeY
+        self.sliceCount = 0
+        self.sliceFile = tempfile.TemporaryFile()
+
+    def __repr__(self):
+        """return a representation of the 'VoxelExport' instance"""
+        return "<VoxelExport '{0.filename}' ({0.fileFormat}): {0.sizeX} x {0.sizeY} x {0.sliceCount} voxels>".format(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+        else:                                                                   # do not write a partial file
+            self.sliceFile.close()
+
+    def add_slices(self, mask, count=1):
+        """Add 'count' slices with the occupancy 'mask' (see 'rasterize_layer')"""
+        if count <= 0:
+            return
+        if self.fileFormat == "bvox":
+            data = array('f', mask)
+            if sys.byteorder != "little":
+                data.byteswap()
+            data = data.tobytes()
+        else:
+            data = bytes(mask)
+        for sliceNr in range(count):
+            self.sliceFile.write(data)
+        self.sliceCount += count
+
+    def close(self):
+        """Write the output file, and remove the temporary file"""
+        self.sliceFile.seek(0)
+        with open(self.filename, mode="wb") as voxelFile:
+            if self.fileFormat == "npy":
+                voxelFile.write(self.get_npy_header())
+            else:
+                voxelFile.write(struct.pack("<4i", self.sizeX, self.sizeY, self.sliceCount, 1))   # resolution X, Y, Z, frames
+            shutil.copyfileobj(self.sliceFile, voxelFile, 1 << 20)
+        self.sliceFile.close()
+
+    def get_npy_header(self):
+        """Returns the header of a .npy file (format version 1.0) for the grid"""
+        description = "{{'descr': '|u1', 'fortran_order': False, 'shape': ({0}, {1}, {2}), }}".format(
+                        self.sliceCount, self.sizeY, self.sizeX)
+        headerLength = len(description) + 1                                     # (ends with a newline)
+        headerLength += -(10 + headerLength) % 64                               # the data starts 64-byte aligned
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", headerLength) + \
+               (description.ljust(headerLength - 1) + "\n").encode("latin1")
+
+
+def get_layer_window(bounds, resolution):
+    """Returns the (first column, first row, amount of columns, amount of rows) of 
+    the voxel columns whose centre lies within 'bounds' ([minX, minY, maxX, maxY])"""
+    firstCol = int(math.ceil(bounds[0] / resolution - 0.5))
+    firstRow = int(math.ceil(bounds[1] / resolution - 0.5))
+    colCount = max(0, int(math.floor(bounds[2] / resolution - 0.5)) - firstCol + 1)
+    rowCount = max(0, int(math.floor(bounds[3] / resolution - 0.5)) - firstRow + 1)
+    return firstCol, firstRow, colCount, rowCount
+
+
+def voxelize(layers, voxelFile, resolution=0.1, lineWidth=None, jobs=1, fileFormat=None):
+    """Rasterize the deposited material of a stream of layers, and write the voxel grid.
+
+    The layers are rasterized in order, each within its own window (see 
+    'get_layer_window'); with 'jobs' > 1, in that many worker processes. At 
+    most 2 layers per worker are waiting, and the masks are kept in a 
+    temporary file, so the memory use does not grow with the amount of layers.
+    When all layers are done, the masks are placed in the slices of the grid
+    (from low to high Z). A Z-value that occurs more than once (the print 
+    returned to a layer) gets the union of its masks.
+
+    layers          :   iterable of (Z-value, commands) tuples, in print order 
+                        (see 'iter_layer_segments')
+    voxelFile       :   the output file (.npy or .bvox)
+    resolution      :   the size (mm) of a voxel
+    lineWidth       :   the width (mm) of all lines; if None, the width follows
+                        from the extrusion (see 'iter_layer_segments')
+
+    return          :   a dict with:
+                        shape       :   (Z, Y, X) amount of voxels
+                        origin      :   (x, y, z) of the corner of the grid (mm)
+                        resolution  :   the size of a voxel (mm)
+                        occupied    :   the amount of occupied voxels
+                        volume      :   the volume of the occupied voxels (mm3)
+                        layers      :   dict with the fill fraction of every layer:
+                                        the occupied part of the grid's X/Y area
+    """
+    startTime = time.time()
+    rasterize = rasterize_layer_numpy if numpy is not None else rasterize_layer
+
+    def iter_masks():
+        windows = ((zValue, layerHeight, segments, get_layer_window(bounds, resolution)) 
+                   for zValue, layerHeight, segments, bounds in iter_layer_segments(layers, lineWidth))
+        if jobs <= 1:
+            for zValue, layerHeight, segments, (firstCol, firstRow, colCount, rowCount) in windows:
+                yield zValue, layerHeight, (firstCol, firstRow, colCount, rowCount), \
+                      rasterize(segments, firstCol * resolution, firstRow * resolution, colCount, rowCount, resolution)
+            return
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            pending = []
+            for zValue, layerHeight, segments, (firstCol, firstRow, colCount, rowCount) in windows:
+                pending.append((zValue, layerHeight, (firstCol, firstRow, colCount, rowCount), 
+                                executor.submit(rasterize, segments, firstCol * resolution, firstRow * resolution, 
+                                                colCount, rowCount, resolution)))
+                if len(pending) >= 2 * jobs:
+                    zValue, layerHeight, window, future = pending.pop(0)
+                    yield zValue, layerHeight, window, future.result()
+            for zValue, layerHeight, window, future in pending:
+                yield zValue, layerHeight, window, future.result()
+
+    # (1) rasterize every layer within its own window, to a temporary file
+    records = []                                                                # (Z-value, layer height, window, file offset)
+    with tempfile.TemporaryFile() as maskFile:
+        for zValue, layerHeight, window, mask in iter_masks():
+            records.append((zValue, layerHeight, window, maskFile.tell()))
+            maskFile.write(mask)
+
+        windows = [window for zValue, layerHeight, window, offset in records if window[2] > 0 and window[3] > 0]
+        if windows:
+            firstCol = min(window[0] for window in windows)
+            firstRow = min(window[1] for window in windows)
+            sizeX = max(window[0] + window[2] for window in windows) - firstCol
+            sizeY = max(window[1] + window[3] for window in windows) - firstRow
+        else:
+            firstCol = firstRow = 0
+            sizeX = sizeY = 1
+        originX, originY = firstCol * resolution, firstRow * resolution
+        originZ = min([zValue - layerHeight for zValue, layerHeight, window, offset in records] or [0.0])
+
+        # (2) place the masks in the slices of the grid: from the layer below up to its Z-value
+        records.sort(key=lambda record: record[0])                              # (a stable sort: in print order per Z)
+        fillFractions = dict()
+        occupied = 0
+        with VoxelExport(voxelFile, sizeX, sizeY, fileFormat) as export:
+            for recordNr, (zValue, layerHeight, window, offset) in enumerate(records):
+                if recordNr > 0 and records[recordNr - 1][0] == zValue:
+                    continue                                                    # (placed with the first record of this Z)
+                layerMask = bytearray(sizeX * sizeY)
+                for otherZ, otherHeight, (col, row, colCount, rowCount), otherOffset in records[recordNr:]:
+                    if otherZ != zValue:
+                        break
+                    maskFile.seek(otherOffset)
+                    mask = maskFile.read(colCount * rowCount)
+                    for rowNr in range(rowCount):
+                        start = (row - firstRow + rowNr) * sizeX + col - firstCol
+                        part = mask[rowNr * colCount:(rowNr + 1) * colCount]
+                        if otherOffset != offset:                               # (the union with the masks before)
+                            part = (int.from_bytes(part, "little") | 
+                                    int.from_bytes(layerMask[start:start + colCount], "little")).to_bytes(colCount, "little")
+                        layerMask[start:start + colCount] = part
+
+                first = int(round((zValue - layerHeight - originZ) / resolution))
+                last = max(first + 1, int(round((zValue - originZ) / resolution)))
+                first = max(first, export.sliceCount)                           # (overlapping layers: the lower one wins)
+                export.add_slices(bytearray(sizeX * sizeY), first - export.sliceCount)
+                export.add_slices(layerMask, last - first)
+                layerCount = layerMask.count(1)
+                occupied += layerCount * max(0, last - first)
+                fillFractions[zValue] = layerCount / float(sizeX * sizeY)
+
+    result = {"shape": (export.sliceCount, sizeY, sizeX),
+              "origin": (originX, originY, originZ),
+              "resolution": resolution,
+              "occupied": occupied,
+              "volume": occupied * resolution ** 3,
+              "layers": fillFractions}
+    print("OK: {0} layers rasterized to '{1}': {2} x {3} x {4} voxels of {5} mm, {6:.0f} mm3 occupied ({7:.2f} s)".format(
+          len(fillFractions), voxelFile, sizeX, sizeY, export.sliceCount, resolution, result["volume"], 
+          time.time() - startTime))
+    return result
+
+
+def export_voxels(gcodeFile, voxelFile, resolution=0.1, lineWidth=None, jobs=1, fileFormat=None):
+    """Parse a .gcode file, and export its deposited material as a voxel grid (see 'voxelize').
+    
+    The layers are rasterized while the file is parsed (see 
+    'Machine.iter_add_extruder_layer_commands'), and the Gcode commands of
+    every layer are dropped once the layer is done.
+    
+    return  :   the dict of 'voxelize'
+    """
+    myMachine = Gcode_parser.Machine()
+
+    def iter_layers():
+        layerCount = 0
+        for progress, finished in myMachine.iter_add_extruder_layer_commands(gcodeFile, keepCommands=False):
+            layerCount += len(finished)
+            for layer in finished:
+                yield layer
+        if layerCount == 0:                                                     # (raised before the output file is written)
+            raise IOError("no gcode was read from '{0}'".format(gcodeFile))
+
+    return voxelize(iter_layers(), voxelFile, resolution=resolution, lineWidth=lineWidth, jobs=jobs, 
+                    fileFormat=fileFormat)
+
+
+def main(argv=None):
+    """The command line entry point"""
+    parser = argparse.ArgumentParser(description="Export the deposited material of a .gcode file as a voxel grid.")
+    parser.add_argument("gcode", help="the .gcode file (may be compressed: .gz, .xz, .bz2)")
+    parser.add_argument("voxels", help="the output file (.npy or .bvox)")
+    parser.add_argument("--resolution", type=float, default=0.1, help="the size of a voxel in mm (default: 0.1)")
+    parser.add_argument("--line-width", type=float, default=None, 
+                        help="the width of all lines in mm (default: from the extrusion)")
+    parser.add_argument("--jobs", type=int, default=1, 
+                        help="rasterize the layers in this many processes (default: 1, 0 for every CPU)")
+    args = parser.parse_args(argv)
+    if args.resolution <= 0.0:
+        parser.error("the resolution must be positive")
+
+    export_voxels(args.gcode, args.voxels, resolution=args.resolution, lineWidth=args.line_width, 
+                  jobs=args.jobs or os.cpu_count() or 1)
+    return 0
+
+
+# ----- the body of the program -----
+if __name__ == "__main__":
+    sys.exit(main())
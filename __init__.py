@@ -64,10 +64,13 @@ else:
     from . import Gcode_parser as parseGcode
     print("Imported Blender_import_gcode, Gcode_parser")
 
+import os
+import time
+
 import bpy 
 
 from bpy_extras.io_utils import ImportHelper
-from bpy.props import StringProperty, BoolProperty
+from bpy.props import StringProperty, BoolProperty, CollectionProperty, FloatProperty, EnumProperty
 
 
 bl_info = {
@@ -86,61 +89,114 @@ __version__ = '.'.join([str(s) for s in bl_info['version']])
 # ---------------------------------------------
 class IMPORT_OT_gcode(bpy.types.Operator, ImportHelper):
     """Class to open the File Selector to select a .gcode file
+    
+    The import runs as a modal operator: a window manager timer triggers the
+    'modal' method, which processes the file for at most 'time_slice' seconds
+    before handing control back to Blender (or earlier, when the job waits 
+    for a worker and yields the phase 'wait'). Press Esc to cancel the import;
+    all Blender data that was created so far is then removed again.
+    
+    Global undo is switched off while the import runs, so that the many new 
+    datablocks do not each push an undo state. 'end_import' restores it, 
+    whether the import finishes, is cancelled or fails.
     """
     bl_idname= "import_scene.import_gcode"
     bl_description = 'Use the File Selector to import a .gcode file'
     bl_label = "Import GcodeZ"
     filename_ext = ".gcode"
-    filter_glob = StringProperty(default="*.gcode", options={'HIDDEN'})    
+    filter_glob = StringProperty(default="*.gcode;*.gcode.gz;*.gcode.xz;*.gcode.bz2", options={'HIDDEN'})    
     filepath= StringProperty(name="File Path", description="Filepath used for importing the .gcode file", maxlen=1024, default="")
+    files = CollectionProperty(name="File Path", type=bpy.types.OperatorFileListElement)
+    directory = StringProperty(subtype='DIR_PATH')
+
+    time_slice = 0.1                                                            # seconds of work per timer event
     
     def execute(self, context): 
-## ADD FUNCTIONAL STUFF HERE
-        # Initiate a virtual 3D printing machine
-        myMachine = parseGcode.Machine()
-        print("OK: initiated Machine:", myMachine)
-
-        # Import the .gcode file and add as an extruder
-        myMachine.add_extruder(self.filepath)
-        print("OK: add extruder to current machine.")
-
-        # select the extruder we'd like to draw
-        extruderToDraw = myMachine.extruders[-1]
-
-        # Get the extruder we'd like to draw, and transfer that data to a gcodeCurvesData object
-        myGcodeCurvesData = blenderGcode.gcodeCurvesData(extruderToDraw)
-
-        # Sort the Gcode commands by Z-value, and create 'gcodeCurve' instance for every Z value
-        myGcodeCurvesData.add_gcode_to_gcodeCurves()
-
-        # Obtain a sorted list of all the names of the layers, i.e., all Z values.
-        Z_layerNames = sorted(blenderGcode.gcodeCurve._registry)
-
-        # Create splines data
-        for Zval in Z_layerNames:
-            myGcodeCurvesData.gcodeCurves[Zval].create_splines_data()
-
-        # There might well be layers with commands but without splines. We will
-        # remove these, as they will clutter the code (NB such spline-less layers
-        # are normally the result of a repositioning command like G92)
-        noSplineInLayer = list()
-        for layer in Z_layerNames:
-            if myGcodeCurvesData.gcodeCurves[layer].count_splines() == 0:                           # no splines are present
-                noSplineInLayer.append(myGcodeCurvesData.gcodeCurves.pop(layer))                    # pop the layer with 0 splines
-                blenderGcode.gcodeCurve._registry.remove(layer)
-        print("These layers were removed as they contain no splines:", noSplineInLayer)
-    
-        # Hack to reselect the Z_layerNames: layers with 0 curves are removed, so we need to update
-        Z_layerNames = sorted(blenderGcode.gcodeCurve._registry)
-    
-        # let's start drawing in Blender!
-        # First, make a bevel object in case we'd like to use one
-        myGcodeCurvesData.create_bevel_object()
+        # The 'gcodeImportJob' parses the file, and builds the curves in steps
+        # With a layer window, only the layers in the chosen Z range are drawn
+        layerWindow = None
+        if context.scene.use_layer_window:
+            layerWindow = blenderGcode.gcodeLayerWindow(context.scene.layer_window_min, 
+                                                        context.scene.layer_window_max, 
+                                                        use_bevel = context.scene.use_bevel)
+            blenderGcode.activeLayerWindow = layerWindow
+
+        # With 'color by flow', the curves get a material per volumetric flow bin
+        maxFlow = context.scene.max_flow if context.scene.color_by_flow else None
+
+        # With more than one file selected, every file is parsed in its own process
+        filepaths = [os.path.join(self.directory, f.name) for f in self.files if f.name]
+        if len(filepaths) > 1:
+            self._job = blenderGcode.gcodeMultiFileImportJob(filepaths, use_bevel = context.scene.use_bevel,
+                                                             simplifyTolerance = context.scene.simplify_tolerance,
+                                                             maxFlow = maxFlow)
+        elif context.scene.use_background_parsing:
+            self._job = blenderGcode.gcodeThreadedImportJob(self.filepath, use_bevel = context.scene.use_bevel,
+                                                            layerWindow = layerWindow,
+                                                            simplifyTolerance = context.scene.simplify_tolerance,
+                                                            maxFlow = maxFlow)
+        else:
+            self._job = blenderGcode.gcodeImportJob(self.filepath, use_bevel = context.scene.use_bevel,
+                                                    layerWindow = layerWindow,
+                                                    simplifyTolerance = context.scene.simplify_tolerance,
+                                                    maxFlow = maxFlow)
+        self._steps = self._job.steps()
+        print("OK: start import of", filepaths if len(filepaths) > 1 else self.filepath)
+
+        editPreferences = context.user_preferences.edit
+        self._use_global_undo = editPreferences.use_global_undo
+        editPreferences.use_global_undo = False
+
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self._timer = wm.event_timer_add(0.01, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
 
-        myGcodeCurvesData.draw_blender_bezier_curves(use_bevel = bpy.context.scene.use_bevel)
- 
- ## END FUNCTIONAL STUFF
-        return {'FINISHED'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            return self.cancel(context)
+
+        if event.type == 'TIMER':
+            deadline = time.time() + self.time_slice
+            try:
+                while time.time() < deadline:
+                    phase, fraction = next(self._steps)
+                    if phase == "wait":                                         # the job waits for a worker: do not spin
+                        break
+            except StopIteration:
+                self.end_import(context)
+                blenderGcode.apply_levels_of_detail(context.scene)
+                if self._job.statistics is not None:
+                    blenderGcode.activeStatistics = self._job.statistics
+                return {'FINISHED'}
+            except Exception:
+                self.cancel(context)
+                raise
+            context.window_manager.progress_update(int(100 * fraction))
+
+        return {'PASS_THROUGH'}
+
+
+    def cancel(self, context):
+        try:
+            self._steps.close()                                                 # ends any 'with' block in the import steps
+            self._job.cancel()
+        finally:
+            self.end_import(context)
+        self.report({'INFO'}, "Gcode import cancelled")
+        return {'CANCELLED'}
+
+
+    def end_import(self, context):
+        """Remove the timer and the progress bar, and restore global undo"""
+        try:
+            wm = context.window_manager
+            wm.event_timer_remove(self._timer)
+            wm.progress_end()
+        finally:
+            context.user_preferences.edit.use_global_undo = self._use_global_undo
 
 
     def invoke(self, context, event):
@@ -148,6 +204,32 @@ class IMPORT_OT_gcode(bpy.types.Operator, ImportHelper):
         return {'RUNNING_MODAL'}
 
 
+class OBJECT_OT_UpdateGcodeLevelsOfDetail(bpy.types.Operator):
+    """Class for a button that redraws the layers at the chosen level of detail
+    """
+    bl_idname = "import_scene.update_gcode_lod"
+    bl_label = "Update level of detail"
+
+    def execute(self, context):
+        blenderGcode.apply_levels_of_detail(context.scene)
+        return {'FINISHED'}
+
+
+class OBJECT_OT_PrintGcodeStatistics(bpy.types.Operator):
+    """Class for a button that prints the statistics of every layer to the console
+    """
+    bl_idname = "import_scene.print_gcode_statistics"
+    bl_label = "Print the statistics per layer"
+
+    def execute(self, context):
+        if blenderGcode.activeStatistics is None:
+            self.report({'INFO'}, "No statistics: import a .gcode file first")
+            return {'CANCELLED'}
+        for line in blenderGcode.Gcode_analysis.format_statistics(blenderGcode.activeStatistics, perLayer = True):
+            print(line)
+        return {'FINISHED'}
+
+
 class OBJECT_OT_CloseGcodePanelButton(bpy.types.Operator):
     """Class for a button that can close the .gcode import panel
     """
@@ -171,6 +253,27 @@ class GcodeToolPropertiesPanel(bpy.types.Panel):
     def draw(self, context):
         self.layout.operator("import_scene.import_gcode", text='Import a .gcode file')
         self.layout.prop(context.scene, "use_bevel") 
+        self.layout.prop(context.scene, "use_background_parsing") 
+        self.layout.prop(context.scene, "simplify_tolerance") 
+        row = self.layout.row(align=True)
+        row.prop(context.scene, "color_by_flow")
+        if context.scene.color_by_flow:
+            row.prop(context.scene, "max_flow")
+        self.layout.prop(context.scene, "use_layer_window") 
+        if context.scene.use_layer_window:
+            row = self.layout.row(align=True)
+            row.prop(context.scene, "layer_window_min")
+            row.prop(context.scene, "layer_window_max")
+        self.layout.prop(context.scene, "lod_mode")
+        if context.scene.lod_mode == 'DISTANCE':
+            row = self.layout.row(align=True)
+            row.prop(context.scene, "lod_distance")
+            row.operator("import_scene.update_gcode_lod", text = 'Update')
+        if blenderGcode.activeStatistics is not None:
+            box = self.layout.box()
+            for line in blenderGcode.Gcode_analysis.format_statistics(blenderGcode.activeStatistics):
+                box.label(text = line)
+            box.operator("import_scene.print_gcode_statistics", text = 'Print per layer')
         self.layout.operator("import_scene.close_panel", text = 'Close this panel')
 # ----------------------------        
 
@@ -178,6 +281,60 @@ bpy.types.Scene.use_bevel = BoolProperty(name = "Use Bevel",
                                          description = "Whether or not to use a bevel object",
                                          default = False)
 
+bpy.types.Scene.use_background_parsing = BoolProperty(name = "Parse in background", 
+                                         description = "Parse the file in a background thread, and draw the layers as soon as they are ready",
+                                         default = True)
+
+
+bpy.types.Scene.simplify_tolerance = FloatProperty(name = "Simplify (mm)", 
+                                         description = "Remove spline points that deviate less than this from a straight line (0: keep all points)",
+                                         default = 0.0, min = 0.0, soft_max = 0.5, precision = 3)
+
+bpy.types.Scene.color_by_flow = BoolProperty(name = "Color by flow", 
+                                         description = "Color the curves by volumetric flow (blue: none, red: the maximum, magenta: above), and report the moves above the maximum",
+                                         default = False)
+
+bpy.types.Scene.max_flow = FloatProperty(name = "Max (mm3/s)", 
+                                         description = "The maximum volumetric flow of the hotend",
+                                         default = 15.0, min = 0.1, soft_max = 50.0, precision = 1)
+
+def update_levels_of_detail(self, context):
+    """Redraw the layers when the level of detail setting is changed"""
+    blenderGcode.apply_levels_of_detail(self)
+
+bpy.types.Scene.lod_mode = EnumProperty(name = "Detail", 
+                                         description = "Level of detail of the drawn layers; the Gcode is not parsed again",
+                                         items = [('FULL', "Full", "Draw every point"),
+                                                  ('QUARTER', "1/4", "Draw 1 in 4 points"),
+                                                  ('SIXTEENTH', "1/16", "Draw 1 in 16 points"),
+                                                  ('DISTANCE', "By distance", "Choose the detail by the distance to the scene camera")],
+                                         default = 'FULL',
+                                         update = update_levels_of_detail)
+
+bpy.types.Scene.lod_distance = FloatProperty(name = "Full detail up to", 
+                                         description = "Up to this distance from the camera, layers are drawn at full detail",
+                                         default = 200.0, min = 0.0,
+                                         update = update_levels_of_detail)
+
+def update_layer_window(self, context):
+    """Draw or free layers when the Z range of the layer window is changed"""
+    if blenderGcode.activeLayerWindow is not None:
+        blenderGcode.activeLayerWindow.update(self.layer_window_min, self.layer_window_max)
+
+bpy.types.Scene.use_layer_window = BoolProperty(name = "Use layer window", 
+                                         description = "Keep all layers in memory, but only draw the layers within a Z range",
+                                         default = False)
+
+bpy.types.Scene.layer_window_min = FloatProperty(name = "Z min", 
+                                         description = "Lowest Z-value of the layers to draw",
+                                         default = 0.0, min = 0.0, precision = 2, 
+                                         update = update_layer_window)
+
+bpy.types.Scene.layer_window_max = FloatProperty(name = "Z max", 
+                                         description = "Highest Z-value of the layers to draw",
+                                         default = 1.0, min = 0.0, precision = 2, 
+                                         update = update_layer_window)
+
 
 
 def menu_func(self, context):
@@ -186,11 +343,13 @@ def menu_func(self, context):
 def register():
     bpy.utils.register_module(__name__)
     bpy.types.INFO_MT_file_import.append(menu_func)
+    bpy.app.handlers.frame_change_post.append(blenderGcode.update_levels_of_detail_on_frame_change)
  
 
 def unregister():
     bpy.utils.unregister_module(__name__)
     bpy.types.INFO_MT_file_import.remove(menu_func)
+    bpy.app.handlers.frame_change_post.remove(blenderGcode.update_levels_of_detail_on_frame_change)
 
 if __name__ == "__main__":
     register()
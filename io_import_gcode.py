@@ -60,6 +60,11 @@ import bpy
 import mathutils
 import math
 
+try:
+    import numpy #bundled with Blender since 2.70; addArc falls back to plain Python without it
+except ImportError:
+    numpy = None
+
 
 class tool:
     def __init__(self,name='null tool'):
@@ -176,6 +181,9 @@ class driver:
 
     
 def vertsToPoints(Verts):
+    # a numpy array of verts (from addArc_numpy) stays an array, which foreach_set takes as it is
+    if numpy is not None and isinstance(Verts, numpy.ndarray):
+        return numpy.hstack((Verts, numpy.zeros((len(Verts), 1)))).ravel()
     # main vars
     vertArray = []
     for v in Verts:
@@ -205,7 +213,113 @@ def create_poly(verts,counter):
     scene.objects.link(new_obj) # place in active scene
     return new_obj
 
-def addArc(Verts):
+def addArc(Verts, distance=0.02):
+    #Takes the verts for a polyline and then adds verts on either side of the original verts to create a sort of 'arc'
+    #Should help prevent the polyline from doing stupid things like kinking or twisting
+    
+    #This is the batched version of addArc_legacy (kept below for reference and benchmarking).
+    #The offsets of the arcpoints are just the direction of the segment scaled to 'distance':
+    #  arcPoint1 = vert + (dx, dy) * distance / length
+    #  arcPoint2 = peekVert - (dx, dy) * distance / length
+    #which is what the slope/atan/cos/sin steps of the legacy version work out to, without
+    #the trigonometry and the sign checks. Segments that are too short are skipped silently.
+    #With numpy, polylines of 256 verts or more are done by addArc_numpy (it is slower on short ones, because of
+    #the conversion to arrays); otherwise this is a single pass over the segment pairs.
+    
+    if numpy is not None and len(Verts) >= 256:
+        return addArc_numpy(Verts, distance)
+    
+    vertArray = []
+    append = vertArray.append
+    sqrt = math.sqrt
+    minimumSquared = (distance*2)*(distance*2)
+    
+    for vert, peekVert in zip(Verts, Verts[1:]):
+        append(vert)
+        dx = peekVert[0]-vert[0]
+        dy = peekVert[1]-vert[1]
+        lengthSquared = dx*dx + dy*dy
+        if lengthSquared <= minimumSquared:
+            #The verts are too close together, leave them alone
+            continue
+        scale = distance/sqrt(lengthSquared)
+        ox = dx*scale
+        oy = dy*scale
+        z = vert[2]
+        append([vert[0]+ox, vert[1]+oy, z])
+        append([peekVert[0]-ox, peekVert[1]-oy, z])
+    
+    if len(Verts) > 0:
+        append(Verts[-1])
+    return vertArray
+
+def addArc_numpy(Verts, distance=0.02):
+    #The same as addArc, for all segments at once with numpy arrays; returns an (n, 3) array
+    #Every vert is followed by the two arcpoints of its segment, if that segment is long enough:
+    #the output position of each vert is the amount of verts and arcpoints before it
+    
+    points = numpy.asarray(Verts, dtype=float)
+    if len(points) < 2:
+        return points
+    
+    offsets = points[1:, :2]-points[:-1, :2]
+    lengthSquared = (offsets*offsets).sum(axis=1)
+    keep = lengthSquared > (distance*2)*(distance*2)
+    offsets = offsets[keep]*(distance/numpy.sqrt(lengthSquared[keep]))[:, None]
+    
+    sizes = numpy.ones(len(points), dtype=numpy.intp)
+    sizes[:-1][keep] = 3
+    starts = numpy.cumsum(sizes)-sizes
+    vertArray = numpy.empty((sizes.sum(), points.shape[1]))
+    vertArray[starts] = points
+    
+    segmentStarts = starts[:-1][keep]
+    first, second = vertArray[segmentStarts+1], vertArray[segmentStarts+2]
+    first[:, :2] = points[:-1][keep, :2]+offsets
+    second[:, :2] = points[1:][keep, :2]-offsets
+    first[:, 2:] = second[:, 2:] = points[:-1][keep, 2:]
+    vertArray[segmentStarts+1] = first
+    vertArray[segmentStarts+2] = second
+    return vertArray
+
+def benchmark_addArc(Verts, repeat=10):
+    #Compares addArc (with and without numpy) with addArc_legacy on a polyline: checks that 
+    #they give the same verts (within float tolerance) and prints how long each takes, 
+    #including vertsToPoints, which turns the verts into the flat list that create_poly needs
+    import time
+    global numpy
+    
+    timings = []
+    installedNumpy = numpy
+    for label, function, useNumpy in (('addArc_legacy', lambda verts: addArc_legacy(verts, verbose=False), False),
+                                      ('addArc (plain Python)', addArc, False),
+                                      ('addArc (numpy)', addArc, True)):
+        if useNumpy and installedNumpy is None:
+            continue
+        numpy = installedNumpy if useNumpy else None
+        try:
+            start = time.time()
+            for i in range(repeat):
+                vertArray = vertsToPoints(function(Verts))
+            timings.append((label, time.time()-start, vertArray))
+        finally:
+            numpy = installedNumpy
+    
+    legacyTime, legacyArray = timings[0][1], timings[0][2]
+    for label, seconds, vertArray in timings[1:]:
+        if len(legacyArray) != len(vertArray):
+            raise ValueError(label+' gives '+str(len(vertArray)//4)+' verts, addArc_legacy gives '+str(len(legacyArray)//4))
+        for index, (legacyValue, newValue) in enumerate(zip(legacyArray, vertArray)):
+            if abs(legacyValue-newValue) > 1e-9:
+                raise ValueError(label+' differs from addArc_legacy at vert '+str(index//4)+': '+
+                                 str(newValue)+' != '+str(legacyValue))
+    
+    for label, seconds, vertArray in timings:
+        print(label+': '+str(round(seconds, 4))+' s for '+str(repeat)+' x '+str(len(Verts))+' verts ('+
+              str(round(legacyTime/max(seconds, 1e-9), 1))+'x faster than addArc_legacy)')
+    return [(label, seconds) for label, seconds, vertArray in timings]
+
+def addArc_legacy(Verts, verbose=True):
     #Takes the verts for a polyline and then adds verts on either side of the original verts to create a sort of 'arc'
     #Should help prevent the polyline from doing stupid things like kinking or twisting
     
@@ -234,7 +348,8 @@ def addArc(Verts):
             if (math.pow((peekVert[1]-vert[1]),2) + math.pow((peekVert[0]-vert[0]),2) <= math.pow(doubleDistance,2)):
                 #The verts are too close together! Argh!
                 #Let's not mess with these verts, they look pretty scary.
-                print('Discarding arcpoints; verts too close together.')
+                if verbose:
+                    print('Discarding arcpoints; verts too close together.')
                 continue
             
             if((peekVert[0]-vert[0]) == 0):
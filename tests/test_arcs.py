@@ -0,0 +1,82 @@
+"""Tests for the tessellation of arc moves (G2, G3) while parsing, with and without numpy.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_parser
+
+
+def parse_extruder(lines, withNumpy):
+    installedNumpy = Gcode_parser.numpy
+    if not withNumpy:
+        Gcode_parser.numpy = None
+    try:
+        extruder = Gcode_parser.Extruder()
+        for lineCount in extruder.iter_convert_lines(lines):
+            pass
+    finally:
+        Gcode_parser.numpy = installedNumpy
+    return extruder
+
+
+def arc_points(cmd):
+    return [tuple(cmd.arcPoints[index:index + 3]) for index in range(0, len(cmd.arcPoints), 3)]
+
+
+class ArcTest(unittest.TestCase):
+
+    lines = ["G21", "G90", "G92 E0", "G1 X10 Y0 Z0.2 F1200",
+             "G3 X0 Y10 I-10 J0 E1",                                            # a quarter circle around (0, 0), counter-clockwise
+             "G2 X10 Y0 R10 E2",                                                # back along the same quarter, clockwise
+             "G2 X0 Y10 R-10 E3",                                               # the 270 degrees arc around (0, 0)
+             "G2 X0 Y10 I0 J-5 E4",                                             # a full circle around (0, 5)
+             "G3 X0 Y10 Z1.2 I0 J-5 E5",                                        # a helix: one turn up 1 mm
+             "G2 X0 Y10 R5 E6"]                                                 # no center: drawn as a straight move
+
+    def check_arcs(self, withNumpy):
+        extruder = parse_extruder(self.lines, withNumpy)
+        arcs = [cmd for cmd in extruder.standardGcode if cmd.command in ("G2", "G3")]
+        self.assertEqual(extruder.invalidArcs, [arcs[-1].name])
+        self.assertEqual(len(arcs[-1].arcPoints), 0)
+
+        for cmd, (centerX, centerY, radius, sweep) in zip(arcs, ((0, 0, 10, 90), (0, 0, 10, -90), (0, 0, 10, -270),
+                                                                 (0, 5, 5, -360), (0, 5, 5, 360))):
+            points = arc_points(cmd)
+            self.assertGreater(len(points), 10)
+            angles = []
+            for x, y, z in points:
+                self.assertAlmostEqual(math.hypot(x - centerX, y - centerY), radius)
+                angles.append(math.atan2(y - centerY, x - centerX))
+            steps = [(angle - lastAngle + math.pi) % (2.0 * math.pi) - math.pi
+                     for lastAngle, angle in zip(angles, angles[1:])]
+            self.assertTrue(all(step * sweep > 0.0 for step in steps))          # (the direction of the arc)
+            # (the points between the start and end point: the sweep minus one segment at each end)
+            self.assertAlmostEqual(math.degrees(abs(sum(steps)) + 2.0 * abs(steps[0])), abs(sweep))
+            # the chord error of every segment is within the tolerance
+            self.assertLessEqual(radius * (1.0 - math.cos(abs(steps[0]) / 2.0)), extruder.arcTolerance + 1e-12)
+
+        heights = [z for x, y, z in arc_points(arcs[4])]
+        self.assertEqual(heights, sorted(heights))
+        self.assertAlmostEqual(heights[len(heights) // 2], 0.7, places=1)
+        self.assertTrue(all(z == 0.2 for cmd in arcs[:4] for x, y, z in arc_points(cmd)))
+        return arcs
+
+    def test_python(self):
+        self.check_arcs(False)
+
+    @unittest.skipIf(Gcode_parser.numpy is None, "numpy is not installed")
+    def test_numpy_is_the_same(self):
+        for cmd, expected in zip(self.check_arcs(True), self.check_arcs(False)):
+            self.assertEqual(len(cmd.arcPoints), len(expected.arcPoints))
+            for value, expectedValue in zip(cmd.arcPoints, expected.arcPoints):
+                self.assertAlmostEqual(value, expectedValue, places=9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Tests for the batch processing of 'Gcode_parser.main'.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_parser
+
+
+class BaseNameTest(unittest.TestCase):
+
+    def test_gcode_base_name(self):
+        self.assertEqual(Gcode_parser.gcode_base_name("models/cube.gcode.gz"), "cube")
+        self.assertEqual(Gcode_parser.gcode_base_name("models/cube.gcode.gz", keepCompression=True), "cube.gz")
+        self.assertEqual(Gcode_parser.gcode_base_name("cube.g"), "cube")
+
+    def test_unique_base_names(self):
+        gcodeFiles = ["a/t.gcode", "a/t.gcode.gz", "b/t.gcode", "c/T.GCODE.XZ", "cube.gcode"]
+        self.assertEqual(Gcode_parser.unique_base_names(gcodeFiles), ["t", "t.gz", "t_2", "T.XZ", "cube"])
+
+    def test_cache_files_do_not_collide(self):
+        lines = "G21\nG90\nG92 E0\nG1 X0 Y0 Z0.2 F1200\nG1 X10 Y0 E1\n"
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "t.gcode"), mode="w") as gcodeFile:
+                gcodeFile.write(lines)
+            with gzip.open(os.path.join(directory, "t.gcode.gz"), mode="wt") as gcodeFile:
+                gcodeFile.write(lines)
+            cacheDir = os.path.join(directory, "cache")
+            result = Gcode_parser.main([directory, "--jobs", "1", "--quiet", "--cache", cacheDir,
+                                        "--output", os.path.join(directory, "summaries.jsonl")])
+            self.assertEqual(result, 0)
+            self.assertEqual(sorted(os.listdir(cacheDir)), ["t.gctp", "t.gz.gctp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
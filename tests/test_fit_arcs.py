@@ -0,0 +1,92 @@
+"""Regression tests for 'Gcode_parser.fit_arcs'.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import math
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_parser
+
+
+def parse_lines(lines):
+    """Returns the standardized Gcode of a list of gcode lines"""
+    extruder = Gcode_parser.Extruder()
+    for lineCount in extruder.iter_convert_lines(lines):
+        pass
+    return extruder.standardGcode
+
+
+def path_points(standardGcode):
+    """Returns the (x, y) points of the moves, with the arc points expanded"""
+    points = []
+    for cmd in standardGcode:
+        if cmd.command in ("G1", "G2", "G3"):
+            if cmd.arcPoints is not None:
+                points.extend(zip(cmd.arcPoints[0::3], cmd.arcPoints[1::3]))
+            points.append((cmd.X, cmd.Y))
+    return points
+
+
+def distance_to_path(point, path):
+    """Returns the distance of a point to a polyline"""
+    best = float("inf")
+    for (ax, ay), (bx, by) in zip(path, path[1:]):
+        dx, dy = bx - ax, by - ay
+        lengthSquared = dx * dx + dy * dy
+        t = 0.0 if lengthSquared == 0.0 else max(0.0, min(1.0, ((point[0] - ax) * dx + (point[1] - ay) * dy) / lengthSquared))
+        best = min(best, math.hypot(point[0] - ax - t * dx, point[1] - ay - t * dy))
+    return best
+
+
+def path_length(path):
+    return sum(math.hypot(bx - ax, by - ay) for (ax, ay), (bx, by) in zip(path, path[1:]))
+
+
+class FitArcsTest(unittest.TestCase):
+
+    def loop_gcode(self, degrees, radius=8.0, stepDegrees=5.0):
+        """A loop of G1 moves around (15, 20), extruded at a constant rate"""
+        lines = ["G21", "G90", "G1 X{0:.3f} Y20.000 Z0.200 E0.00000 F1200".format(15.0 + radius)]
+        eValue = 0.0
+        stepLength = 2.0 * radius * math.sin(math.radians(stepDegrees) / 2.0)
+        for stepNr in range(1, int(degrees / stepDegrees) + 1):
+            angle = math.radians(stepNr * stepDegrees)
+            eValue += 0.05 * stepLength
+            lines.append("G1 X{0:.3f} Y{1:.3f} E{2:.5f}".format(15.0 + radius * math.cos(angle), 
+                                                               20.0 + radius * math.sin(angle), eValue))
+        return lines
+
+    def round_trip(self, lines, tolerance=0.01):
+        original = parse_lines(lines)
+        fitted = Gcode_parser.fit_arcs(original, tolerance)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "fitted.gcode")
+            Gcode_parser.write_gcode(fitted, filename)
+            with open(filename) as gcodeFile:
+                reparsed = parse_lines([line.rstrip() for line in gcodeFile])
+        return original, fitted, reparsed
+
+    def test_loop_longer_than_a_circle(self):
+        original, fitted, reparsed = self.round_trip(self.loop_gcode(435.0))
+        self.assertTrue(any(cmd.command in ("G2", "G3") for cmd in fitted))
+        originalPath, reparsedPath = path_points(original), path_points(reparsed)
+        for point in originalPath:
+            self.assertLess(distance_to_path(point, reparsedPath), 0.02)
+        self.assertAlmostEqual(path_length(reparsedPath), path_length(originalPath), delta=0.05)
+        self.assertAlmostEqual(reparsed[-1].E, original[-1].E, places=4)
+
+    def test_exact_full_circle(self):
+        original, fitted, reparsed = self.round_trip(self.loop_gcode(360.0))
+        originalPath, reparsedPath = path_points(original), path_points(reparsed)
+        for point in originalPath:
+            self.assertLess(distance_to_path(point, reparsedPath), 0.02)
+        self.assertAlmostEqual(path_length(reparsedPath), path_length(originalPath), delta=0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Tests for the flow colors of 'Gcode_analysis.split_splines_by_flow'.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_analysis
+import Gcode_parser
+
+
+def parse_lines(lines):
+    """Returns the standardized Gcode of a list of gcode lines"""
+    extruder = Gcode_parser.Extruder()
+    for lineCount in extruder.iter_convert_lines(lines):
+        pass
+    return extruder.standardGcode
+
+
+def flow_lines(layers=3):
+    """Squares with a fast first side, and a side that is only too fast without the axis limits"""
+    lines = ["G21", "G90", "M82", "G92 E0"]
+    eValue = 0.0
+    for layerNr in range(layers):
+        lines.append("G0 X0 Y0 Z{0:.1f} F6000".format(0.2 * (layerNr + 1)))
+        for x, y, extrusion, feedrate in ((10, 0, 1.0, 6000),                  # 24 mm3/s: too fast
+                                          (10, 10, 0.15, 60000),               # 10.8 mm3/s at 300 mm/s, the limit of X/Y
+                                          (0, 10, 0.5, 1200), (0, 0, 0.5, 1200)):
+            eValue += extrusion
+            lines.append("G1 X{0} Y{1} E{2:.2f} F{3}".format(x, y, eValue, feedrate))
+    return lines
+
+
+class FlowColorTest(unittest.TestCase):
+
+    def test_colors_agree_with_hotspots(self):
+        maxFlow = 15.0
+        standardGcode = parse_lines(flow_lines())
+        report = Gcode_analysis.find_flow_hotspots(standardGcode, maxFlow)
+        hotLines = sorted(lineNr for layerKey, lineNr, flow in report["hotspots"])
+        self.assertEqual(len(hotLines), 3)                                      # (the first move of every layer)
+
+        coloredLines = []
+        for zValue, commands in Gcode_parser.iter_sort_layers(standardGcode):
+            splines, bins = Gcode_analysis.split_splines_by_flow(commands, maxFlow)
+            for spline, flowBin in zip(splines, bins):
+                if flowBin == Gcode_analysis.flowBinCount:
+                    coloredLines.extend(int(cmd.name) for cmd in spline[1:])
+        self.assertEqual(sorted(coloredLines), hotLines)
+
+    def test_bins_of_a_layer(self):
+        standardGcode = parse_lines(flow_lines(1))
+        commands = list(Gcode_parser.iter_sort_layers(standardGcode))[-1][1]
+        splines, bins = Gcode_analysis.split_splines_by_flow(commands, 15.0)
+        self.assertEqual(bins, [Gcode_analysis.flowBinCount, 5, 1])
+        self.assertEqual([len(spline) for spline in splines], [2, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
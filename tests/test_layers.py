@@ -0,0 +1,59 @@
+"""Tests for 'Gcode_parser.Machine.iter_add_extruder_layers'.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_parser
+
+
+def layer_lines(layers=20):
+    """Squares on top of each other"""
+    lines = ["G21", "G90", "M82", "G92 E0"]
+    eValue = 0.0
+    for layerNr in range(layers):
+        z = 0.2 * (layerNr + 1)
+        lines.append("G0 X0 Y0 Z{0:.1f} F6000".format(z))
+        for x, y in ((10, 0), (10, 10), (0, 10), (0, 0)):
+            eValue += 0.5
+            lines.append("G1 X{0} Y{1} E{2:.2f} F1200".format(x, y, eValue))
+    return lines
+
+
+class LayerStreamTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.gcodeFile = tempfile.mkstemp(suffix=".gcode")
+        with os.fdopen(handle, "w") as gcodeFile:
+            gcodeFile.write("\n".join(layer_lines()) + "\n")
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.gcodeFile)
+
+    def stream(self, keepCommands):
+        machine = Gcode_parser.Machine()
+        layers = []
+        for progress, finished in machine.iter_add_extruder_layers(self.gcodeFile, chunkSize=7, 
+                                                                   keepCommands=keepCommands):
+            layers.extend((geometry.name, list(geometry.coordinates)) for geometry in finished)
+        return machine.extruders[-1], layers
+
+    def test_drop_commands(self):
+        keptExtruder, keptLayers = self.stream(True)
+        droppedExtruder, droppedLayers = self.stream(False)
+        self.assertEqual(len(keptLayers), 20)
+        self.assertEqual(droppedLayers, keptLayers)
+        self.assertEqual(len(keptExtruder.standardGcode), len(layer_lines()))
+        self.assertEqual(droppedExtruder.standardGcode, [])
+        self.assertEqual(droppedExtruder.rawGcode, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
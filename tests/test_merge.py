@@ -0,0 +1,131 @@
+"""Tests for 'Gcode_parser.Machine.merge_extruders'.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import copy
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_parser
+
+
+def square_lines(x0, layers=3):
+    """A single-tool file that selects T0, with a retraction at the end of every layer"""
+    lines = ["G21", "G90", "M82", "T0", "G92 E0"]
+    eValue = 0.0
+    for layerNr in range(layers):
+        z = 0.2 * (layerNr + 1)
+        lines.append("G0 X{0} Y0 Z{1:.1f} F6000".format(x0, z))
+        lines.append("G1 E{0:.2f} F2400".format(eValue))
+        for x, y in ((x0 + 10, 0), (x0 + 10, 10), (x0, 10), (x0, 0)):
+            eValue += 0.5
+            lines.append("G1 X{0} Y{1} E{2:.2f} F1200".format(x, y, eValue))
+        lines.append("G1 E{0:.2f} F2400".format(eValue - 1.0))
+    return lines
+
+
+def add_extruder(machine, lines, name):
+    extruder = Gcode_parser.Extruder(name)
+    for lineCount in extruder.iter_convert_lines(lines):
+        pass
+    machine.extruders.append(extruder)
+    return extruder
+
+
+class MergeExtrudersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = Gcode_parser.Machine()
+        self.first = add_extruder(self.machine, square_lines(0), "first")
+        self.second = add_extruder(self.machine, square_lines(50), "second")
+
+    def test_tool_commands(self):
+        merged = self.machine.merge_extruders([self.first, self.second]).standardGcode
+        tools = [cmd.command for cmd in merged if cmd.command.startswith("T")]
+        # the initialization, three layers and the end code: one tool change per tool each
+        self.assertEqual(tools, ["T0", "T1"] * 5)
+        # every command after a tool change belongs to that tool, up to the next tool change
+        currentTool = None
+        for cmd in merged:
+            if cmd.command.startswith("T"):
+                currentTool = int(cmd.command[1:])
+            elif currentTool is not None:
+                self.assertEqual(cmd.T, currentTool)
+
+    def test_inputs_are_not_changed(self):
+        self.machine.merge_extruders([self.first, self.second])
+        self.assertEqual(set(cmd.T for cmd in self.second.standardGcode), set([0]))
+        self.assertEqual(sum(cmd.command == "T0" for cmd in self.second.standardGcode), 1)
+
+    def test_E_continues(self):
+        merged = self.machine.merge_extruders([self.first, self.second]).standardGcode
+        lastE = dict()
+        for cmd in merged:
+            if cmd.command == "G92" and "continue E" in cmd.parameters.get("comment", ""):
+                self.assertAlmostEqual(cmd.E, lastE.get(cmd.T, 0.0))            # the E of the tool where it stopped
+            if cmd.E is not None and not cmd.command.startswith("T"):
+                lastE[cmd.T] = cmd.E
+        # the extruded moves of each tool have the E values of its own file
+        for toolNr, extruder in enumerate((self.first, self.second)):
+            original = [cmd.E for cmd in extruder.standardGcode if cmd.command == "G1"]
+            fromMerge = [cmd.E for cmd in merged if cmd.command == "G1" and cmd.T == toolNr]
+            self.assertEqual(fromMerge, original)
+
+
+def islands_lines(x0, layers=2):
+    """A single-tool file with four islands per layer, printed in a zigzag order"""
+    lines = ["G21", "G90", "M82", "G92 E0"]
+    eValue = 0.0
+    for layerNr in range(layers):
+        z = 0.2 * (layerNr + 1)
+        for islandX in (0, 60, 10, 70):
+            lines.append("G0 X{0} Y0 Z{1:.1f} F6000".format(x0 + islandX, z))
+            for x, y in ((islandX + 5, 0), (islandX + 5, 5), (islandX, 5)):
+                eValue += 0.25
+                lines.append("G1 X{0} Y{1} E{2:.2f} F1200".format(x0 + x, y, eValue))
+    return lines
+
+
+def extruded_segments(standardGcode, toolNr):
+    """Returns the sorted (x0, y0, x1, y1, extrusion) of the extruding moves of a tool"""
+    segments = []
+    lastCmd = None
+    for cmd in standardGcode:
+        if cmd.T != toolNr or cmd.command.startswith("T"):
+            continue
+        if lastCmd is not None and cmd.command in ("G0", "G1") and cmd.E > lastCmd.E:
+            segments.append((lastCmd.X, lastCmd.Y, cmd.X, cmd.Y, round(cmd.E - lastCmd.E, 6)))
+        lastCmd = cmd
+    return sorted(segments)
+
+
+class OptimizedMergeTest(unittest.TestCase):
+
+    def merge(self, optimize):
+        machine = Gcode_parser.Machine()
+        extruders = [add_extruder(machine, islands_lines(0), "first"), 
+                     add_extruder(machine, islands_lines(200), "second")]
+        return extruders, machine.merge_extruders(extruders, optimize=optimize).standardGcode
+
+    def test_fewer_tool_changes(self):
+        extruders, plain = self.merge(False)
+        extruders, optimized = self.merge(True)
+        toolChanges = lambda merged: sum(cmd.command.startswith("T") for cmd in merged)
+        self.assertLess(toolChanges(optimized), toolChanges(plain))
+
+    def test_same_extrusion_per_tool(self):
+        extruders, optimized = self.merge(True)
+        self.assertTrue(any("comment" in cmd.parameters and cmd.command == "G92" and "continue E" not in 
+                            cmd.parameters["comment"] for cmd in optimized))         # (the islands are reordered)
+        for toolNr, extruder in enumerate(extruders):
+            original = [copy.copy(cmd) for cmd in extruder.standardGcode]
+            for cmd in original:
+                cmd.T = toolNr
+            self.assertEqual(extruded_segments(optimized, toolNr), extruded_segments(original, toolNr))
+
+
+if __name__ == "__main__":
+    unittest.main()
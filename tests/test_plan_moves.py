@@ -0,0 +1,78 @@
+"""Tests for 'Gcode_analysis.plan_moves': planning in chunks gives the same times.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_analysis
+import Gcode_parser
+
+
+def parse_lines(lines):
+    """Returns the standardized Gcode of a list of gcode lines"""
+    extruder = Gcode_parser.Extruder()
+    for lineCount in extruder.iter_convert_lines(lines):
+        pass
+    return extruder.standardGcode
+
+
+def print_lines():
+    """A spiral of short moves, with travel moves, retractions and dwells in between"""
+    lines = ["G21", "G90", "G92 E0", "G1 X100 Y100 Z0.2 F1200"]
+    eValue = 0.0
+    for stepNr in range(1, 3000):
+        angle = stepNr * 0.07
+        radius = 5.0 + stepNr * 0.01
+        eValue += 0.02
+        lines.append("G1 X{0:.3f} Y{1:.3f} E{2:.4f} F{3}".format(100.0 + radius * math.cos(angle),
+                                                                100.0 + radius * math.sin(angle), eValue,
+                                                                (1800, 3000, 600)[stepNr % 3]))
+        if stepNr % 400 == 0:
+            lines.extend(["G1 E{0:.4f} F2400".format(eValue - 1.0), "G0 X20 Y20 F9000",
+                          "G4 P100", "G1 E{0:.4f} F2400".format(eValue)])
+    return lines
+
+
+def plan(columns, settings, chunkSize, withNumpy):
+    installedNumpy = Gcode_analysis.numpy
+    if not withNumpy:
+        Gcode_analysis.numpy = None
+    try:
+        return Gcode_analysis.plan_moves(columns, settings, chunkSize)
+    finally:
+        Gcode_analysis.numpy = installedNumpy
+
+
+class PlanMovesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.columns = Gcode_analysis.get_move_columns(parse_lines(print_lines()))
+
+    def check_chunks(self, settings):
+        whole = plan(self.columns, settings, len(self.columns["dX"]), False)
+        self.assertEqual(len(whole), len(self.columns["dX"]))
+        for chunkSize in (5, 64, 1000):
+            self.assertEqual(list(plan(self.columns, settings, chunkSize, False)), list(whole))
+        if Gcode_analysis.numpy is not None:
+            for chunkSize in (5, 64, 1000, 50000):
+                for seconds, expected in zip(plan(self.columns, settings, chunkSize, True), whole):
+                    self.assertAlmostEqual(seconds, expected, delta=1e-9 * max(expected, 1.0))
+
+    def test_junction_deviation(self):
+        self.check_chunks(None)
+
+    def test_jerk(self):
+        self.check_chunks({"jerk": (10.0, 10.0, 0.4, 5.0)})
+
+    def test_no_moves(self):
+        self.assertEqual(len(Gcode_analysis.plan_moves(Gcode_analysis.get_move_columns([]))), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
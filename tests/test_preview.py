@@ -0,0 +1,56 @@
+"""Tests for 'Gcode_preview.draw_lines': numpy draws the same pixels as Bresenham's algorithm.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import os
+import random
+import sys
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_preview
+
+
+def random_lines(count, seed=49):
+    """Lines in all directions, partly outside of the image, with points and axis-parallel lines"""
+    generator = random.Random(seed)
+    lines = array('d')
+    for lineNr in range(count):
+        x0, y0 = generator.uniform(-10.0, 60.0), generator.uniform(-10.0, 60.0)
+        x1, y1 = generator.uniform(-10.0, 60.0), generator.uniform(-10.0, 60.0)
+        if lineNr % 5 == 0:
+            x1 = x0
+        elif lineNr % 5 == 1:
+            y1 = y0
+        elif lineNr % 7 == 0:
+            x1, y1 = x0, y0
+        lines.extend((x0, y0, x1, y1))
+    return lines
+
+
+class DrawLinesTest(unittest.TestCase):
+
+    @unittest.skipIf(Gcode_preview.numpy is None, "numpy is not installed")
+    def test_numpy_matches_bresenham(self):
+        lines = random_lines(500)
+        arguments = (97, 83, lines, -1.5, -2.5, 1.7, 0)
+        expected = bytearray(b"\xff" * (97 * 83))
+        Gcode_preview.draw_lines(expected, *arguments)
+        self.assertGreater(expected.count(0), 1000)
+        for blockSize in (10000, 7):
+            pixels = bytearray(b"\xff" * (97 * 83))
+            Gcode_preview.draw_lines_numpy(pixels, *arguments, blockSize=blockSize)
+            self.assertEqual(pixels, expected)
+
+    def test_line_ends(self):
+        pixels = bytearray(b"\xff" * 100)
+        Gcode_preview.draw_lines(pixels, 10, 10, array('d', [0.5, 0.5, 9.5, 3.5]), 0.0, 0.0, 1.0, 0)
+        self.assertEqual(pixels[9 * 10 + 0], 0)                                 # (0, 0): the bottom left pixel
+        self.assertEqual(pixels[6 * 10 + 9], 0)                                 # (9, 3)
+        self.assertEqual(pixels.count(0), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Tests for 'Gcode_parser.LayerGeometry.simplify': the numpy path keeps the same points as 'simplify_spline'.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import math
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_parser
+
+
+def circle_lines(circles=6, pointCount=200):
+    """Noisy circles; the extrusion stops halfway every circle, and the second half is a separate spline"""
+    generator = random.Random(3)
+    lines = ["G21", "G90", "G92 E0"]
+    eValue = 0.0
+    for circleNr in range(circles):
+        centerX, radius = 30.0 * circleNr, 5.0 + circleNr
+        lines.append("G0 X{0:.3f} Y0 Z0.2 F6000".format(centerX + radius))
+        for pointNr in range(1, pointCount + 1):
+            angle = 2.0 * math.pi * pointNr / pointCount
+            noisyRadius = radius + generator.uniform(-0.02, 0.02)
+            if pointNr != pointCount // 2:
+                eValue += 0.01
+            lines.append("G1 X{0:.3f} Y{1:.3f} E{2:.4f} F1800".format(centerX + noisyRadius * math.cos(angle),
+                                                                      noisyRadius * math.sin(angle), eValue))
+    return lines
+
+
+def layer_geometry():
+    extruder = Gcode_parser.Extruder()
+    for lineCount in extruder.iter_convert_lines(circle_lines()):
+        pass
+    commands = list(Gcode_parser.iter_sort_layers(extruder.standardGcode))[-1][1]
+    return Gcode_parser.LayerGeometry.from_commands("0.2", commands)
+
+
+def simplify(geometry, tolerance, withNumpy):
+    installedNumpy = Gcode_parser.numpy
+    if not withNumpy:
+        Gcode_parser.numpy = None
+    try:
+        removed = geometry.simplify(tolerance)
+    finally:
+        Gcode_parser.numpy = installedNumpy
+    return removed
+
+
+class SimplifyTest(unittest.TestCase):
+
+    def test_boundaries_are_kept(self):
+        for withNumpy in (False, True) if Gcode_parser.numpy is not None else (False,):
+            geometry = layer_geometry()
+            original = list(geometry.iter_splines())
+            self.assertEqual(len(original), 12)                                 # (two splines per circle)
+            self.assertGreater(simplify(geometry, 0.05, withNumpy), 0)
+            simplified = list(geometry.iter_splines())
+            self.assertEqual(len(simplified), len(original))
+            for spline, originalSpline in zip(simplified, original):
+                self.assertEqual(spline[:3], originalSpline[:3])                # the start of the extrusion
+                self.assertEqual(spline[-3:], originalSpline[-3:])              # the end of the extrusion
+                self.assertLess(len(spline), len(originalSpline))
+
+    @unittest.skipIf(Gcode_parser.numpy is None, "numpy is not installed")
+    def test_numpy_is_the_same(self):
+        generator = random.Random(7)
+        geometry = Gcode_parser.LayerGeometry("random")
+        for splineNr in range(30):
+            pointCount = generator.choice((1, 2, 3, 5, 50, 300))
+            points = [(generator.uniform(0, 10), generator.uniform(0, 10), 0.2) for pointNr in range(pointCount)]
+            if splineNr % 5 == 0:
+                points.append(points[0])                                        # a closed loop
+            geometry.add_spline(points)
+        for tolerance in (0.0, 0.01, 0.5, 3.0):
+            expected = Gcode_parser.LayerGeometry("random")
+            expected.extend(geometry)
+            result = Gcode_parser.LayerGeometry("random")
+            result.extend(geometry)
+            self.assertEqual(simplify(result, tolerance, True), simplify(expected, tolerance, False))
+            self.assertEqual(result.coordinates, expected.coordinates)
+            self.assertEqual(result.splineLengths, expected.splineLengths)
+
+
+if __name__ == "__main__":
+    unittest.main()
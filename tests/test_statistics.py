@@ -0,0 +1,105 @@
+"""Tests for 'Gcode_analysis.compute_statistics' and 'Gcode_parser.Extruder.get_statistics'.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_analysis
+import Gcode_parser
+
+
+def parse_extruder(lines):
+    """Returns an extruder with the standardized Gcode of a list of gcode lines"""
+    extruder = Gcode_parser.Extruder()
+    for lineCount in extruder.iter_convert_lines(lines):
+        pass
+    return extruder
+
+
+def square_lines(layers=2):
+    """A 10 x 10 mm square per layer, with a retraction and a travel move between the layers"""
+    lines = ["G21", "G90", "M82", "G92 E0", "G0 X0 Y0 Z0.2 F6000"]
+    eValue = 0.0
+    for layerNr in range(layers):
+        if layerNr > 0:
+            lines.extend(["G1 E{0:.2f} F2400".format(eValue - 1.0),
+                          "G0 X0 Y0 Z{0:.1f} F6000".format(0.2 * (layerNr + 1)),
+                          "G1 E{0:.2f} F2400".format(eValue)])
+        for x, y in ((10, 0), (10, 10), (0, 10), (0, 0)):
+            eValue += 0.5
+            lines.append("G1 X{0} Y{1} E{2:.2f} F1200".format(x, y, eValue))
+    lines.append("G0 X20 Y20 F6000")
+    return lines
+
+
+def statistics(standardGcode, withNumpy):
+    installedNumpy = Gcode_analysis.numpy
+    if not withNumpy:
+        Gcode_analysis.numpy = None
+    try:
+        return Gcode_analysis.compute_statistics(standardGcode)
+    finally:
+        Gcode_analysis.numpy = installedNumpy
+
+
+class StatisticsTest(unittest.TestCase):
+
+    def test_numbers(self):
+        total = statistics(parse_extruder(square_lines()).standardGcode, False)["total"]
+        self.assertAlmostEqual(total["filamentLength"], 4.0)
+        self.assertAlmostEqual(total["extrusionDistance"], 80.0)
+        self.assertAlmostEqual(total["travelDistance"], 0.2 + 0.2 + 20.0 * 2 ** 0.5)    # (to the first layer, the next one, and away)
+        self.assertEqual(total["retractions"], 1)
+        self.assertEqual(total["boundingBox"], [0.0, 0.0, 0.2, 10.0, 10.0, 0.4])
+        self.assertGreater(total["time"], 80.0 / 20.0)
+
+    def test_numpy_is_the_same(self):
+        if Gcode_analysis.numpy is None:
+            self.skipTest("numpy is not installed")
+        standardGcode = parse_extruder(square_lines(5)).standardGcode
+        expected = statistics(standardGcode, False)
+        result = statistics(standardGcode, True)
+        self.assertEqual(sorted(result["layers"]), sorted(expected["layers"]))
+        self.check_same(result["total"], expected["total"])
+        for key in expected["layers"]:
+            self.check_same(result["layers"][key], expected["layers"][key])
+        for key in expected["tools"]:
+            self.check_same(result["tools"][key], expected["tools"][key])
+
+    def check_same(self, result, expected):
+        self.assertEqual(sorted(result), sorted(expected))
+        for name, value in expected.items():
+            if name == "boundingBox":
+                self.assertEqual(result[name], value)
+            else:
+                self.assertAlmostEqual(result[name], value, delta=1e-9 * max(abs(value), 1.0))
+
+    def test_chunked_columns(self):
+        standardGcode = parse_extruder(square_lines(5)).standardGcode
+        expected = Gcode_analysis.get_move_columns(standardGcode)
+        for chunkSize in (1, 7, 1000):
+            columns = Gcode_analysis.new_move_columns()
+            counts = list(Gcode_analysis.iter_move_columns(standardGcode, columns, chunkSize))
+            self.assertEqual(counts[-1], len(standardGcode))
+            self.assertEqual(columns, expected)
+        self.assertEqual(Gcode_analysis.compute_statistics(None, columns = expected),
+                         Gcode_analysis.compute_statistics(standardGcode))
+
+    def test_cache_reset_by_transform(self):
+        extruder = parse_extruder(square_lines())
+        first = extruder.get_statistics()
+        self.assertIs(extruder.get_statistics(), first)
+        extruder.translate(5.0, -2.0)
+        moved = extruder.get_statistics()
+        self.assertIsNot(moved, first)
+        self.assertEqual(moved["total"]["boundingBox"], [5.0, -2.0, 0.2, 15.0, 8.0, 0.4])
+        extruder.reset_transform()
+        self.assertEqual(extruder.get_statistics()["total"]["boundingBox"], first["total"]["boundingBox"])
+
+
+if __name__ == "__main__":
+    unittest.main()
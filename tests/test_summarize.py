@@ -0,0 +1,40 @@
+"""Tests for 'Gcode_parser.summarize_gcode'.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_analysis
+import Gcode_parser
+
+
+def parse_lines(lines):
+    """Returns the standardized Gcode of a list of gcode lines"""
+    extruder = Gcode_parser.Extruder()
+    for lineCount in extruder.iter_convert_lines(lines):
+        pass
+    return extruder.standardGcode
+
+
+class SummarizeGcodeTest(unittest.TestCase):
+
+    # two G92 segments, each with a retraction (-5 and -24.75) and the unretraction after it
+    lines = ["G21", "G90", "G92 E0", "G1 X0 Y0 Z0.2 F1200",
+             "G1 X10 Y0 E10", "G1 E5 F2400", "G1 X20 Y0 F3000", "G1 E10 F2400", "G1 X30 Y0 E25.5",
+             "G92 E0",
+             "G1 X40 Y0 E14.75", "G1 E-10 F2400", "G1 X50 Y0", "G1 E14.75", "G1 X60 Y0 E24.5"]
+
+    def test_extrusion_length_is_net(self):
+        standardGcode = parse_lines(self.lines)
+        summary = Gcode_parser.summarize_gcode(standardGcode)
+        self.assertAlmostEqual(summary["extrusionLength"], 25.5 + 24.5)
+        statistics = Gcode_analysis.compute_statistics(standardGcode)
+        self.assertAlmostEqual(summary["extrusionLength"], statistics["total"]["filamentLength"], places=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Round-trip tests for the binary toolpath format ('Extruder.save_toolpath' and 'load_toolpath').
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_parser
+
+
+def parse_lines(lines):
+    """Returns an extruder with the standardized Gcode of a list of gcode lines"""
+    extruder = Gcode_parser.Extruder()
+    for lineCount in extruder.iter_convert_lines(lines):
+        pass
+    return extruder
+
+
+class ToolpathRoundTripTest(unittest.TestCase):
+
+    lines = ["G21", "G90", "M82", "G92 E0",
+             "G1 X10.000 Y10.000 Z0.200 E0.00000 F1200 ; start",
+             "G1 X20.000 Y10.000 E0.50000",
+             "M900 K0.05",                                                      # an unknown command
+             "G2 X20.000 Y20.000 I0.000 J5.000 E1.00000",
+             "; a comment line"]
+
+    def round_trip(self, extruder):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "test.gctp")
+            extruder.save_toolpath(filename, withStatistics=False)
+            loaded = Gcode_parser.Extruder()
+            loaded.load_toolpath(filename)
+        return loaded.standardGcode
+
+    def test_names_and_parameters(self):
+        extruder = parse_lines(self.lines)
+        extruder.standardGcode[1].name = "a_12"                                 # like the names of merged commands
+        extruder.standardGcode[2].name = "14"
+        loaded = self.round_trip(extruder)
+
+        self.assertEqual(len(loaded), len(extruder.standardGcode))
+        for original, cmd in zip(extruder.standardGcode, loaded):
+            self.assertEqual(cmd.name, original.name)
+            self.assertIs(type(cmd.name), type(original.name))
+            self.assertEqual(cmd.command, original.command)
+            self.assertEqual(cmd.parameters, original.parameters)
+            for axis in ("X", "Y", "Z", "E", "F"):
+                self.assertEqual(getattr(cmd, axis), getattr(original, axis))
+            self.assertEqual(cmd.arcPoints is None, original.arcPoints is None)
+
+        unknown = [cmd for cmd in loaded if cmd.command == "unknown"]
+        self.assertEqual(len(unknown), 1)
+        self.assertEqual(unknown[0].parameters["comment"], ["M900", "K0.05"])
+
+
+if __name__ == "__main__":
+    unittest.main()
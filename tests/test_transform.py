@@ -0,0 +1,93 @@
+"""Tests for the transforms of 'Gcode_parser.Extruder' (translate, rotate, scale, mirror).
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_parser
+
+
+# a quarter circle (I/J), a half circle (R) and a full circle (I/J), with a straight move after them
+arcLines = ["G21", "G90", "G92 E0", "G1 X10 Y0 Z0.2 F3000",
+            "G3 X0 Y10 I-10 J0 E3 F1200", "G2 X10 Y0 R10 E5", "G2 X10 Y0 I-5 J0 E8", "G1 X20 Y0 E9"]
+
+
+def parse_extruder(lines):
+    """Returns an extruder with the standardized Gcode of a list of gcode lines"""
+    extruder = Gcode_parser.Extruder()
+    for lineCount in extruder.iter_convert_lines(lines):
+        pass
+    return extruder
+
+
+def export_and_parse(extruder):
+    """Returns the commands of the exported text of an extruder, parsed again"""
+    outFile = io.StringIO()
+    extruder.export_standardGcode(outFile)
+    return parse_extruder(outFile.getvalue().splitlines()).standardGcode
+
+
+def move_points(standardGcode):
+    """Returns the (x, y, z) points the moves go through, including the tessellated arc points"""
+    points = []
+    for cmd in standardGcode:
+        if cmd.command in ("G0", "G1", "G2", "G3") and cmd.X is not None:
+            arcPoints = cmd.arcPoints or ()
+            points.extend(tuple(arcPoints[index:index + 3]) for index in range(0, len(arcPoints), 3))
+            points.append((cmd.X, cmd.Y, cmd.Z))
+    return points
+
+
+class TransformTest(unittest.TestCase):
+
+    def assertPointsAlmostEqual(self, points, expected, places=3):
+        self.assertEqual(len(points), len(expected))
+        for point, expectedPoint in zip(points, expected):
+            for value, expectedValue in zip(point, expectedPoint):
+                self.assertAlmostEqual(value, expectedValue, places=places)
+
+    def test_compose(self):
+        extruder = parse_extruder(["G21", "G90", "G1 X10 Y0 Z0.2 F1200"])
+        extruder.translate(5.0, 0.0)
+        extruder.rotate(90.0)
+        cmd = list(extruder.get_transformed_gcode())[-1]
+        self.assertAlmostEqual(cmd.X, 0.0)
+        self.assertAlmostEqual(cmd.Y, 15.0)
+        self.assertEqual(extruder.standardGcode[-1].X, 10.0)                   # (the original is kept)
+
+    def test_reset(self):
+        extruder = parse_extruder(arcLines)
+        extruder.mirror("Y", 3.0)
+        extruder.reset_transform()
+        self.assertEqual(extruder.transform, Gcode_parser.identityTransform)
+        self.assertEqual(list(extruder.get_transformed_gcode()), extruder.standardGcode)
+
+    def test_mirror_swaps_arcs(self):
+        extruder = parse_extruder(arcLines)
+        extruder.mirror("X")
+        transformed = list(extruder.get_transformed_gcode())
+        arcCommands = [cmd.command for cmd in transformed if cmd.command in ("G2", "G3")]
+        self.assertEqual(arcCommands, ["G2", "G3", "G3"])
+        self.assertAlmostEqual(transformed[4].parameters["I"], 10.0)
+        self.assertPointsAlmostEqual(move_points(export_and_parse(extruder)), move_points(transformed))
+
+    def test_scale_exports_arcs_as_moves(self):
+        extruder = parse_extruder(arcLines)
+        extruder.scale(2.0, 1.0)
+        self.assertFalse(Gcode_parser.is_conformal(extruder.transform))
+        expected = [(2.0 * x, y, z) for x, y, z in move_points(extruder.standardGcode)]
+        exported = export_and_parse(extruder)
+        self.assertFalse([cmd for cmd in exported if cmd.command in ("G2", "G3")])
+        self.assertPointsAlmostEqual(move_points(exported), expected)
+        self.assertAlmostEqual(exported[-1].E, 9.0)
+        extrusions = [cmd.E for cmd in exported if cmd.E is not None]
+        self.assertEqual(extrusions, sorted(extrusions))                        # (the arcs divide their extrusion)
+
+
+if __name__ == "__main__":
+    unittest.main()
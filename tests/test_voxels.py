@@ -0,0 +1,73 @@
+"""Tests for 'Gcode_voxels': rasterization with and without numpy, and the streamed export.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import os
+import random
+import struct
+import sys
+import tempfile
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_voxels
+
+
+def square_lines(layers=3):
+    """Squares of 10 x 10 mm on top of each other, 0.2 mm apart"""
+    lines = ["G21", "G90", "M82", "G92 E0"]
+    eValue = 0.0
+    for layerNr in range(layers):
+        lines.append("G0 X0 Y0 Z{0:.1f} F6000".format(0.2 * (layerNr + 1)))
+        for x, y in ((10, 0), (10, 10), (0, 10), (0, 0)):
+            eValue += 0.4
+            lines.append("G1 X{0} Y{1} E{2:.2f} F1200".format(x, y, eValue))
+    return lines
+
+
+class RasterizeTest(unittest.TestCase):
+
+    @unittest.skipIf(Gcode_voxels.numpy is None, "numpy is not installed")
+    def test_numpy_matches_python(self):
+        generator = random.Random(48)
+        segments = array('d')
+        for segmentNr in range(300):
+            x0, y0 = generator.uniform(0.0, 20.0), generator.uniform(0.0, 20.0)
+            if segmentNr % 3 == 0:                                              # (horizontal, vertical and point segments)
+                x1, y1 = (x0 + generator.uniform(-5.0, 5.0), y0) if segmentNr % 2 else (x0, y0)
+            else:
+                x1, y1 = x0 + generator.uniform(-5.0, 5.0), y0 + generator.uniform(-5.0, 5.0)
+            segments.extend((x0, y0, x1, y1, generator.uniform(0.05, 0.5)))
+        arguments = (segments, -1.0, -2.0, 230, 240, 0.1)
+        python = Gcode_voxels.rasterize_layer(*arguments)
+        self.assertGreater(python.count(1), 0)
+        self.assertEqual(Gcode_voxels.rasterize_layer_numpy(*arguments), python)
+        self.assertEqual(Gcode_voxels.rasterize_layer_numpy(*arguments, blockSize=7), python)
+
+
+class ExportTest(unittest.TestCase):
+
+    def test_square_layers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            gcodeFile = os.path.join(directory, "square.gcode")
+            with open(gcodeFile, "w") as outFile:
+                outFile.write("\n".join(square_lines()) + "\n")
+            voxelFile = os.path.join(directory, "square.npy")
+            result = Gcode_voxels.export_voxels(gcodeFile, voxelFile, resolution=0.1, lineWidth=0.4)
+
+            self.assertEqual(result["shape"][0], 6)                             # 3 layers of 2 slices
+            self.assertEqual(sorted(result["layers"]), [0.2, 0.4, 0.6])
+            self.assertEqual(len(set(result["layers"].values())), 1)
+            self.assertEqual(result["origin"][2], 0.0)
+            for size in result["shape"][1:]:
+                self.assertTrue(103 <= size <= 105)                             # 10.4 mm, on the voxel lattice
+            with open(voxelFile, "rb") as inFile:
+                headerLength = struct.unpack("<H", inFile.read(10)[8:10])[0]
+                self.assertEqual(os.path.getsize(voxelFile) - 10 - headerLength, 
+                                 result["shape"][0] * result["shape"][1] * result["shape"][2])
+
+
+if __name__ == "__main__":
+    unittest.main()
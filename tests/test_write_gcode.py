@@ -0,0 +1,73 @@
+"""Tests for 'Gcode_parser.write_gcode': the runs of moves are written the same as command by command.
+
+Run from the top directory with: python3 -m unittest discover -s tests
+"""
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Gcode_parser
+
+
+formats = dict((parameter, "%.{0}f".format(places)) for parameter, places in Gcode_parser.exportDecimals.items())
+
+
+def serialize(standardGcode, **options):
+    """Returns the text that 'write_gcode' writes"""
+    outFile = io.StringIO()
+    Gcode_parser.write_gcode(standardGcode, outFile, **options)
+    return outFile.getvalue()
+
+
+def serialize_each(standardGcode):
+    """Returns the text of a list of Gcode instances, serialized one by one"""
+    return "".join(Gcode_parser.serialize_command(cmd, formats) + "\n" for cmd in standardGcode)
+
+
+class WriteGcodeTest(unittest.TestCase):
+
+    # halves, negative zero, rounding to a carry, and large values
+    values = [0.0, -0.0, -0.0001, 0.0005, 0.0015, 0.0025, 1.0005, 2.675, -2.675, 9.9995,
+              0.1 + 0.2, 99.99999, 12.5, -123456.78949, 1e9, 1e-300]
+
+    def moves(self):
+        standardGcode = []
+        for valueNr, value in enumerate(self.values * 3):
+            cmd = Gcode_parser.Gcode("G1")
+            cmd.command = "G0" if valueNr % 3 == 0 else "G1"
+            cmd.X, cmd.Y, cmd.Z, cmd.E, cmd.F = value, -value, value * 3.0, value / 7.0, abs(value) * 10.0
+            standardGcode.append(cmd)
+        return standardGcode
+
+    def test_moves(self):
+        standardGcode = self.moves()
+        self.assertEqual(serialize(standardGcode), serialize_each(standardGcode))
+        self.assertEqual(serialize(standardGcode[12:13]), "G0 X12.500 Y-12.500 Z37.500 E1.78571 F125.0\n")
+
+    def test_other_commands_in_between(self):
+        standardGcode = self.moves()
+        comment = Gcode_parser.Gcode("comment")
+        comment.command = "comment"
+        comment.parameters = {"comment": "layer 2 ✓"}
+        incomplete = Gcode_parser.Gcode("G1")
+        incomplete.command = "G1"
+        incomplete.X, incomplete.Y = 1.5, 2.5
+        standardGcode[3:3] = [comment, incomplete]
+        standardGcode.append(comment)
+        for blockSize in (4, 50000):
+            self.assertEqual(serialize(standardGcode, blockSize=blockSize), serialize_each(standardGcode))
+        self.assertEqual(serialize(standardGcode[3:4]), "(layer 2 ✓)\n")
+
+    def test_transform(self):
+        standardGcode = self.moves()
+        transform = (0.0, -1.0, 5.0, 1.0, 0.0, -3.0)
+        expected = serialize_each(Gcode_parser.iter_transform_gcode(standardGcode, transform))
+        self.assertEqual(serialize(standardGcode, transform=transform), expected)
+        self.assertEqual(standardGcode[12].X, 12.5)                             # (the moves are not changed)
+
+
+if __name__ == "__main__":
+    unittest.main()